@@ -0,0 +1,50 @@
+"""orders keyset pagination indexes
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY не работает внутри транзакции; таблица orders большая
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_orders_start_date_id",
+            "orders",
+            ["start_date", "id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_orders_transport_price_id",
+            "orders",
+            ["transport_price", "id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # Покрывается префиксом ix_orders_start_date_id
+        op.drop_index("ix_orders_start_date", table_name="orders", postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_orders_start_date",
+            "orders",
+            ["start_date"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index("ix_orders_transport_price_id", table_name="orders", postgresql_concurrently=True, if_exists=True)
+        op.drop_index("ix_orders_start_date_id", table_name="orders", postgresql_concurrently=True, if_exists=True)
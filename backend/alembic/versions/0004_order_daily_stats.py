@@ -0,0 +1,57 @@
+"""order daily stats rollups
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 16:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Тип paymentstatus уже создан вместе с таблицей orders
+    payment_status = sa.Enum("PENDING", "PAID", "MANUAL", name="paymentstatus").with_variant(
+        postgresql.ENUM("PENDING", "PAID", "MANUAL", name="paymentstatus", create_type=False), "postgresql"
+    )
+    op.create_table(
+        "order_daily_stats",
+        sa.Column("day", sa.Date(), primary_key=True),
+        sa.Column("from_city_id", sa.Integer(), primary_key=True),
+        sa.Column("to_city_id", sa.Integer(), primary_key=True),
+        sa.Column("payment_status", payment_status, primary_key=True),
+        sa.Column("orders_count", sa.Integer(), nullable=False),
+        sa.Column("transport_price_sum", sa.BigInteger(), nullable=False),
+        sa.Column("insurance_price_sum", sa.BigInteger(), nullable=False),
+        sa.Column("distance_km_sum", sa.BigInteger(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        if_not_exists=True,
+    )
+    # Агрегаты по уже существующим заказам; таблица могла быть создана create_all при старте
+    op.execute("DELETE FROM order_daily_stats")
+    op.execute(
+        """
+        INSERT INTO order_daily_stats (
+            day, from_city_id, to_city_id, payment_status, orders_count,
+            transport_price_sum, insurance_price_sum, distance_km_sum, created_at, updated_at
+        )
+        SELECT start_date, from_city_id, to_city_id, payment_status, count(*),
+               sum(transport_price), sum(insurance_price), sum(distance_km),
+               CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+        FROM orders
+        GROUP BY start_date, from_city_id, to_city_id, payment_status
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("order_daily_stats", if_exists=True)
@@ -0,0 +1,105 @@
+"""fixed routes by city id, canonical city distance pairs
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 18:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+_LOW = "CASE WHEN from_city_id <= to_city_id THEN from_city_id ELSE to_city_id END"
+_HIGH = "CASE WHEN from_city_id <= to_city_id THEN to_city_id ELSE from_city_id END"
+
+
+def upgrade() -> None:
+    # В базе, созданной стартовым bootstrap (create_all), таблицы уже в новом виде:
+    # перенос и ограничения нужны только базе в прежней схеме
+    inspector = sa.inspect(op.get_bind())
+    if "from_city_id" not in {column["name"] for column in inspector.get_columns("fixed_routes")}:
+        _keyFixedRoutesByCityId()
+    if "ux_city_distances_pair" not in {index["name"] for index in inspector.get_indexes("city_distances")}:
+        _canonicalizeCityDistances()
+
+
+def _keyFixedRoutesByCityId() -> None:
+    # fixed_routes: названия городов → id. Маршруты на несуществующие города не применялись
+    # к расчету (город не найти в справочнике); из дублей остается первый — как выбирал расчет
+    op.add_column("fixed_routes", sa.Column("from_city_id", sa.Integer(), nullable=True))
+    op.add_column("fixed_routes", sa.Column("to_city_id", sa.Integer(), nullable=True))
+    op.execute(
+        """
+        UPDATE fixed_routes SET
+            from_city_id = (SELECT id FROM cities WHERE cities.name = fixed_routes.from_city),
+            to_city_id = (SELECT id FROM cities WHERE cities.name = fixed_routes.to_city)
+        """
+    )
+    op.execute("DELETE FROM fixed_routes WHERE from_city_id IS NULL OR to_city_id IS NULL")
+    op.execute(
+        """
+        DELETE FROM fixed_routes WHERE id NOT IN (
+            SELECT min(id) FROM fixed_routes GROUP BY from_city_id, to_city_id
+        )
+        """
+    )
+    with op.batch_alter_table("fixed_routes") as batch:
+        batch.alter_column("from_city_id", existing_type=sa.Integer(), nullable=False)
+        batch.alter_column("to_city_id", existing_type=sa.Integer(), nullable=False)
+        batch.create_foreign_key("fk_fixed_routes_from_city_id", "cities", ["from_city_id"], ["id"])
+        batch.create_foreign_key("fk_fixed_routes_to_city_id", "cities", ["to_city_id"], ["id"])
+        batch.drop_column("from_city")
+        batch.drop_column("to_city")
+    op.create_index("ux_fixed_routes_from_to", "fixed_routes", ["from_city_id", "to_city_id"], unique=True)
+
+
+def _canonicalizeCityDistances() -> None:
+    # city_distances: одна строка на пару без учета направления (первая по id — ее и
+    # отдавал индекс расстояний), затем пары разворачиваются в порядок (min_id, max_id)
+    op.execute(
+        f"""
+        DELETE FROM city_distances WHERE id NOT IN (
+            SELECT min(id) FROM city_distances GROUP BY {_LOW}, {_HIGH}
+        )
+        """
+    )
+    op.execute(
+        """
+        UPDATE city_distances SET from_city_id = to_city_id, to_city_id = from_city_id
+        WHERE from_city_id > to_city_id
+        """
+    )
+    with op.batch_alter_table("city_distances") as batch:
+        batch.create_check_constraint("ck_city_distances_canonical", "from_city_id <= to_city_id")
+    op.create_index("ux_city_distances_pair", "city_distances", ["from_city_id", "to_city_id"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ux_city_distances_pair", table_name="city_distances")
+    with op.batch_alter_table("city_distances") as batch:
+        batch.drop_constraint("ck_city_distances_canonical", type_="check")
+
+    op.drop_index("ux_fixed_routes_from_to", table_name="fixed_routes")
+    op.add_column("fixed_routes", sa.Column("from_city", sa.String(length=120), nullable=True))
+    op.add_column("fixed_routes", sa.Column("to_city", sa.String(length=120), nullable=True))
+    op.execute(
+        """
+        UPDATE fixed_routes SET
+            from_city = (SELECT name FROM cities WHERE cities.id = fixed_routes.from_city_id),
+            to_city = (SELECT name FROM cities WHERE cities.id = fixed_routes.to_city_id)
+        """
+    )
+    with op.batch_alter_table("fixed_routes") as batch:
+        batch.alter_column("from_city", existing_type=sa.String(length=120), nullable=False)
+        batch.alter_column("to_city", existing_type=sa.String(length=120), nullable=False)
+        batch.drop_constraint("fk_fixed_routes_from_city_id", type_="foreignkey")
+        batch.drop_constraint("fk_fixed_routes_to_city_id", type_="foreignkey")
+        batch.drop_column("from_city_id")
+        batch.drop_column("to_city_id")
@@ -0,0 +1,60 @@
+import hashlib
+
+from fastapi import Request, Response, status
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.infra.config import getSettings
+
+
+def tableVersion(session: Session, model, *depends_on) -> tuple:
+    """
+    Версия таблицы одним агрегатом без чтения строк: число строк ловит удаления,
+    max(updated_at) — изменения, max(id) — удаление вместе со вставкой. Таблицы
+    depends_on (из которых ответ берет данные через join) входят в версию тем же
+    запросом.
+    """
+    if not depends_on:
+        return session.execute(
+            select(func.count(), func.max(model.updated_at), func.max(model.id)).select_from(model)
+        ).one()
+    columns = []
+    for table in (model, *depends_on):
+        columns += [
+            select(func.count()).select_from(table).scalar_subquery(),
+            select(func.max(table.updated_at)).scalar_subquery(),
+            select(func.max(table.id)).scalar_subquery(),
+        ]
+    return session.execute(select(*columns)).one()
+
+
+def makeEtag(name: str, version: tuple) -> str:
+    digest = hashlib.sha256(repr((name, *version)).encode()).hexdigest()[:20]
+    return f'"{name}-{digest}"'
+
+
+def _matches(if_none_match: str | None, etag: str) -> bool:
+    # If-None-Match сравнивается слабо: W/"x" совпадает с "x"
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in (tag.removeprefix("W/") for tag in candidates)
+
+
+def conditionalGet(
+    request: Request, response: Response, session: Session, model, name: str, depends_on: tuple = ()
+) -> Response | None:
+    """
+    ETag и Cache-Control для справочного списка. Если у клиента актуальная версия,
+    возвращает готовый ответ 304 — строки таблицы не читаются. depends_on — таблицы,
+    данные которых попадают в ответ через join (например, названия городов).
+    """
+    etag = makeEtag(name, tableVersion(session, model, *depends_on))
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={getSettings().catalog_cache_max_age_seconds}, must-revalidate",
+    }
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -1,26 +1,57 @@
+from typing import Callable
+
 from fastapi import Depends, HTTPException, status, Header
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from sqlalchemy.orm import Session
 
-from app.infra.db import getSession
-from app.infra.security import verifyPassword
+from app.infra.db import getSessionFactory
+from app.infra.security import AdminSession, basicCredentialCache, verifyPassword, verifySessionToken
 from app.repositories.admin_repo import AdminRepository
+from app.repositories.uow import UnitOfWork
+
+
+# Basic разбираем сами: запрос может прийти и с Bearer-токеном
+security = HTTPBasic(auto_error=False)
 
 
-security = HTTPBasic()
+def _unauthorized(message: str = "Unauthorized") -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail={"error": message})
 
-# Фиксированный токен для админа
-ADMIN_TOKEN = "simple_admin_token_cybertrax_2025"
+
+def _bearerSession(authorization: str | None) -> AdminSession | None:
+    if not authorization or not authorization.startswith("Bearer "):
+        return None
+    return verifySessionToken(authorization[len("Bearer "):])
+
+
+def authenticateAdmin(session: Session, login: str, password: str) -> int | None:
+    """Полная проверка по БД (bcrypt); id админа или None"""
+    admin = AdminRepository(session).getByLogin(login)
+    if admin is None or not verifyPassword(password, admin.password_hash):
+        return None
+    return admin.id
 
 
 def requireAdmin(
-    credentials: HTTPBasicCredentials = Depends(security),
-    session: Session = Depends(getSession),
+    authorization: str | None = Header(default=None),
+    credentials: HTTPBasicCredentials | None = Depends(security),
+    session_factory: Callable[[], Session] = Depends(getSessionFactory),
 ) -> None:
-    repo = AdminRepository(session)
-    admin = repo.getByLogin(credentials.username)
-    if admin is None or not verifyPassword(credentials.password, admin.password_hash):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail={"error": "Unauthorized"})
+    """
+    Сессионный токен (Bearer) проверяется подписью, без БД. Для HTTP Basic успешная
+    проверка кешируется, так что bcrypt выполняется один раз на пару логин/пароль.
+    """
+    if _bearerSession(authorization) is not None:
+        return None
+    if credentials is None:
+        raise _unauthorized()
+    if basicCredentialCache.get(credentials.username, credentials.password) is not None:
+        return None
+    with UnitOfWork(session_factory) as uow:
+        admin_id = authenticateAdmin(uow.session, credentials.username, credentials.password)
+    if admin_id is None:
+        raise _unauthorized()
+    basicCredentialCache.put(credentials.username, credentials.password, admin_id)
     return None
 
 
@@ -30,12 +61,9 @@ def requireAdminToken(authorization: str = Header(default=None)) -> None:
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"error": "Missing or invalid authorization header"}
         )
-    token = authorization.replace("Bearer ", "")
-    if token != ADMIN_TOKEN:
+    if _bearerSession(authorization) is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"error": "Invalid token"}
         )
     return None
-
-
@@ -0,0 +1,74 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.infra.metrics import MetricsRegistry, registry as default_registry
+
+
+REQUEST_DURATION_METRIC = "http_request_duration_seconds"
+REQUESTS_METRIC = "http_requests_total"
+
+
+def routeLabel(scope: Scope) -> str:
+    """
+    Шаблон пути обработавшего запрос маршрута с префиксами подключенных роутеров.
+
+    scope["route"] может хранить путь без префиксов роутеров, поэтому префикс берется
+    из фактического пути: это часть URL перед подставленным шаблоном маршрута.
+    """
+    route = scope.get("route")
+    path_format = getattr(route, "path_format", None)
+    if path_format is None:
+        return "unmatched"
+    path = scope["path"]
+    try:
+        rendered = path_format.format(**scope.get("path_params", {}))
+    except (KeyError, IndexError, ValueError):
+        return path_format
+    if rendered and path.endswith(rendered):
+        return path[: len(path) - len(rendered)] + path_format
+    if not rendered:
+        return path
+    return path_format
+
+
+class RequestMetricsMiddleware:
+    """
+    Длительность запросов по маршрутам и счетчики статусов.
+
+    Чистое ASGI-промежуточное ПО (без BaseHTTPMiddleware): тело ответа не буферизуется.
+    Метка route — шаблон пути маршрута (/api/v1/orders/{order_id}), а не фактический URL,
+    чтобы число серий не росло; запросы мимо маршрутов попадают в route="unmatched".
+    """
+
+    def __init__(self, app: ASGIApp, registry: MetricsRegistry | None = None) -> None:
+        self.app = app
+        self.registry = registry or default_registry
+        self.registry.describe(REQUEST_DURATION_METRIC, "histogram", "HTTP request latency by route")
+        self.registry.describe(REQUESTS_METRIC, "counter", "HTTP requests by route and status")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def sendWithStatus(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, sendWithStatus)
+        finally:
+            path = routeLabel(scope)
+            method = scope["method"]
+            self.registry.histogram(REQUEST_DURATION_METRIC, (("method", method), ("route", path))).observe(
+                time.perf_counter() - started
+            )
+            self.registry.counter(
+                REQUESTS_METRIC, (("method", method), ("route", path), ("status", str(status_code)))
+            ).inc()
@@ -1,22 +1,22 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
 
+from app.api.deps import authenticateAdmin
+from app.infra.db import getSession
+from app.infra.security import issueSessionToken
 from app.schemas.admin import AdminLoginRequest, AdminLoginResponse
 
 
 router = APIRouter()
 
-# Фиксированные креденшалы для админа
-ADMIN_LOGIN = "admin"
-ADMIN_PASSWORD = "admin123"
-ADMIN_TOKEN = "simple_admin_token_cybertrax_2025"
-
 
 @router.post("/login", response_model=AdminLoginResponse)
-def adminLogin(payload: AdminLoginRequest) -> AdminLoginResponse:
-    if payload.login != ADMIN_LOGIN or payload.password != ADMIN_PASSWORD:
+def adminLogin(payload: AdminLoginRequest, session: Session = Depends(getSession)) -> AdminLoginResponse:
+    admin_id = authenticateAdmin(session, payload.login, payload.password)
+    if admin_id is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"error": "Invalid credentials"}
         )
-    return AdminLoginResponse(token=ADMIN_TOKEN, admin_id=1)
-
+    token, admin_session = issueSessionToken(admin_id)
+    return AdminLoginResponse(token=token, admin_id=admin_id, expires_at=admin_session.expires_at)
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 
 from app.infra.db import getSession
+from app.infra.reference_cache import invalidateReferenceData
 from app.repositories.models import City
 from app.repositories.city_repo import CityRepository
-from app.schemas.city import CityCreate, CityDto, CityUpdate
+from app.schemas.city import CityCreate, CityDto, CityUpdate, DistancePrefillStatusDto
+from app.services.distance_prefill import getPrefillProgress, runDistancePrefill, startPrefill
+from app.api.caching import conditionalGet
 from app.api.deps import requireAdmin
 
 
@@ -12,14 +15,22 @@ router = APIRouter()
 
 
 @router.get("", response_model=list[CityDto])
-def listCities(session: Session = Depends(getSession)) -> list[CityDto]:
+def listCities(request: Request, response: Response, session: Session = Depends(getSession)) -> list[CityDto]:
+    not_modified = conditionalGet(request, response, session, City, "cities")
+    if not_modified is not None:
+        return not_modified
     repo = CityRepository(session)
     items = repo.listAll()
     return [CityDto.model_validate(x) for x in items]
 
 
 @router.post("", response_model=CityDto, status_code=status.HTTP_201_CREATED, dependencies=[Depends(requireAdmin)])
-def createCity(payload: CityCreate, session: Session = Depends(getSession)) -> CityDto:
+def createCity(
+    payload: CityCreate,
+    background_tasks: BackgroundTasks,
+    # scope="function": commit сессии до ответа и до фоновой задачи, которой нужен город
+    session: Session = Depends(getSession, scope="function"),
+) -> CityDto:
     obj = City(
         name=payload.name,
         is_active=payload.is_active,
@@ -28,9 +39,42 @@ def createCity(payload: CityCreate, session: Session = Depends(getSession)) -> C
     )
     session.add(obj)
     session.flush()
+    invalidateReferenceData(session)
+    if obj.is_active:
+        startPrefill(session, obj.id)
+        background_tasks.add_task(runDistancePrefill, obj.id)
     return CityDto.model_validate(obj)
 
 
+@router.post(
+    "/{city_id}/distance-prefill",
+    response_model=DistancePrefillStatusDto,
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(requireAdmin)],
+)
+def startDistancePrefill(
+    city_id: int,
+    background_tasks: BackgroundTasks,
+    # scope="function": запись запуска закоммичена до старта фоновой задачи
+    session: Session = Depends(getSession, scope="function"),
+) -> DistancePrefillStatusDto:
+    if session.get(City, city_id) is None:
+        raise HTTPException(status_code=404, detail={"error": "City not found"})
+    # Идущий запуск не дублируется: возвращается его текущее состояние
+    run, started = startPrefill(session, city_id)
+    if started:
+        background_tasks.add_task(runDistancePrefill, city_id)
+    return DistancePrefillStatusDto.model_validate(run)
+
+
+@router.get("/{city_id}/distance-prefill", response_model=DistancePrefillStatusDto, dependencies=[Depends(requireAdmin)])
+def getDistancePrefillStatus(city_id: int, session: Session = Depends(getSession)) -> DistancePrefillStatusDto:
+    run = getPrefillProgress(session, city_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail={"error": "Distance prefill has not been run for this city"})
+    return DistancePrefillStatusDto.model_validate(run)
+
+
 @router.put("/{city_id}", response_model=CityDto, dependencies=[Depends(requireAdmin)])
 def updateCity(city_id: int, payload: CityUpdate, session: Session = Depends(getSession)) -> CityDto:
     obj = session.get(City, city_id)
@@ -46,6 +90,7 @@ def updateCity(city_id: int, payload: CityUpdate, session: Session = Depends(get
         obj.longitude = payload.longitude
     session.add(obj)
     session.flush()
+    invalidateReferenceData(session)
     return CityDto.model_validate(obj)
 
 
@@ -55,5 +100,6 @@ def deleteCity(city_id: int, session: Session = Depends(getSession)) -> None:
     if obj is None:
         raise HTTPException(status_code=404, detail={"error": "City not found"})
     session.delete(obj)
+    invalidateReferenceData(session)
 
 
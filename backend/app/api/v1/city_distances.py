@@ -1,16 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 
 from app.infra.db import getSession
+from app.infra.distance.distance_index import forgetDistance, recordDistance
 from app.repositories.city_distance_repo import CityDistanceRepository
+from app.repositories.models import CityDistance
 from app.schemas.city_distance import CityDistanceDto, CityDistanceCreate, CityDistanceUpdate
+from app.api.caching import conditionalGet
 from app.api.deps import requireAdmin
 
 router = APIRouter()
 
 
 @router.get("", response_model=list[CityDistanceDto])
-def listDistances(session: Session = Depends(getSession)) -> list[CityDistanceDto]:
+def listDistances(request: Request, response: Response, session: Session = Depends(getSession)) -> list[CityDistanceDto]:
+    not_modified = conditionalGet(request, response, session, CityDistance, "city-distances")
+    if not_modified is not None:
+        return not_modified
     repo = CityDistanceRepository(session)
     items = repo.listAll()
     return [CityDistanceDto.model_validate(x) for x in items]
@@ -31,13 +37,12 @@ def createDistance(payload: CityDistanceCreate, session: Session = Depends(getSe
         distance_km=payload.distance_km,
         is_manual=payload.is_manual
     )
+    recordDistance(session, obj.from_city_id, obj.to_city_id, obj.distance_km)
     return CityDistanceDto.model_validate(obj)
 
 
 @router.put("/{distance_id}", response_model=CityDistanceDto, dependencies=[Depends(requireAdmin)])
 def updateDistance(distance_id: int, payload: CityDistanceUpdate, session: Session = Depends(getSession)) -> CityDistanceDto:
-    from app.repositories.models import CityDistance
-    
     obj = session.get(CityDistance, distance_id)
     if obj is None:
         raise HTTPException(status_code=404, detail={"error": "Distance not found"})
@@ -49,11 +54,14 @@ def updateDistance(distance_id: int, payload: CityDistanceUpdate, session: Sessi
     
     session.add(obj)
     session.flush()
+    recordDistance(session, obj.from_city_id, obj.to_city_id, obj.distance_km)
     return CityDistanceDto.model_validate(obj)
 
 
 @router.delete("/{distance_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(requireAdmin)])
 def deleteDistance(distance_id: int, session: Session = Depends(getSession)) -> None:
     repo = CityDistanceRepository(session)
-    repo.delete(distance_id)
+    obj = repo.delete(distance_id)
+    if obj is not None:
+        forgetDistance(session, obj.from_city_id, obj.to_city_id)
 
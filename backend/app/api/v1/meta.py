@@ -1,18 +1,51 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 from sqlalchemy.orm import Session
 
+from app.api.caching import conditionalGet
+from app.api.deps import requireAdmin
 from app.infra.db import getSession
+from app.infra.metrics import Histogram
+from app.infra.pool_metrics import listPoolMetrics
 from app.repositories.fixed_route_repo import FixedRouteRepository
-from app.schemas.meta import FixedRouteDto
+from app.repositories.models import City, FixedRoute
+from app.schemas.meta import FixedRouteDto, HistogramBucketDto, HistogramDto, PoolMetricsDto
 
 
 router = APIRouter()
 
 
 @router.get("/fixed-routes", response_model=list[FixedRouteDto])
-def listFixedRoutes(session: Session = Depends(getSession)) -> list[FixedRouteDto]:
+def listFixedRoutes(request: Request, response: Response, session: Session = Depends(getSession)) -> list[FixedRouteDto]:
+    # Названия городов берутся из cities: их переименование тоже меняет ETag
+    not_modified = conditionalGet(request, response, session, FixedRoute, "fixed-routes", depends_on=(City,))
+    if not_modified is not None:
+        return not_modified
     repo = FixedRouteRepository(session)
-    items = repo.listAll()
-    return [FixedRouteDto(from_city=x.from_city, to_city=x.to_city, fixed_price=x.fixed_price) for x in items]
+    return [FixedRouteDto.model_validate(row) for row in repo.listDtoRows()]
 
 
+@router.get("/db-pool", response_model=list[PoolMetricsDto], dependencies=[Depends(requireAdmin)])
+def getDbPoolMetrics() -> list[PoolMetricsDto]:
+    return [
+        PoolMetricsDto(
+            name=m.name,
+            **m.state(),
+            connects=m.connects,
+            checkouts=m.checkouts,
+            checkins=m.checkins,
+            checkout_timeouts=m.checkout_timeouts,
+            invalidations=m.invalidations,
+            pre_ping_failures=m.pre_ping_failures,
+            checkout_wait_ms=_histogramDto(m.checkout_wait_ms),
+        )
+        for m in listPoolMetrics()
+    ]
+
+
+def _histogramDto(histogram: Histogram) -> HistogramDto:
+    buckets, count, total = histogram.snapshot()
+    return HistogramDto(
+        buckets=[HistogramBucketDto(le=None if le == float("inf") else le, count=n) for le, n in buckets],
+        count=count,
+        sum=total,
+    )
@@ -1,42 +1,113 @@
 from datetime import date
-from typing import Iterable
+from typing import Iterable, Literal
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
 
-from app.infra.db import getSession
+from app.infra.config import getSettings
+from app.infra.db import getAsyncSession, getSessionFactory
 from app.infra.distance.provider import HybridDistanceProvider
-from app.repositories.models import Order, PaymentStatus
+from app.repositories.models import PaymentStatus
 from app.repositories.order_repo import OrderRepository
+from app.repositories.order_stats_repo import GROUP_BY_FIELDS, OrderStatsRepository
 from app.schemas.order import (
+    OrderBulkCreateRequest,
+    OrderBulkCreateResponse,
+    OrderBulkCreateResult,
     OrderCreate,
     OrderDto,
+    OrderPreviewBatchRequest,
+    OrderPreviewBatchResponse,
+    OrderPreviewBatchResult,
     OrderPreviewRequest,
     OrderPreviewResponse,
+    OrderStatsItem,
+    OrderStatsResponse,
     PaginatedOrdersResponse,
 )
-from app.services.pricing_service import PricingService
+from app.services.distance_refine import refineDistancesAsync
+from app.services.idempotency import IdempotencyConflict, runIdempotent
+from app.services.order_export import MEDIA_TYPES, iterOrderExport
+from app.services.pricing_service import OrderDraft, PricingService
+from app.services.quote_matrix import getQuoteMatrixAsync
 from app.api.deps import requireAdmin, requireAdminToken
 
 
 router = APIRouter()
 
 
+def _previewProvider(session: AsyncSession) -> HybridDistanceProvider:
+    # Расчет не ждет OSRM: неизвестное расстояние оценивается по координатам
+    return HybridDistanceProvider(session, estimate_missing=getSettings().distance_estimate_on_miss)
+
+
+def _refineEstimates(provider: HybridDistanceProvider, session: AsyncSession, background_tasks: BackgroundTasks) -> None:
+    if provider.estimated:
+        background_tasks.add_task(refineDistancesAsync, session.bind, sorted(provider.estimated))
+
+
 @router.post("/preview", response_model=OrderPreviewResponse)
-def previewOrder(payload: OrderPreviewRequest, session: Session = Depends(getSession)) -> OrderPreviewResponse:
-    provider = HybridDistanceProvider(session)
-    service = PricingService(session, provider)
-    res = service.preview(payload.start_date, payload.from_city, payload.to_city)
+async def previewOrder(
+    payload: OrderPreviewRequest,
+    background_tasks: BackgroundTasks,
+    session: AsyncSession = Depends(getAsyncSession),
+) -> OrderPreviewResponse:
+    provider = _previewProvider(session)
+    service = PricingService(session, provider, await getQuoteMatrixAsync(session))
+    res = await service.previewAsync(payload.start_date, payload.from_city, payload.to_city)
+    _refineEstimates(provider, session, background_tasks)
     return OrderPreviewResponse(**res.__dict__)
 
 
+@router.post("/preview/batch", response_model=OrderPreviewBatchResponse)
+async def previewOrdersBatch(
+    payload: OrderPreviewBatchRequest,
+    background_tasks: BackgroundTasks,
+    session: AsyncSession = Depends(getAsyncSession),
+) -> OrderPreviewBatchResponse:
+    provider = _previewProvider(session)
+    service = PricingService(session, provider, await getQuoteMatrixAsync(session))
+    results = await service.previewBatchAsync([(x.start_date, x.from_city, x.to_city) for x in payload.items])
+    _refineEstimates(provider, session, background_tasks)
+
+    items = []
+    for index, res in enumerate(results):
+        if isinstance(res, ValueError):
+            items.append(OrderPreviewBatchResult(index=index, error=str(res)))
+        else:
+            items.append(OrderPreviewBatchResult(index=index, result=OrderPreviewResponse(**res.__dict__)))
+    return OrderPreviewBatchResponse(items=items)
+
+
 @router.post("", response_model=OrderDto, status_code=status.HTTP_201_CREATED)
-def createOrder(payload: OrderCreate, session: Session = Depends(getSession)) -> OrderDto:
-    from app.repositories.models import User
-    
+async def createOrder(
+    payload: OrderCreate,
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+    session: AsyncSession = Depends(getAsyncSession),
+) -> OrderDto | JSONResponse:
+    if idempotency_key is None:
+        return await _createOrder(payload, session)
+
+    # Повтор с тем же ключом получает сохраненный ответ без повторного расчета и вставки
+    async def handler() -> tuple[int, dict]:
+        order = await _createOrder(payload, session)
+        return status.HTTP_201_CREATED, order.model_dump(mode="json")
+
+    try:
+        stored = await runIdempotent(session, idempotency_key, payload.model_dump(mode="json"), handler)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=e.status_code, detail={"error": str(e)})
+    headers = {"Idempotent-Replayed": "true"} if stored.replayed else None
+    return JSONResponse(stored.body, status_code=stored.status_code, headers=headers)
+
+
+async def _createOrder(payload: OrderCreate, session: AsyncSession) -> OrderDto:
+    # Заказ фиксирует цену, поэтому считается только по точному расстоянию
     provider = HybridDistanceProvider(session)
-    service = PricingService(session, provider)
-    order = service.createOrder(
+    service = PricingService(session, provider, await getQuoteMatrixAsync(session))
+    order = await service.createOrderAsync(
         user_id=payload.user_id,
         car_brand_model=payload.car_brand_model,
         start_date=payload.start_date,
@@ -45,39 +116,46 @@ def createOrder(payload: OrderCreate, session: Session = Depends(getSession)) ->
         from_city_name=payload.from_city,
         to_city_name=payload.to_city,
     )
-    session.flush()
-    
-    # Загружаем данные пользователя
-    user = session.get(User, payload.user_id)
-    if not user:
+
+    # Заказ вместе с данными пользователя одним запросом
+    row = await OrderRepository(session).getDtoRowAsync(order.id)
+    if row is None:
         raise HTTPException(status_code=404, detail={"error": "User not found"})
-    
-    return OrderDto(
-        id=order.id,
-        created_at=order.created_at,
-        updated_at=order.updated_at,
-        user_id=order.user_id,
-        user_full_name=user.full_name,
-        user_phone=user.phone,
-        car_brand_model=order.car_brand_model,
-        from_city_id=order.from_city_id,
-        to_city_id=order.to_city_id,
-        start_date=order.start_date,
-        distance_km=order.distance_km,
-        applied_price_per_km=order.applied_price_per_km,
-        is_fixed_route=order.is_fixed_route,
-        transport_price=order.transport_price,
-        insurance_price=order.insurance_price,
-        duration_hours=order.duration_hours,
-        duration_days=order.duration_days,
-        duration_hours_remainder=order.duration_hours_remainder,
-        eta_date=order.eta_date,
-        payment_status=order.payment_status,
-    )
+    return OrderDto.model_validate(row)
+
+
+@router.post("/bulk", response_model=OrderBulkCreateResponse)
+async def createOrdersBulk(
+    payload: OrderBulkCreateRequest, session: AsyncSession = Depends(getAsyncSession)
+) -> OrderBulkCreateResponse:
+    """Пакет заказов одной транзакцией; ошибка строки не мешает остальным"""
+    service = PricingService(session, HybridDistanceProvider(session), await getQuoteMatrixAsync(session))
+    results = await service.createOrdersAsync([
+        OrderDraft(
+            user_id=x.user_id,
+            car_brand_model=x.car_brand_model,
+            start_date=x.start_date,
+            from_city_id=x.from_city_id,
+            to_city_id=x.to_city_id,
+            from_city_name=x.from_city,
+            to_city_name=x.to_city,
+        )
+        for x in payload.items
+    ])
+
+    rows = await OrderRepository(session).getDtoRowsAsync([r for r in results if isinstance(r, int)])
+    items = []
+    for index, res in enumerate(results):
+        if isinstance(res, ValueError):
+            items.append(OrderBulkCreateResult(index=index, error=str(res)))
+        else:
+            items.append(OrderBulkCreateResult(index=index, order=OrderDto.model_validate(rows[res])))
+    created = len(rows)
+    return OrderBulkCreateResponse(created=created, failed=len(items) - created, items=items)
 
 
 @router.get("", response_model=PaginatedOrdersResponse)
-def listOrders(
+async def listOrders(
     user_id: int | None = Query(default=None),
     start_from: date | None = Query(default=None),
     start_to: date | None = Query(default=None),
@@ -87,10 +165,17 @@ def listOrders(
     order_by_cost: bool = Query(default=False),
     page: int = Query(default=1, ge=1),
     limit: int = Query(default=20, ge=1, le=100),
-    session: Session = Depends(getSession),
+    pagination: Literal["offset", "cursor"] = Query(default="offset"),
+    cursor: str | None = Query(default=None),
+    # По умолчанию exact для страниц и none для курсора: страница по курсору без COUNT(*)
+    totals: Literal["exact", "estimated", "none"] | None = Query(default=None),
+    session: AsyncSession = Depends(getAsyncSession),
 ) -> PaginatedOrdersResponse:
     repo = OrderRepository(session)
-    result = repo.query(
+    keyset = pagination == "cursor" or cursor is not None
+    if totals is None:
+        totals = "none" if keyset else "exact"
+    filters = dict(
         user_id=user_id,
         start_from=start_from,
         start_to=start_to,
@@ -98,156 +183,141 @@ def listOrders(
         to_city_id=to_city_id,
         payment_status=payment_status,
         order_by_cost=order_by_cost,
-        page=page,
         limit=limit,
+        totals=totals,
     )
-    
-    items_dto = []
-    for order in result.items:
-        dto_dict = {
-            "id": order.id,
-            "created_at": order.created_at,
-            "updated_at": order.updated_at,
-            "user_id": order.user_id,
-            "user_full_name": order.user.full_name,
-            "user_phone": order.user.phone,
-            "car_brand_model": order.car_brand_model,
-            "from_city_id": order.from_city_id,
-            "to_city_id": order.to_city_id,
-            "start_date": order.start_date,
-            "distance_km": order.distance_km,
-            "applied_price_per_km": order.applied_price_per_km,
-            "is_fixed_route": order.is_fixed_route,
-            "transport_price": order.transport_price,
-            "insurance_price": order.insurance_price,
-            "duration_hours": order.duration_hours,
-            "duration_days": order.duration_days,
-            "duration_hours_remainder": order.duration_hours_remainder,
-            "eta_date": order.eta_date,
-            "payment_status": order.payment_status,
-        }
-        items_dto.append(OrderDto(**dto_dict))
-    
-    total_pages = (result.total + limit - 1) // limit
-    
+    if keyset:
+        result = await repo.queryKeysetAsync(cursor=cursor, **filters)
+    else:
+        result = await repo.queryAsync(page=page, **filters)
+
+    items_dto = [OrderDto.model_validate(row) for row in result.items]
+
+    total_pages = None if result.total is None else (result.total + limit - 1) // limit
+
     return PaginatedOrdersResponse(
         items=items_dto,
         total=result.total,
         page=page,
         limit=limit,
         pages=total_pages,
+        next_cursor=result.next_cursor,
+        prev_cursor=result.prev_cursor,
+        has_more=result.has_more,
+        total_estimated=result.total_estimated,
     )
 
 
+@router.get("/export", dependencies=[Depends(requireAdmin)])
+def exportOrders(
+    format: Literal["csv", "ndjson"] = Query(default="csv"),
+    user_id: int | None = Query(default=None),
+    start_from: date | None = Query(default=None),
+    start_to: date | None = Query(default=None),
+    from_city_id: int | None = Query(default=None),
+    to_city_id: int | None = Query(default=None),
+    payment_status: PaymentStatus | None = Query(default=None),
+    order_by_cost: bool = Query(default=False),
+    session_factory: sessionmaker = Depends(getSessionFactory),
+) -> StreamingResponse:
+    # Генератор открывает свою сессию: сессия запроса закрывается раньше, чем закончится поток
+    content = iterOrderExport(
+        session_factory,
+        format,
+        user_id=user_id,
+        start_from=start_from,
+        start_to=start_to,
+        from_city_id=from_city_id,
+        to_city_id=to_city_id,
+        payment_status=payment_status,
+        order_by_cost=order_by_cost,
+    )
+    return StreamingResponse(
+        content,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="orders.{format}"'},
+    )
+
+
+@router.get("/stats", response_model=OrderStatsResponse, dependencies=[Depends(requireAdmin)])
+async def orderStats(
+    start_from: date | None = Query(default=None),
+    start_to: date | None = Query(default=None),
+    from_city_id: int | None = Query(default=None),
+    to_city_id: int | None = Query(default=None),
+    payment_status: PaymentStatus | None = Query(default=None),
+    group_by: list[str] = Query(default=[]),
+    session: AsyncSession = Depends(getAsyncSession),
+) -> OrderStatsResponse:
+    """
+    Выручка и число заказов по дате начала перевозки (start_date, как фильтр start_from/start_to
+    в GET /orders), а не по дате создания заказа. Читает только агрегаты order_daily_stats,
+    сколько бы заказов ни было.
+    """
+    unknown = [name for name in group_by if name not in GROUP_BY_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail={"error": f"Unknown group_by: {', '.join(unknown)}"})
+    if "start_day" in group_by and "start_month" in group_by:
+        raise HTTPException(status_code=400, detail={"error": "group_by start_day and start_month are exclusive"})
+    group_by = list(dict.fromkeys(group_by))
+
+    repo = OrderStatsRepository(session)
+    filters = dict(
+        start_from=start_from,
+        start_to=start_to,
+        from_city_id=from_city_id,
+        to_city_id=to_city_id,
+        payment_status=payment_status,
+    )
+    rows = await repo.queryAsync(group_by, **filters)
+    items = [OrderStatsItem(**_statsFields(row._mapping)) for row in rows]
+    total = OrderStatsItem(
+        orders_count=sum(x.orders_count for x in items),
+        transport_price_sum=sum(x.transport_price_sum for x in items),
+        insurance_price_sum=sum(x.insurance_price_sum for x in items),
+        distance_km_sum=sum(x.distance_km_sum for x in items),
+    )
+    return OrderStatsResponse(group_by=group_by, items=items, total=total)
+
+
+def _statsFields(row: dict) -> dict:
+    fields = dict(row)
+    if "start_year" in fields:
+        fields["start_month"] = f"{int(fields.pop('start_year')):04d}-{int(fields['start_month']):02d}"
+    return fields
+
+
 @router.get("/{order_id}", response_model=OrderDto)
-def getOrder(order_id: int, session: Session = Depends(getSession)) -> OrderDto:
-    repo = OrderRepository(session)
-    obj = session.query(Order).filter(Order.id == order_id).first()
-    if obj is None:
+async def getOrder(order_id: int, session: AsyncSession = Depends(getAsyncSession)) -> OrderDto:
+    row = await OrderRepository(session).getDtoRowAsync(order_id)
+    if row is None:
         raise HTTPException(status_code=404, detail={"error": "Order not found"})
-    
-    dto_dict = {
-        "id": obj.id,
-        "created_at": obj.created_at,
-        "updated_at": obj.updated_at,
-        "user_id": obj.user_id,
-        "user_full_name": obj.user.full_name,
-        "user_phone": obj.user.phone,
-        "car_brand_model": obj.car_brand_model,
-        "from_city_id": obj.from_city_id,
-        "to_city_id": obj.to_city_id,
-        "start_date": obj.start_date,
-        "distance_km": obj.distance_km,
-        "applied_price_per_km": obj.applied_price_per_km,
-        "is_fixed_route": obj.is_fixed_route,
-        "transport_price": obj.transport_price,
-        "insurance_price": obj.insurance_price,
-        "duration_hours": obj.duration_hours,
-        "duration_days": obj.duration_days,
-        "duration_hours_remainder": obj.duration_hours_remainder,
-        "eta_date": obj.eta_date,
-        "payment_status": obj.payment_status,
-    }
-    return OrderDto(**dto_dict)
+    return OrderDto.model_validate(row)
 
 
 @router.post("/{order_id}/pay", response_model=OrderDto)
-def payOrder(order_id: int, session: Session = Depends(getSession)) -> OrderDto:
-    obj = session.query(Order).filter(Order.id == order_id).first()
-    if obj is None:
-        raise HTTPException(status_code=404, detail={"error": "Order not found"})
-    obj.payment_status = PaymentStatus.PAID
-    session.add(obj)
-    session.flush()
-    
-    dto_dict = {
-        "id": obj.id,
-        "created_at": obj.created_at,
-        "updated_at": obj.updated_at,
-        "user_id": obj.user_id,
-        "user_full_name": obj.user.full_name,
-        "user_phone": obj.user.phone,
-        "car_brand_model": obj.car_brand_model,
-        "from_city_id": obj.from_city_id,
-        "to_city_id": obj.to_city_id,
-        "start_date": obj.start_date,
-        "distance_km": obj.distance_km,
-        "applied_price_per_km": obj.applied_price_per_km,
-        "is_fixed_route": obj.is_fixed_route,
-        "transport_price": obj.transport_price,
-        "insurance_price": obj.insurance_price,
-        "duration_hours": obj.duration_hours,
-        "duration_days": obj.duration_days,
-        "duration_hours_remainder": obj.duration_hours_remainder,
-        "eta_date": obj.eta_date,
-        "payment_status": obj.payment_status,
-    }
-    return OrderDto(**dto_dict)
+async def payOrder(order_id: int, session: AsyncSession = Depends(getAsyncSession)) -> OrderDto:
+    return await _updatePaymentStatus(session, order_id, PaymentStatus.PAID)
 
 
 @router.patch("/{order_id}/payment-status", response_model=OrderDto, dependencies=[Depends(requireAdminToken)])
-def setPaymentStatus(
+async def setPaymentStatus(
     order_id: int,
     new_status: PaymentStatus,
-    session: Session = Depends(getSession),
+    session: AsyncSession = Depends(getAsyncSession),
 ) -> OrderDto:
-    obj = session.query(Order).filter(Order.id == order_id).first()
-    if obj is None:
-        raise HTTPException(status_code=404, detail={"error": "Order not found"})
-    obj.payment_status = new_status
-    session.add(obj)
-    session.flush()
-    
-    dto_dict = {
-        "id": obj.id,
-        "created_at": obj.created_at,
-        "updated_at": obj.updated_at,
-        "user_id": obj.user_id,
-        "user_full_name": obj.user.full_name,
-        "user_phone": obj.user.phone,
-        "car_brand_model": obj.car_brand_model,
-        "from_city_id": obj.from_city_id,
-        "to_city_id": obj.to_city_id,
-        "start_date": obj.start_date,
-        "distance_km": obj.distance_km,
-        "applied_price_per_km": obj.applied_price_per_km,
-        "is_fixed_route": obj.is_fixed_route,
-        "transport_price": obj.transport_price,
-        "insurance_price": obj.insurance_price,
-        "duration_hours": obj.duration_hours,
-        "duration_days": obj.duration_days,
-        "duration_hours_remainder": obj.duration_hours_remainder,
-        "eta_date": obj.eta_date,
-        "payment_status": obj.payment_status,
-    }
-    return OrderDto(**dto_dict)
+    return await _updatePaymentStatus(session, order_id, new_status)
 
 
-@router.delete("/{order_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(requireAdmin)])
-def deleteOrder(order_id: int, session: Session = Depends(getSession)) -> None:
-    obj = session.query(Order).filter(Order.id == order_id).first()
-    if obj is None:
+async def _updatePaymentStatus(session: AsyncSession, order_id: int, new_status: PaymentStatus) -> OrderDto:
+    repo = OrderRepository(session)
+    if not await repo.setPaymentStatusAsync(order_id, new_status):
         raise HTTPException(status_code=404, detail={"error": "Order not found"})
-    session.delete(obj)
+    return OrderDto.model_validate(await repo.getDtoRowAsync(order_id))
 
 
+@router.delete("/{order_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(requireAdmin)])
+async def deleteOrder(order_id: int, session: AsyncSession = Depends(getAsyncSession)) -> None:
+    # Удаление вычитает заказ из агрегатов order_daily_stats в той же транзакции
+    if not await OrderRepository(session).deleteAsync(order_id):
+        raise HTTPException(status_code=404, detail={"error": "Order not found"})
@@ -1,9 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
 
 from app.infra.db import getSession
+from app.infra.reference_cache import TariffRates, invalidateReferenceData
 from app.repositories.models import Tariff
-from app.schemas.tariff import TariffCreate, TariffDto, TariffUpdate
+from app.schemas.tariff import (
+    TariffCreate,
+    TariffDto,
+    TariffSimulationItem,
+    TariffSimulationRequest,
+    TariffSimulationResponse,
+    TariffUpdate,
+)
+from app.services.tariff_simulation import TariffProposal, simulateTariffs
+from app.api.caching import conditionalGet
 from app.api.deps import requireAdmin
 
 
@@ -11,7 +21,10 @@ router = APIRouter()
 
 
 @router.get("", response_model=list[TariffDto])
-def listTariffs(session: Session = Depends(getSession)) -> list[TariffDto]:
+def listTariffs(request: Request, response: Response, session: Session = Depends(getSession)) -> list[TariffDto]:
+    not_modified = conditionalGet(request, response, session, Tariff, "tariffs")
+    if not_modified is not None:
+        return not_modified
     items = session.query(Tariff).order_by(Tariff.month.asc()).all()
     return [TariffDto.model_validate(x) for x in items]
 
@@ -25,9 +38,72 @@ def createTariff(payload: TariffCreate, session: Session = Depends(getSession))
     )
     session.add(obj)
     session.flush()
+    invalidateReferenceData(session)
     return TariffDto.model_validate(obj)
 
 
+@router.post("/simulate", response_model=TariffSimulationResponse, dependencies=[Depends(requireAdmin)])
+def simulateTariffChange(
+    payload: TariffSimulationRequest, session: Session = Depends(getSession)
+) -> TariffSimulationResponse:
+    """
+    What-if: выручка по историческим заказам при предлагаемых ставках и фиксированных
+    ценах против текущих. Только чтение — справочники и заказы не меняются.
+    """
+    months = [t.month for t in payload.tariffs]
+    if len(months) != len(set(months)):
+        raise HTTPException(status_code=400, detail={"error": "Duplicate month in tariffs"})
+    proposal = TariffProposal(
+        tariffs={t.month: TariffRates(t.price_per_km_le_1000, t.price_per_km_gt_1000) for t in payload.tariffs},
+        fixed_routes={(r.from_city_id, r.to_city_id): r.fixed_price for r in payload.fixed_routes},
+    )
+    try:
+        result = simulateTariffs(
+            session,
+            proposal,
+            distance_bands=payload.distance_bands,
+            start_from=payload.date_from,
+            start_to=payload.date_to,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={"error": str(e)})
+
+    bands = result.distance_bands
+    routes = sorted(result.by_route.items(), key=lambda kv: (-abs(kv[1][2] - kv[1][1]), kv[0]))
+    return TariffSimulationResponse(
+        total=_simulationItem(result.total),
+        by_month=[_simulationItem(sums, month=month) for month, sums in sorted(result.by_month.items())],
+        by_route=[
+            _simulationItem(sums, from_city_id=route[0], to_city_id=route[1])
+            for route, sums in routes[: payload.route_limit]
+        ],
+        by_distance_band=[
+            _simulationItem(
+                sums,
+                distance_from_km=bands[band - 1] + 1 if band else 0,
+                distance_to_km=bands[band] if band < len(bands) else None,
+            )
+            for band, sums in sorted(result.by_band.items())
+        ],
+        routes_count=len(result.by_route),
+        unpriced_orders=result.unpriced_orders,
+    )
+
+
+def _simulationItem(sums: list[int], **group) -> TariffSimulationItem:
+    orders, cur_transport, new_transport, cur_insurance, new_insurance = sums
+    return TariffSimulationItem(
+        **group,
+        orders_count=orders,
+        current_transport_sum=cur_transport,
+        proposed_transport_sum=new_transport,
+        transport_delta=new_transport - cur_transport,
+        current_insurance_sum=cur_insurance,
+        proposed_insurance_sum=new_insurance,
+        insurance_delta=new_insurance - cur_insurance,
+    )
+
+
 @router.put("/{tariff_id}", response_model=TariffDto, dependencies=[Depends(requireAdmin)])
 def updateTariff(tariff_id: int, payload: TariffUpdate, session: Session = Depends(getSession)) -> TariffDto:
     obj = session.get(Tariff, tariff_id)
@@ -41,6 +117,7 @@ def updateTariff(tariff_id: int, payload: TariffUpdate, session: Session = Depen
         obj.price_per_km_gt_1000 = payload.price_per_km_gt_1000
     session.add(obj)
     session.flush()
+    invalidateReferenceData(session)
     return TariffDto.model_validate(obj)
 
 
@@ -50,5 +127,6 @@ def deleteTariff(tariff_id: int, session: Session = Depends(getSession)) -> None
     if obj is None:
         raise HTTPException(status_code=404, detail={"error": "Tariff not found"})
     session.delete(obj)
+    invalidateReferenceData(session)
 
 
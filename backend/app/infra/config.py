@@ -7,7 +7,43 @@ class Settings(BaseModel):
         "DATABASE_URL",
         "postgresql+psycopg://postgres:postgres@db:5432/shipment",
     )
+    # URL для async-эндпоинтов; пустой — DATABASE_URL с асинхронным драйвером
+    # (postgresql → postgresql+psycopg, sqlite → sqlite+aiosqlite)
+    async_database_url: str = os.getenv("ASYNC_DATABASE_URL", "")
+    # Пул соединений к БД (QueuePool; для SQLite не применяется)
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    db_max_overflow: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    db_pool_recycle_seconds: int = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+    db_pool_timeout_seconds: float = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+    # statement_timeout PostgreSQL для каждого соединения; 0 — без ограничения
+    db_statement_timeout_ms: int = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+    # Ключ подписи сессионных токенов админа, общий для всех воркеров. Пустой допустим только
+    # при API_DEBUG (случайный ключ на процесс); иначе приложение не стартует
+    admin_session_secret: str = os.getenv("ADMIN_SESSION_SECRET", "")
+    admin_session_ttl_seconds: int = int(os.getenv("ADMIN_SESSION_TTL_SECONDS", "1800"))
+    # Кеш проверенных Basic-креденшалов: сколько пар хранить и сколько секунд
+    admin_basic_cache_size: int = int(os.getenv("ADMIN_BASIC_CACHE_SIZE", "256"))
+    admin_basic_cache_ttl_seconds: float = float(os.getenv("ADMIN_BASIC_CACHE_TTL_SECONDS", "300"))
+    # Заполнение начальных данных при старте воркера; в продакшне можно отключить
+    bootstrap_on_startup: bool = os.getenv("BOOTSTRAP_ON_STARTUP", "true").lower() == "true"
     api_debug: bool = os.getenv("API_DEBUG", "false").lower() == "true"
+    # Сколько секунд снимок справочников считается актуальным без явного сброса
+    reference_cache_ttl_seconds: float = float(os.getenv("REFERENCE_CACHE_TTL_SECONDS", "60"))
+    # Матрица цен город × город × месяц строится, только если активных городов не больше
+    # (память ~256 байт на пару городов: 500 городов — около 64 МБ на воркер)
+    quote_matrix_max_cities: int = int(os.getenv("QUOTE_MATRIX_MAX_CITIES", "500"))
+    osrm_base_url: str = os.getenv("OSRM_BASE_URL", "http://router.project-osrm.org")
+    osrm_timeout_seconds: float = float(os.getenv("OSRM_TIMEOUT_SECONDS", "10"))
+    osrm_max_connections: int = int(os.getenv("OSRM_MAX_CONNECTIONS", "100"))
+    osrm_max_keepalive_connections: int = int(os.getenv("OSRM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    # Сколько городов-назначений отправлять в один запрос table при предзаполнении
+    osrm_table_chunk_size: int = int(os.getenv("OSRM_TABLE_CHUNK_SIZE", "100"))
+    # Расчет без расстояния в БД: сразу оценка по координатам, точное значение из OSRM — в фоне
+    distance_estimate_on_miss: bool = os.getenv("DISTANCE_ESTIMATE_ON_MISS", "true").lower() == "true"
+    # Сколько секунд хранится ответ на запрос с Idempotency-Key
+    idempotency_ttl_seconds: int = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+    # max-age для справочников (города, тарифы, фикс. маршруты, расстояния); дальше — ревалидация по ETag
+    catalog_cache_max_age_seconds: int = int(os.getenv("CATALOG_CACHE_MAX_AGE_SECONDS", "60"))
 
 
 def getSettings() -> Settings:
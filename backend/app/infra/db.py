@@ -1,10 +1,13 @@
+import threading
 from datetime import datetime
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase, Mapped, mapped_column
 
-from app.infra.config import getSettings
+from app.infra.config import Settings, getSettings
+from app.infra.pool_metrics import TimedAsyncAdaptedQueuePool, TimedQueuePool, instrumentEngine
 
 
 class Base(DeclarativeBase):
@@ -12,15 +15,82 @@ class Base(DeclarativeBase):
     updated_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+def _engineOptions(settings: Settings, is_async: bool) -> dict:
+    """Параметры пула и таймаутов из Settings; для SQLite остаются значения по умолчанию"""
+    options: dict = {"pool_pre_ping": True}
+    if make_url(settings.database_url).get_backend_name() != "postgresql":
+        return options
+    options.update(
+        poolclass=TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_recycle=settings.db_pool_recycle_seconds,
+        pool_timeout=settings.db_pool_timeout_seconds,
+    )
+    if settings.db_statement_timeout_ms > 0:
+        options["connect_args"] = {"options": f"-c statement_timeout={settings.db_statement_timeout_ms}"}
+    return options
+
+
 def getEngine():
     settings = getSettings()
-    return create_engine(settings.database_url, pool_pre_ping=True, future=True)
+    return create_engine(settings.database_url, future=True, **_engineOptions(settings, is_async=False))
 
 
 engine = getEngine()
+instrumentEngine(engine, "sync")
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 
 
+def getSessionFactory() -> sessionmaker:
+    """Для обработчиков, которым нужна сессия дольше запроса (потоковые ответы)"""
+    return SessionLocal
+
+
+# Асинхронный вариант синхронных драйверов; psycopg 3 поддерживает asyncio сам
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+psycopg",
+    "postgresql+psycopg2": "postgresql+psycopg",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def asyncDatabaseUrl(database_url: str) -> str:
+    """URL с асинхронным драйвером; асинхронные и неизвестные драйверы не меняются"""
+    url = make_url(database_url)
+    driver = _ASYNC_DRIVERS.get(url.drivername)
+    if driver is not None:
+        url = url.set(drivername=driver)
+    return url.render_as_string(hide_password=False)
+
+
+def getAsyncEngine() -> AsyncEngine:
+    settings = getSettings()
+    url = settings.async_database_url or asyncDatabaseUrl(settings.database_url)
+    return create_async_engine(url, **_engineOptions(settings, is_async=True))
+
+
+# Асинхронный engine создается при первом async-запросе, а не при импорте: скрипты и тесты
+# с синхронным URL (sqlite://) не требуют асинхронного драйвера
+_async_session_factory: async_sessionmaker | None = None
+_async_lock = threading.Lock()
+
+
+def getAsyncSessionFactory() -> async_sessionmaker:
+    global _async_session_factory
+    if _async_session_factory is None:
+        with _async_lock:
+            if _async_session_factory is None:
+                async_engine = getAsyncEngine()
+                instrumentEngine(async_engine.sync_engine, "async")
+                # expire_on_commit=False: после commit атрибуты не перечитываются неявно (в async это ошибка)
+                _async_session_factory = async_sessionmaker(
+                    bind=async_engine, autoflush=False, expire_on_commit=False
+                )
+    return _async_session_factory
+
+
 def getSession() -> Generator:
     session = SessionLocal()
     try:
@@ -33,3 +103,12 @@ def getSession() -> Generator:
         session.close()
 
 
+async def getAsyncSession() -> AsyncGenerator[AsyncSession, None]:
+    """Сессия для async-эндпоинтов; синхронная getSession остается для скриптов, тестов и админки"""
+    async with getAsyncSessionFactory()() as session:
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
@@ -0,0 +1,249 @@
+import asyncio
+import threading
+import time
+import weakref
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.infra.config import getSettings
+from app.repositories.city_distance_repo import CityDistanceRepository
+
+
+# Изменения расстояний в session.info: применяются к индексу после успешного commit
+_CHANGES_KEY = "distance_index_changes"
+
+
+# Сколько последних изменений индекс помнит для changesSince; отставшим — полная перестройка
+_CHANGE_LOG_LIMIT = 10_000
+
+
+def _pairKey(a: int, b: int) -> tuple[int, int]:
+    return (a, b) if a <= b else (b, a)
+
+
+class DistanceIndex:
+    """
+    Симметричный индекс расстояний: пара id городов (в любом порядке) → км.
+
+    Обновляется на месте (запись одного ключа словаря атомарна), в том числе при
+    перезагрузке из БД: объект индекса живет, пока жив engine. version растет с каждым
+    изменением — по нему производные структуры (матрица цен) понимают, что пора обновиться.
+    """
+
+    def __init__(self, pairs: dict[tuple[int, int], int]) -> None:
+        self._pairs = pairs
+        self.loaded_at = time.monotonic()
+        self.version = 0
+        self._lock = threading.Lock()
+        # Ключи изменённых пар: _changes[k] переводит индекс в версию _changes_base + k + 1
+        self._changes: list[tuple[int, int]] = []
+        self._changes_base = 0
+
+    def _changed(self, key: tuple[int, int]) -> None:
+        # Вызывается под self._lock
+        self.version += 1
+        self._changes.append(key)
+        if len(self._changes) > _CHANGE_LOG_LIMIT:
+            drop = len(self._changes) // 2
+            del self._changes[:drop]
+            self._changes_base += drop
+
+    @staticmethod
+    def _canonical(distances: dict[tuple[int, int], int]) -> dict[tuple[int, int], int]:
+        # В карте репозитория обе ориентации; при расхождении берем меньший id первым
+        pairs: dict[tuple[int, int], int] = {}
+        for (a, b), km in distances.items():
+            pairs.setdefault(_pairKey(a, b), km)
+        return pairs
+
+    @classmethod
+    def fromMap(cls, distances: dict[tuple[int, int], int]) -> "DistanceIndex":
+        return cls(cls._canonical(distances))
+
+    def reload(self, distances: dict[tuple[int, int], int]) -> None:
+        """
+        Сверяет индекс с перечитанной из БД картой и применяет только различия:
+        если ничего не изменилось, version остается прежней.
+        """
+        pairs = self._canonical(distances)
+        with self._lock:
+            for key in [key for key in self._pairs if key not in pairs]:
+                del self._pairs[key]
+                self._changed(key)
+            for key, km in pairs.items():
+                if self._pairs.get(key) != km:
+                    self._pairs[key] = km
+                    self._changed(key)
+            self.loaded_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._pairs)
+
+    def get(self, from_city_id: int, to_city_id: int) -> int | None:
+        return self._pairs.get(_pairKey(from_city_id, to_city_id))
+
+    def set(self, from_city_id: int, to_city_id: int, distance_km: int) -> None:
+        key = _pairKey(from_city_id, to_city_id)
+        with self._lock:
+            if self._pairs.get(key) != distance_km:
+                self._pairs[key] = distance_km
+                self._changed(key)
+
+    def discard(self, from_city_id: int, to_city_id: int) -> None:
+        key = _pairKey(from_city_id, to_city_id)
+        with self._lock:
+            if self._pairs.pop(key, None) is not None:
+                self._changed(key)
+
+    def items(self) -> list[tuple[tuple[int, int], int]]:
+        """Пары (min_id, max_id) и расстояния — по одной записи на пару"""
+        return list(self._pairs.items())
+
+    def versionedItems(self) -> tuple[int, list[tuple[tuple[int, int], int]]]:
+        """items() вместе с версией, которой они соответствуют"""
+        with self._lock:
+            return self.version, list(self._pairs.items())
+
+    def changesSince(self, version: int) -> tuple[int, frozenset[tuple[int, int]] | None]:
+        """
+        Текущая версия и пары (min_id, max_id), изменённые после version; None,
+        если столько изменений индекс уже не помнит.
+        """
+        with self._lock:
+            if version < self._changes_base:
+                return self.version, None
+            return self.version, frozenset(self._changes[version - self._changes_base:])
+
+
+class DistanceIndexCache:
+    """
+    Индекс на каждый engine. Загружается одним запросом и дальше обновляется на месте
+    (OSRM, правки админа) — во всех индексах процесса, смотрящих в ту же БД; раз в TTL
+    перечитывается, чтобы увидеть правки других воркеров. Перечитывание одно на engine:
+    остальные запросы ждут его результата, а не читают таблицу параллельно.
+    """
+
+    def __init__(self, ttl_seconds: float | None = None) -> None:
+        self.ttl_seconds = (
+            ttl_seconds if ttl_seconds is not None else getSettings().reference_cache_ttl_seconds
+        )
+        self._lock = threading.Lock()
+        self._entries: "weakref.WeakKeyDictionary[object, DistanceIndex]" = weakref.WeakKeyDictionary()
+        # Идущие асинхронные загрузки: engine → future с загруженным индексом (None — ошибка)
+        self._loading: "weakref.WeakKeyDictionary[object, asyncio.Future]" = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def _key(session: Session | AsyncSession) -> object:
+        bind = session.get_bind()
+        return getattr(bind, "engine", bind)
+
+    def _isFresh(self, index: DistanceIndex | None) -> bool:
+        return index is not None and time.monotonic() - index.loaded_at < self.ttl_seconds
+
+    def _store(self, key: object, distances: dict[tuple[int, int], int]) -> DistanceIndex:
+        # Вызывается под self._lock; существующий индекс обновляется на месте
+        index = self._entries.get(key)
+        if index is None:
+            index = DistanceIndex.fromMap(distances)
+            self._entries[key] = index
+        else:
+            index.reload(distances)
+        return index
+
+    def get(self, session: Session) -> DistanceIndex:
+        key = self._key(session)
+        index = self._entries.get(key)
+        if self._isFresh(index):
+            return index
+        with self._lock:
+            index = self._entries.get(key)
+            if self._isFresh(index):
+                return index
+            return self._store(key, CityDistanceRepository(session).loadMap())
+
+    async def getAsync(self, session: AsyncSession) -> DistanceIndex:
+        key = self._key(session)
+        loop = asyncio.get_running_loop()
+        while True:
+            index = self._entries.get(key)
+            if self._isFresh(index):
+                return index
+            with self._lock:
+                pending = self._loading.get(key)
+                leader = pending is None or pending.get_loop() is not loop
+                if leader:
+                    pending = loop.create_future()
+                    self._loading[key] = pending
+            if not leader:
+                # Берем результат чужой загрузки; если она упала, следующий круг загрузит сам
+                index = await asyncio.shield(pending)
+                if index is not None:
+                    return index
+                continue
+            index = None
+            try:
+                distances = await CityDistanceRepository(session).loadMapAsync()
+                with self._lock:
+                    index = self._store(key, distances)
+                return index
+            finally:
+                with self._lock:
+                    if self._loading.get(key) is pending:
+                        del self._loading[key]
+                pending.set_result(index)
+
+    @staticmethod
+    def _database(engine) -> object:
+        # Синхронный и асинхронный engine одной БД различаются только драйвером
+        url = engine.url
+        if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+            return engine
+        return (url.get_backend_name(), url.host, url.port, url.database)
+
+    def loadedFor(self, session: Session) -> list[DistanceIndex]:
+        """Уже загруженные индексы всех engine, смотрящих в ту же БД, что и сессия"""
+        database = self._database(self._key(session))
+        with self._lock:
+            entries = list(self._entries.items())
+        return [index for engine, index in entries if self._database(engine) == database]
+
+
+distanceIndexCache = DistanceIndexCache()
+
+
+def getDistanceIndex(session: Session) -> DistanceIndex:
+    return distanceIndexCache.get(session)
+
+
+async def getDistanceIndexAsync(session: AsyncSession) -> DistanceIndex:
+    return await distanceIndexCache.getAsync(session)
+
+
+def recordDistance(session: Session | AsyncSession, from_city_id: int, to_city_id: int, distance_km: int) -> None:
+    """Новое или измененное расстояние попадет в индекс после commit сессии"""
+    session.info.setdefault(_CHANGES_KEY, []).append((from_city_id, to_city_id, distance_km))
+
+
+def forgetDistance(session: Session | AsyncSession, from_city_id: int, to_city_id: int) -> None:
+    """Удаленное расстояние уберется из индекса после commit (при дублях догрузится из БД)"""
+    session.info.setdefault(_CHANGES_KEY, []).append((from_city_id, to_city_id, None))
+
+
+@event.listens_for(Session, "after_commit")
+def _applyAfterCommit(session: Session) -> None:
+    changes = session.info.pop(_CHANGES_KEY, None)
+    if not changes:
+        return
+    for index in distanceIndexCache.loadedFor(session):
+        for from_city_id, to_city_id, distance_km in changes:
+            if distance_km is None:
+                index.discard(from_city_id, to_city_id)
+            else:
+                index.set(from_city_id, to_city_id, distance_km)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discardAfterRollback(session: Session) -> None:
+    session.info.pop(_CHANGES_KEY, None)
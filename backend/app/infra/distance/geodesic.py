@@ -0,0 +1,180 @@
+"""
+Оценка автомобильного расстояния по координатам: расстояние по дуге большого круга
+(haversine), умноженное на коэффициент извилистости дорог.
+
+Коэффициент подбирается по уже известным расстояниям (city_distances) методом
+наименьших квадратов: глобально и для каждого региона. Регион — ячейка сетки
+REGION_GRID_DEGREES × REGION_GRID_DEGREES по широте и долготе.
+"""
+
+import math
+import threading
+import weakref
+from array import array
+from dataclasses import dataclass, field
+from typing import Iterable, Sequence
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.infra.distance.distance_index import DistanceIndex, getDistanceIndex, getDistanceIndexAsync
+from app.infra.reference_cache import (
+    CityRef,
+    ReferenceSnapshot,
+    getReferenceSnapshot,
+    getReferenceSnapshotAsync,
+)
+
+EARTH_RADIUS_KM = 6371.0088
+REGION_GRID_DEGREES = 10.0
+# Типичная извилистость дорог — пока в БД нет расстояний для подбора
+DEFAULT_DETOUR_FACTOR = 1.3
+# Меньше пар в регионе — используется глобальный коэффициент
+MIN_REGION_SAMPLES = 3
+# Пары ближе этого расстояния по прямой не используются при подборе
+MIN_FIT_DISTANCE_KM = 1.0
+
+Region = tuple[int, int]
+
+
+def haversineKm(
+    lat1: Sequence[float], lon1: Sequence[float], lat2: Sequence[float], lon2: Sequence[float]
+) -> array:
+    """Расстояния по дуге большого круга для массивов координат (градусы), км"""
+    radians = math.radians
+    sin, cos, asin, sqrt = math.sin, math.cos, math.asin, math.sqrt
+    result = array("d", bytes(8 * len(lat1)))
+    for k, (a1, o1, a2, o2) in enumerate(zip(lat1, lon1, lat2, lon2)):
+        p1, p2 = radians(a1), radians(a2)
+        h = sin((p2 - p1) / 2) ** 2 + cos(p1) * cos(p2) * sin(radians(o2 - o1) / 2) ** 2
+        result[k] = 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(h)))
+    return result
+
+
+def regionOf(city: CityRef) -> Region:
+    return (
+        math.floor(city.latitude / REGION_GRID_DEGREES),
+        math.floor(city.longitude / REGION_GRID_DEGREES),
+    )
+
+
+def hasCoordinates(city: CityRef) -> bool:
+    return city.latitude is not None and city.longitude is not None
+
+
+@dataclass(frozen=True)
+class DetourModel:
+    global_factor: float = DEFAULT_DETOUR_FACTOR
+    region_factors: dict[Region, float] = field(default_factory=dict)
+    samples: int = 0
+
+    @classmethod
+    def fit(cls, cities: dict[int, CityRef], distances: Iterable[tuple[tuple[int, int], int]]) -> "DetourModel":
+        """
+        Коэффициент k минимизирует Σ(road − k·geo)², т.е. k = Σ road·geo / Σ geo².
+        Пара учитывается в регионах обоих городов.
+        """
+        pairs = [
+            (cities[a], cities[b], km)
+            for (a, b), km in distances
+            if a in cities and b in cities and hasCoordinates(cities[a]) and hasCoordinates(cities[b])
+        ]
+        geo = haversineKm(
+            [c.latitude for c, _, _ in pairs],
+            [c.longitude for c, _, _ in pairs],
+            [c.latitude for _, c, _ in pairs],
+            [c.longitude for _, c, _ in pairs],
+        )
+
+        sums: dict[Region | None, list[float]] = {}  # регион → [Σ road·geo, Σ geo², n]
+        for (city_from, city_to, road), straight in zip(pairs, geo):
+            if straight < MIN_FIT_DISTANCE_KM:
+                continue
+            for region in {None, regionOf(city_from), regionOf(city_to)}:
+                acc = sums.setdefault(region, [0.0, 0.0, 0])
+                acc[0] += road * straight
+                acc[1] += straight * straight
+                acc[2] += 1
+
+        total = sums.pop(None, None)
+        if total is None:
+            return cls()
+        return cls(
+            global_factor=total[0] / total[1],
+            region_factors={
+                region: acc[0] / acc[1] for region, acc in sums.items() if acc[2] >= MIN_REGION_SAMPLES
+            },
+            samples=int(total[2]),
+        )
+
+    def factorFor(self, city_from: CityRef, city_to: CityRef) -> float:
+        """Коэффициент региона; для пары из двух регионов — среднее известных"""
+        factors = [
+            self.region_factors[region]
+            for region in {regionOf(city_from), regionOf(city_to)}
+            if region in self.region_factors
+        ]
+        return sum(factors) / len(factors) if factors else self.global_factor
+
+    def estimateMany(self, pairs: Sequence[tuple[CityRef, CityRef]]) -> list[int]:
+        geo = haversineKm(
+            [a.latitude for a, _ in pairs],
+            [a.longitude for a, _ in pairs],
+            [b.latitude for _, b in pairs],
+            [b.longitude for _, b in pairs],
+        )
+        return [int(round(g * self.factorFor(a, b))) for (a, b), g in zip(pairs, geo)]
+
+    def estimate(self, city_from: CityRef, city_to: CityRef) -> int:
+        return self.estimateMany([(city_from, city_to)])[0]
+
+
+class DetourModelCache:
+    """
+    Модель на каждый engine. Подбирается заново, если изменились города (координаты,
+    активность) или индекс расстояний создан заново; перечитывание снимка по TTL без
+    изменений и точечные обновления индекса модель не трогают.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: "weakref.WeakKeyDictionary[object, tuple[ReferenceSnapshot, DistanceIndex, DetourModel]]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    @staticmethod
+    def _key(session: Session | AsyncSession) -> object:
+        bind = session.get_bind()
+        return getattr(bind, "engine", bind)
+
+    def _resolve(self, key: object, snapshot: ReferenceSnapshot, index: DistanceIndex) -> DetourModel:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is snapshot and entry[1] is index:
+            return entry[2]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is index and entry[0].cities_by_id == snapshot.cities_by_id:
+                model = entry[2]
+            else:
+                model = DetourModel.fit(snapshot.cities_by_id, index.items())
+            self._entries[key] = (snapshot, index, model)
+            return model
+
+    def get(self, session: Session) -> DetourModel:
+        return self._resolve(self._key(session), getReferenceSnapshot(session), getDistanceIndex(session))
+
+    async def getAsync(self, session: AsyncSession) -> DetourModel:
+        snapshot = await getReferenceSnapshotAsync(session)
+        index = await getDistanceIndexAsync(session)
+        return self._resolve(self._key(session), snapshot, index)
+
+
+detourModelCache = DetourModelCache()
+
+
+def getDetourModel(session: Session) -> DetourModel:
+    return detourModelCache.get(session)
+
+
+async def getDetourModelAsync(session: AsyncSession) -> DetourModel:
+    return await detourModelCache.getAsync(session)
@@ -0,0 +1,172 @@
+"""
+Бинарная матрица расстояний для OfflineMatrixProvider.
+
+Формат (little-endian):
+    заголовок  <4sIII: magic b"DMX1", layout (0 — полная n×n, 1 — треугольная), n, длина блока имен
+    имена      UTF-8, разделены "\\n", в порядке индексов; дополнены нулями до кратного 4
+    расстояния int32, -1 — расстояния нет
+
+Полная матрица хранит ячейку (i, j) по индексу i * n + j. Треугольная — только для
+симметричных данных: пара {i, j} при i >= j лежит по индексу i * (i + 1) / 2 + j.
+
+Файл открывается через mmap: все воркеры читают одну копию из page cache,
+поиск — словарь имен и одно обращение к массиву.
+
+Сборка из JSON:
+    python -m app.infra.distance.matrix_file offline_matrix.json offline_matrix.bin
+"""
+
+import json
+import mmap
+import struct
+import sys
+import threading
+from array import array
+
+MAGIC = b"DMX1"
+LAYOUT_DENSE = 0
+LAYOUT_TRIANGULAR = 1
+MISSING = -1
+
+_HEADER = struct.Struct("<4sIII")
+
+
+def _triangularIndex(i: int, j: int) -> int:
+    if i < j:
+        i, j = j, i
+    return i * (i + 1) // 2 + j
+
+
+class DistanceMatrixFile:
+    def __init__(self, names: list[str], layout: int, cells, source: mmap.mmap | None = None) -> None:
+        self.names = names
+        self.index = {sys.intern(name): i for i, name in enumerate(names)}
+        self.layout = layout
+        self.size = len(names)
+        self._cells = cells
+        self._mmap = source
+        self._views: tuple[memoryview, ...] = ()
+
+    @classmethod
+    def open(cls, path: str) -> "DistanceMatrixFile":
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, layout, size, names_len = _HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or layout not in (LAYOUT_DENSE, LAYOUT_TRIANGULAR):
+            mm.close()
+            raise ValueError(f"Not a distance matrix file: {path}")
+        names_start = _HEADER.size
+        names_block = bytes(mm[names_start:names_start + names_len]).decode("utf-8")
+        names = names_block.split("\n") if size else []
+        cells_start = names_start + names_len + (-names_len % 4)
+        cells_count = size * size if layout == LAYOUT_DENSE else size * (size + 1) // 2
+
+        if sys.byteorder == "little":
+            # Представление поверх mmap без копирования
+            view = memoryview(mm)
+            cells = view[cells_start:cells_start + cells_count * 4].cast("i")
+            matrix = cls(names, layout, cells, mm)
+            matrix._views = (cells, view)
+            return matrix
+        cells = array("i", mm[cells_start:cells_start + cells_count * 4])
+        cells.byteswap()
+        mm.close()
+        return cls(names, layout, cells)
+
+    def get(self, from_city: str, to_city: str) -> int | None:
+        i = self.index.get(from_city)
+        j = self.index.get(to_city)
+        if i is None or j is None:
+            return None
+        if self.layout == LAYOUT_DENSE:
+            value = self._cells[i * self.size + j]
+        else:
+            value = self._cells[_triangularIndex(i, j)]
+        return None if value == MISSING else value
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            for view in self._views:
+                view.release()
+            self._views = ()
+            self._mmap.close()
+            self._mmap = None
+
+
+def _lookupJson(data: dict[str, dict[str, int]], from_city: str, to_city: str) -> int | None:
+    # Та же логика, что у исходного провайдера: прямое направление, затем обратное
+    frm = data.get(from_city)
+    if frm and to_city in frm:
+        return int(frm[to_city])
+    rev = data.get(to_city)
+    if rev and from_city in rev:
+        return int(rev[from_city])
+    return None
+
+
+def buildMatrix(data: dict[str, dict[str, int]]) -> tuple[list[str], int, array]:
+    """Имена, раскладка и массив ячеек; треугольная раскладка — если данные симметричны"""
+    names = sorted({name for name in data} | {to for routes in data.values() for to in routes})
+    size = len(names)
+    dense = array("i", [MISSING]) * (size * size)
+    for i, from_city in enumerate(names):
+        for j, to_city in enumerate(names):
+            value = _lookupJson(data, from_city, to_city)
+            if value is not None:
+                dense[i * size + j] = value
+
+    symmetric = all(dense[i * size + j] == dense[j * size + i] for i in range(size) for j in range(i))
+    if not symmetric:
+        return names, LAYOUT_DENSE, dense
+    triangular = array("i", [dense[i * size + j] for i in range(size) for j in range(i + 1)])
+    return names, LAYOUT_TRIANGULAR, triangular
+
+
+def writeMatrixFile(data: dict[str, dict[str, int]], path: str) -> None:
+    names, layout, cells = buildMatrix(data)
+    for name in names:
+        if "\n" in name:
+            raise ValueError(f"City name contains a newline: {name!r}")
+    names_block = "\n".join(names).encode("utf-8")
+    if sys.byteorder != "little":
+        cells.byteswap()
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, layout, len(names), len(names_block)))
+        f.write(names_block)
+        f.write(b"\0" * (-len(names_block) % 4))
+        f.write(cells.tobytes())
+
+
+def convertJsonMatrix(json_path: str, out_path: str) -> None:
+    with open(json_path, "r", encoding="utf-8") as f:
+        writeMatrixFile(json.load(f), out_path)
+
+
+_opened: dict[str, DistanceMatrixFile] = {}
+_opened_lock = threading.Lock()
+
+
+def _load(path: str) -> DistanceMatrixFile:
+    if not path.endswith(".json"):
+        return DistanceMatrixFile.open(path)
+    # JSON-матрица без конвертации: тот же компактный массив, но в памяти процесса
+    with open(path, "r", encoding="utf-8") as f:
+        names, layout, cells = buildMatrix(json.load(f))
+    return DistanceMatrixFile(names, layout, cells)
+
+
+def openMatrix(path: str) -> DistanceMatrixFile:
+    """Одна матрица на путь в пределах процесса, сколько бы провайдеров ни было создано"""
+    matrix = _opened.get(path)
+    if matrix is None:
+        with _opened_lock:
+            matrix = _opened.get(path)
+            if matrix is None:
+                matrix = _opened[path] = _load(path)
+    return matrix
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: python -m app.infra.distance.matrix_file <input.json> <output.bin>")
+    convertJsonMatrix(sys.argv[1], sys.argv[2])
@@ -0,0 +1,208 @@
+import asyncio
+import importlib.util
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable
+
+import httpx
+
+from app.infra.config import getSettings
+
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 дает пакет h2 из httpx[http2] (requirements.txt); без него клиенты работают
+# по HTTP/1.1, и об этом надо знать при старте, а не по метрикам соединений
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+if not HTTP2_AVAILABLE:
+    logger.warning("h2 is not installed: OSRM clients fall back to HTTP/1.1 (install httpx[http2])")
+
+Coords = tuple[float, float]
+
+
+def routeUrl(base_url: str, from_coords: Coords, to_coords: Coords) -> str:
+    """URL сервиса route; координаты передаются как (latitude, longitude)"""
+    lat1, lon1 = from_coords
+    lat2, lon2 = to_coords
+    return f"{base_url}/route/v1/driving/{lon1},{lat1};{lon2},{lat2}"
+
+
+def parseRouteResponse(data: dict) -> int:
+    if data.get("code") != "Ok" or not data.get("routes"):
+        raise ValueError(f"OSRM API error: {data.get('message', 'No route found')}")
+    meters = data["routes"][0]["distance"]
+    return int(meters / 1000)
+
+
+def tableUrl(base_url: str, coords: list[Coords]) -> str:
+    """URL сервиса table (матрица расстояний многие-ко-многим)"""
+    points = ";".join(f"{lon},{lat}" for lat, lon in coords)
+    return f"{base_url}/table/v1/driving/{points}"
+
+
+def parseTableResponse(data: dict) -> list[list[int | None]]:
+    """Матрица расстояний в км; None — маршрут не найден"""
+    if data.get("code") != "Ok" or data.get("distances") is None:
+        raise ValueError(f"OSRM API error: {data.get('message', 'No table returned')}")
+    return [[None if m is None else int(m / 1000) for m in row] for row in data["distances"]]
+
+
+def _limits() -> httpx.Limits:
+    settings = getSettings()
+    return httpx.Limits(
+        max_connections=settings.osrm_max_connections,
+        max_keepalive_connections=settings.osrm_max_keepalive_connections,
+    )
+
+
+_sync_client: httpx.Client | None = None
+_sync_lock = threading.Lock()
+
+
+def getSyncClient() -> httpx.Client:
+    """Общий для процесса синхронный клиент с keep-alive пулом"""
+    global _sync_client
+    if _sync_client is None:
+        with _sync_lock:
+            if _sync_client is None:
+                _sync_client = httpx.Client(
+                    timeout=getSettings().osrm_timeout_seconds,
+                    limits=_limits(),
+                    http2=HTTP2_AVAILABLE,
+                )
+    return _sync_client
+
+
+# Идущие синхронные запросы: ключ → future с ответом, который ждут остальные потоки
+_sync_inflight: dict[object, Future] = {}
+_sync_inflight_lock = threading.Lock()
+
+
+def fetchOnce(key: object, fetch: Callable[[], int]) -> int:
+    """
+    Синхронный аналог объединения запросов AsyncOSRMClient: потоки, одновременно
+    запросившие один ключ, получают результат (или ошибку) одного вызова fetch.
+    """
+    with _sync_inflight_lock:
+        future = _sync_inflight.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _sync_inflight[key] = future
+    if not leader:
+        return future.result()
+    try:
+        result = fetch()
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _sync_inflight_lock:
+            _sync_inflight.pop(key, None)
+
+
+class AsyncOSRMClient:
+    """
+    Долгоживущий асинхронный клиент OSRM.
+
+    Соединения переиспользуются через пул httpx.AsyncClient. Одновременные запросы
+    одной и той же пары разделяют один запрос к OSRM.
+    """
+
+    def __init__(
+        self,
+        base_url: str | None = None,
+        timeout: float | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        settings = getSettings()
+        self.base_url = base_url or settings.osrm_base_url
+        self.timeout = timeout if timeout is not None else settings.osrm_timeout_seconds
+        self._transport = transport
+        self._client: httpx.AsyncClient | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._inflight: dict[tuple[Coords, Coords], asyncio.Task] = {}
+        # Задачи закрытия клиентов прежних циклов событий
+        self._closing: set[asyncio.Future] = set()
+
+    @staticmethod
+    async def _closeQuietly(client: httpx.AsyncClient) -> None:
+        try:
+            await client.aclose()
+        except Exception:
+            logger.warning("Failed to close OSRM client of a previous event loop", exc_info=True)
+
+    def _retire(self, client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop) -> None:
+        # Пул закрываем в его цикле, если тот еще работает (другой поток), иначе — в текущем
+        if loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self._closeQuietly(client), loop)
+            return
+        task = asyncio.ensure_future(self._closeQuietly(client))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def _getClient(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        # Клиент и задачи привязаны к циклу событий; при смене цикла создаем заново,
+        # а прежний клиент закрываем, чтобы не оставлять открытыми его соединения
+        if self._client is None or self._loop is not loop:
+            if self._client is not None:
+                self._retire(self._client, self._loop)
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=_limits(),
+                http2=HTTP2_AVAILABLE and self._transport is None,
+                transport=self._transport,
+            )
+            self._loop = loop
+            self._inflight = {}
+        return self._client
+
+    async def getDistanceKm(self, from_city: str, to_city: str, from_coords: Coords, to_coords: Coords) -> int:
+        client = self._getClient()
+        key = (tuple(from_coords), tuple(to_coords))
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(client, from_coords, to_coords))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: отмена одного ожидающего не отменяет общий запрос для остальных
+        return await asyncio.shield(task)
+
+    async def _fetch(self, client: httpx.AsyncClient, from_coords: Coords, to_coords: Coords) -> int:
+        try:
+            resp = await client.get(routeUrl(self.base_url, from_coords, to_coords), params={"overview": "false"})
+            resp.raise_for_status()
+            return parseRouteResponse(resp.json())
+        except httpx.HTTPError as e:
+            raise ValueError(f"Failed to fetch distance from OSRM: {e}")
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+
+_async_client: AsyncOSRMClient | None = None
+
+
+def getAsyncClient() -> AsyncOSRMClient:
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOSRMClient()
+    return _async_client
+
+
+async def closeClients() -> None:
+    global _sync_client
+    if _async_client is not None:
+        await _async_client.aclose()
+    with _sync_lock:
+        if _sync_client is not None:
+            _sync_client.close()
+            _sync_client = None
@@ -1,47 +1,92 @@
-import json
+import asyncio
 import os
-from functools import lru_cache
-from typing import Optional
+from typing import Iterable, Optional
 
 import httpx
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.repositories.models import City, CityDistance
+from app.infra.config import getSettings
+from app.infra.distance.distance_index import (
+    DistanceIndex,
+    getDistanceIndex,
+    getDistanceIndexAsync,
+    recordDistance,
+)
+from app.infra.distance.geodesic import DetourModel, getDetourModel, getDetourModelAsync, hasCoordinates
+from app.infra.distance.matrix_file import openMatrix
+from app.infra.distance.osrm_client import (
+    AsyncOSRMClient,
+    fetchOnce,
+    getAsyncClient,
+    getSyncClient,
+    parseRouteResponse,
+    parseTableResponse,
+    routeUrl,
+    tableUrl,
+)
+from app.infra.metrics import timeStage
+from app.infra.reference_cache import (
+    CityRef,
+    ReferenceSnapshot,
+    getReferenceSnapshot,
+    getReferenceSnapshotAsync,
+)
+from app.repositories.city_distance_repo import CityDistanceRepository
 
 
 class DistanceProvider:
     def getDistanceKm(self, from_city: str, to_city: str) -> int:  # pragma: no cover
         raise NotImplementedError
 
+    async def getDistanceKmAsync(self, from_city: str, to_city: str) -> int:
+        return self.getDistanceKm(from_city, to_city)
+
+    def isEstimated(self, from_city: str, to_city: str) -> bool:
+        """Расстояние пары — приближенная оценка, а не точное значение"""
+        return False
+
+    def getDistancesKm(self, pairs: Iterable[tuple[str, str]]) -> dict[tuple[str, str], int | ValueError]:
+        """Расстояния для набора пар; ошибка по паре возвращается вместо значения"""
+        result: dict[tuple[str, str], int | ValueError] = {}
+        for from_city, to_city in set(pairs):
+            try:
+                result[(from_city, to_city)] = self.getDistanceKm(from_city, to_city)
+            except ValueError as e:
+                result[(from_city, to_city)] = e
+        return result
+
+    async def getDistancesKmAsync(
+        self, pairs: Iterable[tuple[str, str]]
+    ) -> dict[tuple[str, str], int | ValueError]:
+        return self.getDistancesKm(pairs)
+
 
 class OfflineMatrixProvider(DistanceProvider):
+    """
+    Расстояния из офлайн-матрицы: бинарный файл (matrix_file), отображенный в память,
+    или исходный JSON. Матрица загружается один раз на процесс для каждого пути.
+    """
+
     def __init__(self, matrix_path: str | None = None) -> None:
         self.matrix_path = matrix_path or os.path.join(
-            os.path.dirname(__file__), "offline_matrix.json"
+            os.path.dirname(__file__), "offline_matrix.bin"
         )
 
-    @lru_cache(maxsize=1)
-    def _load(self) -> dict:
-        with open(self.matrix_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-
     def getDistanceKm(self, from_city: str, to_city: str) -> int:
-        data = self._load()
-        frm = data.get(from_city)
-        if frm and to_city in frm:
-            return int(frm[to_city])
-        # Try symmetric
-        rev = data.get(to_city)
-        if rev and from_city in rev:
-            return int(rev[from_city])
-        raise ValueError(f"Distance not found for {from_city} -> {to_city}")
+        distance_km = openMatrix(self.matrix_path).get(from_city, to_city)
+        if distance_km is None:
+            raise ValueError(f"Distance not found for {from_city} -> {to_city}")
+        return distance_km
 
 
 class OSRMProvider(DistanceProvider):
     """Использует публичный OSRM API для расчета автомобильных расстояний"""
 
-    def __init__(self, base_url: str = "http://router.project-osrm.org") -> None:
-        self.base_url = base_url
+    def __init__(self, base_url: str | None = None, client: httpx.Client | None = None) -> None:
+        self.base_url = base_url or getSettings().osrm_base_url
+        # По умолчанию — общий для процесса клиент с keep-alive пулом соединений
+        self.client = client
 
     def getDistanceKm(self, from_city: str, to_city: str, from_coords: tuple[float, float], to_coords: tuple[float, float]) -> int:
         """
@@ -49,78 +94,321 @@ class OSRMProvider(DistanceProvider):
         :param from_coords: (latitude, longitude)
         :param to_coords: (latitude, longitude)
         """
-        lon1, lat1 = from_coords[1], from_coords[0]
-        lon2, lat2 = to_coords[1], to_coords[0]
-
-        url = f"{self.base_url}/route/v1/driving/{lon1},{lat1};{lon2},{lat2}"
-        params = {"overview": "false"}
+        client = self.client or getSyncClient()
+        url = routeUrl(self.base_url, from_coords, to_coords)
 
-        try:
-            with httpx.Client(timeout=10.0) as client:
-                resp = client.get(url, params=params)
+        def fetch() -> int:
+            try:
+                resp = client.get(url, params={"overview": "false"})
                 resp.raise_for_status()
-                data = resp.json()
+                return parseRouteResponse(resp.json())
+            except httpx.HTTPError as e:
+                raise ValueError(f"Failed to fetch distance from OSRM: {e}")
 
-                if data.get("code") != "Ok" or not data.get("routes"):
-                    raise ValueError(f"OSRM API error: {data.get('message', 'No route found')}")
+        # Одновременные запросы той же пары из разных потоков разделяют один HTTP-запрос
+        return fetchOnce(url, fetch)
 
-                meters = data["routes"][0]["distance"]
-                return int(meters / 1000)
+    def getTableDistancesKm(
+        self, source: tuple[float, float], destinations: list[tuple[float, float]]
+    ) -> list[int | None]:
+        """
+        Расстояния от одной точки до набора точек одним запросом к сервису table.
+        None — для недостижимых точек.
+        """
+        client = self.client or getSyncClient()
+        params = {
+            "sources": "0",
+            "destinations": ";".join(str(i) for i in range(1, len(destinations) + 1)),
+            "annotations": "distance",
+        }
+        try:
+            resp = client.get(tableUrl(self.base_url, [source, *destinations]), params=params)
+            resp.raise_for_status()
+            return parseTableResponse(resp.json())[0]
         except httpx.HTTPError as e:
-            raise ValueError(f"Failed to fetch distance from OSRM: {e}")
+            raise ValueError(f"Failed to fetch distance table from OSRM: {e}")
 
 
 class HybridDistanceProvider(DistanceProvider):
     """
-    Сначала ищет расстояние в БД, если не найдено — запрашивает через OSRM и кеширует в БД
+    Сначала ищет расстояние в общем индексе процесса (distance_index), затем в БД,
+    если не найдено — запрашивает через OSRM и кеширует в БД и индексе.
+
+    С синхронной Session используются getDistanceKm/getDistancesKm, с AsyncSession —
+    их варианты *Async (OSRM опрашивается общим асинхронным клиентом).
+
+    С estimate_missing=True OSRM не опрашивается: для пар без расстояния сразу
+    возвращается оценка по координатам (geodesic), пары попадают в estimated —
+    вызывающий код уточняет их в фоне (services/distance_refine).
     """
 
-    def __init__(self, session: Session, osrm_provider: Optional[OSRMProvider] = None) -> None:
+    def __init__(
+        self,
+        session: Session | AsyncSession,
+        osrm_provider: Optional[OSRMProvider] = None,
+        async_osrm: Optional[AsyncOSRMClient] = None,
+        estimate_missing: bool = False,
+    ) -> None:
         self.session = session
         self.osrm = osrm_provider or OSRMProvider()
+        self.async_osrm = async_osrm
+        self.estimate_missing = estimate_missing
+        self.estimated: set[tuple[str, str]] = set()
+
+    def isEstimated(self, from_city: str, to_city: str) -> bool:
+        return (from_city, to_city) in self.estimated
 
     def getDistanceKm(self, from_city: str, to_city: str) -> int:
-        # 1. Получить города из БД
-        city_from = self.session.query(City).filter_by(name=from_city).first()
-        city_to = self.session.query(City).filter_by(name=to_city).first()
+        snapshot = getReferenceSnapshot(self.session)
+        city_from, city_to = self._resolveCities(snapshot, from_city, to_city)
+        index = getDistanceIndex(self.session)
+        distance_km = index.get(city_from.id, city_to.id)
+        if distance_km is not None:
+            return distance_km
+
+        # 2. Расстояние могли добавить другие воркеры после загрузки индекса
+        with timeStage("distance", "db_lookup"):
+            stored = CityDistanceRepository(self.session).find(city_from.id, city_to.id)
+        if stored is not None:
+            index.set(city_from.id, city_to.id, stored.distance_km)
+            return stored.distance_km
+
+        if self.estimate_missing and self._canEstimate(city_from, city_to):
+            model = getDetourModel(self.session)
+            return self._estimate(model, {(from_city, to_city): (city_from, city_to)})[(from_city, to_city)]
+
+        # 3. Запросить через OSRM и сохранить в БД
+        with timeStage("distance", "osrm"):
+            distance_km = self._fetchFromOsrm(city_from, city_to)
+        with timeStage("distance", "db_store"):
+            self._store([(city_from, city_to, distance_km)])
+        return distance_km
+
+    async def getDistanceKmAsync(self, from_city: str, to_city: str) -> int:
+        snapshot = await getReferenceSnapshotAsync(self.session)
+        city_from, city_to = self._resolveCities(snapshot, from_city, to_city)
+        index = await getDistanceIndexAsync(self.session)
+        distance_km = index.get(city_from.id, city_to.id)
+        if distance_km is not None:
+            return distance_km
+
+        with timeStage("distance", "db_lookup"):
+            stored = await CityDistanceRepository(self.session).findAsync(city_from.id, city_to.id)
+        if stored is not None:
+            index.set(city_from.id, city_to.id, stored.distance_km)
+            return stored.distance_km
+
+        if self.estimate_missing and self._canEstimate(city_from, city_to):
+            model = await getDetourModelAsync(self.session)
+            return self._estimate(model, {(from_city, to_city): (city_from, city_to)})[(from_city, to_city)]
+
+        with timeStage("distance", "osrm"):
+            distance_km = await self._fetchFromOsrmAsync(city_from, city_to)
+        with timeStage("distance", "db_store"):
+            await self._storeAsync([(city_from, city_to, distance_km)])
+        return distance_km
+
+    @staticmethod
+    def _resolveCities(snapshot: ReferenceSnapshot, from_city: str, to_city: str) -> tuple[CityRef, CityRef]:
+        # 1. Получить города из снимка справочников
+        city_from = snapshot.getCity(from_city)
+        city_to = snapshot.getCity(to_city)
 
         if not city_from or not city_to:
             raise ValueError(f"City not found: {from_city} or {to_city}")
+        return city_from, city_to
 
-        # 2. Проверить в БД (прямое и обратное направление)
-        dist = self.session.query(CityDistance).filter(
-            ((CityDistance.from_city_id == city_from.id) & (CityDistance.to_city_id == city_to.id)) |
-            ((CityDistance.from_city_id == city_to.id) & (CityDistance.to_city_id == city_from.id))
-        ).first()
+    @classmethod
+    def _resolvePairs(
+        cls, snapshot: ReferenceSnapshot, pairs: Iterable[tuple[str, str]]
+    ) -> tuple[dict[tuple[str, str], int | ValueError], dict[tuple[str, str], tuple[CityRef, CityRef]]]:
+        """Города пар из снимка: ошибки для неизвестных городов и найденные пары"""
+        errors: dict[tuple[str, str], int | ValueError] = {}
+        resolved: dict[tuple[str, str], tuple[CityRef, CityRef]] = {}
+        for pair in set(pairs):
+            try:
+                resolved[pair] = cls._resolveCities(snapshot, *pair)
+            except ValueError as e:
+                errors[pair] = e
+        return errors, resolved
 
-        if dist:
-            return dist.distance_km
+    def getDistancesKm(self, pairs: Iterable[tuple[str, str]]) -> dict[tuple[str, str], int | ValueError]:
+        """
+        Пакетный вариант: города берутся из снимка, расстояния — из индекса, пары вне
+        индекса загружаются одним запросом, OSRM вызывается только для отсутствующих пар.
+        """
+        snapshot = getReferenceSnapshot(self.session)
+        result, resolved = self._resolvePairs(snapshot, pairs)
+        index = getDistanceIndex(self.session)
+        known = self._fromIndex(index, resolved)
+        unindexed = [(a.id, b.id) for a, b in resolved.values() if (a.id, b.id) not in known]
+        if unindexed:
+            with timeStage("distance", "db_lookup"):
+                loaded = CityDistanceRepository(self.session).findMany(unindexed)
+            known.update(self._indexLoaded(index, loaded))
+        estimated = {}
+        if self.estimate_missing:
+            pending = self._estimable(resolved, known)
+            if pending:
+                estimated = self._estimate(getDetourModel(self.session), pending)
 
-        # 3. Проверить наличие координат для OSRM
-        if not (city_from.latitude and city_from.longitude and city_to.latitude and city_to.longitude):
-            raise ValueError(
-                f"No distance in DB and missing coordinates for OSRM: {from_city} "
-                f"({city_from.latitude}, {city_from.longitude}) -> {to_city} ({city_to.latitude}, {city_to.longitude})"
-            )
+        fetched = []
+        for pair, (city_from, city_to) in resolved.items():
+            distance_km = known.get((city_from.id, city_to.id), estimated.get(pair))
+            if distance_km is None:
+                try:
+                    distance_km = self._fetchFromOsrm(city_from, city_to)
+                except ValueError as e:
+                    result[pair] = e
+                    continue
+                fetched.append((city_from, city_to, distance_km))
+                known[(city_from.id, city_to.id)] = distance_km
+                known[(city_to.id, city_from.id)] = distance_km
+            result[pair] = distance_km
+
+        if fetched:
+            with timeStage("distance", "db_store"):
+                self._store(fetched)
+        return result
+
+    async def getDistancesKmAsync(
+        self, pairs: Iterable[tuple[str, str]]
+    ) -> dict[tuple[str, str], int | ValueError]:
+        """Как getDistancesKm, но недостающие пары запрашиваются в OSRM параллельно"""
+        snapshot = await getReferenceSnapshotAsync(self.session)
+        result, resolved = self._resolvePairs(snapshot, pairs)
+        index = await getDistanceIndexAsync(self.session)
+        known = self._fromIndex(index, resolved)
+        unindexed = [(a.id, b.id) for a, b in resolved.values() if (a.id, b.id) not in known]
+        if unindexed:
+            with timeStage("distance", "db_lookup"):
+                loaded = await CityDistanceRepository(self.session).findManyAsync(unindexed)
+            known.update(self._indexLoaded(index, loaded))
+        estimated = {}
+        if self.estimate_missing:
+            pending = self._estimable(resolved, known)
+            if pending:
+                estimated = self._estimate(await getDetourModelAsync(self.session), pending)
+
+        # Пара и ее обратная запрашиваются один раз
+        missing: dict[frozenset[int], tuple[CityRef, CityRef]] = {}
+        for pair, (city_from, city_to) in resolved.items():
+            if (city_from.id, city_to.id) not in known and pair not in estimated:
+                missing.setdefault(frozenset((city_from.id, city_to.id)), (city_from, city_to))
+
+        async def fetch(city_from: CityRef, city_to: CityRef) -> int | ValueError:
+            try:
+                return await self._fetchFromOsrmAsync(city_from, city_to)
+            except ValueError as e:
+                return e
+
+        fetched = await asyncio.gather(*(fetch(*cities) for cities in missing.values()))
+        failed: dict[frozenset[int], ValueError] = {}
+        stored = []
+        for (ids, (city_from, city_to)), distance_km in zip(missing.items(), fetched):
+            if isinstance(distance_km, ValueError):
+                failed[ids] = distance_km
+                continue
+            stored.append((city_from, city_to, distance_km))
+            known[(city_from.id, city_to.id)] = distance_km
+            known[(city_to.id, city_from.id)] = distance_km
+
+        for pair, (city_from, city_to) in resolved.items():
+            distance_km = known.get((city_from.id, city_to.id), estimated.get(pair))
+            result[pair] = failed[frozenset((city_from.id, city_to.id))] if distance_km is None else distance_km
+
+        if stored:
+            with timeStage("distance", "db_store"):
+                await self._storeAsync(stored)
+        return result
 
-        # 4. Запросить через OSRM
-        distance_km = self.osrm.getDistanceKm(
-            from_city,
-            to_city,
+    @staticmethod
+    def _fromIndex(
+        index: DistanceIndex, resolved: dict[tuple[str, str], tuple[CityRef, CityRef]]
+    ) -> dict[tuple[int, int], int]:
+        """Известные индексу пары в обеих ориентациях — как у CityDistanceRepository.findMany"""
+        known: dict[tuple[int, int], int] = {}
+        for city_from, city_to in resolved.values():
+            distance_km = index.get(city_from.id, city_to.id)
+            if distance_km is not None:
+                known[(city_from.id, city_to.id)] = distance_km
+                known[(city_to.id, city_from.id)] = distance_km
+        return known
+
+    @staticmethod
+    def _indexLoaded(index: DistanceIndex, loaded: dict[tuple[int, int], int]) -> dict[tuple[int, int], int]:
+        # Найденное в БД пополняет индекс: следующий запрос этой пары обойдется без SQL
+        for (from_city_id, to_city_id), distance_km in loaded.items():
+            if index.get(from_city_id, to_city_id) is None:
+                index.set(from_city_id, to_city_id, distance_km)
+        return loaded
+
+    @staticmethod
+    def _canEstimate(city_from: CityRef, city_to: CityRef) -> bool:
+        return hasCoordinates(city_from) and hasCoordinates(city_to)
+
+    @classmethod
+    def _estimable(
+        cls, resolved: dict[tuple[str, str], tuple[CityRef, CityRef]], known: dict[tuple[int, int], int]
+    ) -> dict[tuple[str, str], tuple[CityRef, CityRef]]:
+        """Пары без известного расстояния, для которых есть координаты обоих городов"""
+        return {
+            pair: (city_from, city_to)
+            for pair, (city_from, city_to) in resolved.items()
+            if (city_from.id, city_to.id) not in known and cls._canEstimate(city_from, city_to)
+        }
+
+    def _estimate(
+        self, model: DetourModel, pairs: dict[tuple[str, str], tuple[CityRef, CityRef]]
+    ) -> dict[tuple[str, str], int]:
+        # Оценка не сохраняется ни в БД, ни в индексе — ее заменит значение из OSRM
+        with timeStage("distance", "estimate"):
+            estimates = dict(zip(pairs, model.estimateMany(list(pairs.values()))))
+        self.estimated.update(pairs)
+        return estimates
+
+    def _fetchFromOsrm(self, city_from: CityRef, city_to: CityRef) -> int:
+        self._checkCoordinates(city_from, city_to)
+        return self.osrm.getDistanceKm(
+            city_from.name,
+            city_to.name,
             (city_from.latitude, city_from.longitude),
             (city_to.latitude, city_to.longitude),
         )
 
-        # 5. Сохранить в БД для будущих запросов
-        new_dist = CityDistance(
-            from_city_id=city_from.id,
-            to_city_id=city_to.id,
-            distance_km=distance_km,
-            is_manual=False,
+    async def _fetchFromOsrmAsync(self, city_from: CityRef, city_to: CityRef) -> int:
+        self._checkCoordinates(city_from, city_to)
+        osrm = self.async_osrm or getAsyncClient()
+        return await osrm.getDistanceKm(
+            city_from.name,
+            city_to.name,
+            (city_from.latitude, city_from.longitude),
+            (city_to.latitude, city_to.longitude),
         )
-        self.session.add(new_dist)
-        self.session.flush()
 
-        return distance_km
+    @staticmethod
+    def _checkCoordinates(city_from: CityRef, city_to: CityRef) -> None:
+        # Проверить наличие координат для OSRM
+        if not (city_from.latitude and city_from.longitude and city_to.latitude and city_to.longitude):
+            raise ValueError(
+                f"No distance in DB and missing coordinates for OSRM: {city_from.name} "
+                f"({city_from.latitude}, {city_from.longitude}) -> {city_to.name} ({city_to.latitude}, {city_to.longitude})"
+            )
+
+    @staticmethod
+    def _storeRows(fetched: list[tuple[CityRef, CityRef, int]]) -> list[dict]:
+        return [
+            {"from_city_id": a.id, "to_city_id": b.id, "distance_km": km, "is_manual": False}
+            for a, b, km in fetched
+        ]
 
+    def _store(self, fetched: list[tuple[CityRef, CityRef, int]]) -> None:
+        # Сохранить в БД для будущих запросов; пару, записанную параллельным промахом, пропускаем
+        CityDistanceRepository(self.session).bulkCreate(self._storeRows(fetched))
+        for city_from, city_to, distance_km in fetched:
+            recordDistance(self.session, city_from.id, city_to.id, distance_km)
 
+    async def _storeAsync(self, fetched: list[tuple[CityRef, CityRef, int]]) -> None:
+        await CityDistanceRepository(self.session).bulkCreateAsync(self._storeRows(fetched))
+        for city_from, city_to, distance_km in fetched:
+            recordDistance(self.session, city_from.id, city_to.id, distance_km)
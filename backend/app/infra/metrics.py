@@ -0,0 +1,159 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Iterator, Sequence
+
+
+# Границы корзин гистограмм длительностей, мс
+DEFAULT_BUCKETS_MS: tuple[float, ...] = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# То же в секундах — единицы, принятые в Prometheus
+SECONDS_BUCKETS: tuple[float, ...] = tuple(b / 1000 for b in DEFAULT_BUCKETS_MS)
+
+# Метки метрики: упорядоченные пары (имя, значение)
+Labels = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин (как в Prometheus)"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS_MS) -> None:
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # последняя корзина — +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> tuple[list[tuple[float, int]], int, float]:
+        """Накопительные счетчики по корзинам (le, count), общее число и сумма"""
+        with self._lock:
+            counts = list(self._counts)
+            total, value_sum = self._count, self._sum
+        cumulative = []
+        running = 0
+        for le, n in zip((*self.buckets, float("inf")), counts):
+            running += n
+            cumulative.append((le, running))
+        return cumulative, total, value_sum
+
+
+class Counter:
+    def __init__(self) -> None:
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatLabels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _formatNumber(value: float) -> str:
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class MetricsRegistry:
+    """
+    Процессный реестр метрик с выводом в текстовом формате Prometheus.
+
+    Серия (имя + метки) создается при первом обращении; повторные обращения — это
+    поиск в словаре без блокировки, поэтому измерения можно оставлять включенными.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._help: dict[str, tuple[str, str]] = {}
+        self._histograms: dict[tuple[str, Labels], Histogram] = {}
+        self._counters: dict[tuple[str, Labels], Counter] = {}
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._help[name] = (kind, help_text)
+
+    def histogram(self, name: str, labels: Labels = (), buckets: Sequence[float] = SECONDS_BUCKETS) -> Histogram:
+        key = (name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(buckets))
+        return histogram
+
+    def counter(self, name: str, labels: Labels = ()) -> Counter:
+        key = (name, labels)
+        counter = self._counters.get(key)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(key, Counter())
+        return counter
+
+    def render(self) -> str:
+        with self._lock:
+            histograms = sorted(self._histograms.items(), key=lambda x: x[0])
+            counters = sorted(self._counters.items(), key=lambda x: x[0])
+
+        lines: list[str] = []
+        described: set[str] = set()
+
+        def header(name: str, default_kind: str) -> None:
+            if name in described:
+                return
+            described.add(name)
+            kind, help_text = self._help.get(name, (default_kind, ""))
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), counter in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_formatLabels(labels)} {counter.value}")
+
+        for (name, labels), histogram in histograms:
+            header(name, "histogram")
+            buckets, count, total = histogram.snapshot()
+            for le, n in buckets:
+                lines.append(f"{name}_bucket{_formatLabels((*labels, ('le', _formatNumber(le))))} {n}")
+            lines.append(f"{name}_sum{_formatLabels(labels)} {total!r}")
+            lines.append(f"{name}_count{_formatLabels(labels)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_METRIC = "pricing_stage_duration_seconds"
+registry.describe(
+    STAGE_METRIC,
+    "histogram",
+    "Duration of pricing and distance lookup stages",
+)
+
+
+@contextmanager
+def timeStage(operation: str, stage: str) -> Iterator[None]:
+    """Записывает длительность блока в гистограмму этапа operation/stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.histogram(STAGE_METRIC, (("operation", operation), ("stage", stage))).observe(
+            time.perf_counter() - started
+        )
@@ -0,0 +1,104 @@
+import threading
+import time
+from dataclasses import dataclass, field
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.infra.metrics import Histogram
+
+
+@dataclass
+class PoolMetrics:
+    """Счетчики пула соединений одного engine; заполняются событиями SQLAlchemy"""
+
+    name: str
+    engine: Engine
+    connects: int = 0
+    checkouts: int = 0
+    checkins: int = 0
+    checkout_timeouts: int = 0
+    invalidations: int = 0
+    pre_ping_failures: int = 0
+    checkout_wait_ms: Histogram = field(default_factory=Histogram)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def incr(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def state(self) -> dict[str, int | None]:
+        """Текущее состояние пула; для пулов без очереди (SQLite) часть полей неизвестна"""
+        pool = self.engine.pool  # после dispose() у engine новый пул
+        if not isinstance(pool, QueuePool):
+            return {"size": None, "checked_out": None, "idle": None, "overflow": None}
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            # overflow() отрицателен, пока не заняты все постоянные соединения
+            "overflow": max(0, pool.overflow()),
+        }
+
+
+_pools: dict[str, PoolMetrics] = {}
+_pools_lock = threading.Lock()
+
+
+def listPoolMetrics() -> list[PoolMetrics]:
+    with _pools_lock:
+        return list(_pools.values())
+
+
+class _TimedCheckoutMixin:
+    """Замер ожидания соединения: у пула нет события «до checkout», поэтому оборачиваем _do_get"""
+
+    _metrics: PoolMetrics | None = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            if self._metrics is not None:
+                self._metrics.incr("checkout_timeouts")
+            raise
+        finally:
+            if self._metrics is not None:
+                self._metrics.checkout_wait_ms.observe((time.perf_counter() - started) * 1000)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool._metrics = self._metrics
+        return pool
+
+
+class TimedQueuePool(_TimedCheckoutMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def instrumentEngine(engine: Engine, name: str) -> PoolMetrics:
+    """Подписывает счетчики на события пула и engine и регистрирует их под именем name"""
+    pool = engine.pool
+    metrics = PoolMetrics(name=name, engine=engine)
+    if isinstance(pool, _TimedCheckoutMixin):
+        pool._metrics = metrics
+
+    event.listen(pool, "connect", lambda *_: metrics.incr("connects"))
+    event.listen(pool, "checkout", lambda *_: metrics.incr("checkouts"))
+    event.listen(pool, "checkin", lambda *_: metrics.incr("checkins"))
+    event.listen(pool, "invalidate", lambda *_: metrics.incr("invalidations"))
+
+    @event.listens_for(engine, "handle_error")
+    def _countPrePingFailure(context) -> None:
+        if context.is_pre_ping:
+            metrics.incr("pre_ping_failures")
+
+    with _pools_lock:
+        _pools[name] = metrics
+    return metrics
@@ -0,0 +1,182 @@
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.infra.config import getSettings
+from app.repositories.models import City, FixedRoute, Tariff
+
+
+# Флаг в session.info: справочники изменены, кеш надо сбросить после commit
+_DIRTY_KEY = "reference_data_changed"
+
+
+@dataclass(frozen=True)
+class CityRef:
+    id: int
+    name: str
+    is_active: bool
+    latitude: float | None
+    longitude: float | None
+
+
+@dataclass(frozen=True)
+class TariffRates:
+    price_per_km_le_1000: int
+    price_per_km_gt_1000: int
+
+
+@dataclass(frozen=True)
+class ReferenceSnapshot:
+    """Неизменяемый снимок справочников, из которого читает расчет стоимости"""
+
+    version: int
+    cities_by_name: dict[str, CityRef]
+    cities_by_id: dict[int, CityRef]
+    # (from_city_id, to_city_id) → фиксированная цена
+    fixed_routes: dict[tuple[int, int], int]
+    tariffs_by_month: dict[int, TariffRates]
+
+    def getCity(self, name: str) -> CityRef | None:
+        return self.cities_by_name.get(name)
+
+    def getFixedPrice(self, from_city: str, to_city: str) -> int | None:
+        city_from, city_to = self.cities_by_name.get(from_city), self.cities_by_name.get(to_city)
+        if city_from is None or city_to is None:
+            return None
+        return self.fixed_routes.get((city_from.id, city_to.id))
+
+    def getTariff(self, month: int) -> TariffRates | None:
+        return self.tariffs_by_month.get(month)
+
+
+def loadSnapshot(session: Session, version: int = 0) -> ReferenceSnapshot:
+    cities = session.execute(select(City)).scalars().all()
+    refs = [CityRef(c.id, c.name, bool(c.is_active), c.latitude, c.longitude) for c in cities]
+
+    # Маршрут уникален по паре id (ux_fixed_routes_from_to)
+    fixed_routes = {
+        (from_city_id, to_city_id): int(fixed_price)
+        for from_city_id, to_city_id, fixed_price in session.execute(
+            select(FixedRoute.from_city_id, FixedRoute.to_city_id, FixedRoute.fixed_price)
+        )
+    }
+
+    # Как в TariffRepository.getForDate: на месяц действует тариф с наибольшим id
+    tariffs: dict[int, TariffRates] = {}
+    for t in session.execute(select(Tariff).order_by(Tariff.id.asc())).scalars():
+        tariffs[t.month] = TariffRates(int(t.price_per_km_le_1000), int(t.price_per_km_gt_1000))
+
+    return ReferenceSnapshot(
+        version=version,
+        cities_by_name={r.name: r for r in refs},
+        cities_by_id={r.id: r for r in refs},
+        fixed_routes=fixed_routes,
+        tariffs_by_month=tariffs,
+    )
+
+
+@dataclass
+class _Entry:
+    snapshot: ReferenceSnapshot
+    loaded_at: float
+
+
+class ReferenceCache:
+    """
+    Процессный версионированный кеш справочников.
+
+    Снимок хранится отдельно для каждого engine и перечитывается, если версия кеша
+    изменилась (запись справочника в этом процессе) или истек TTL (запись в другом воркере).
+    """
+
+    def __init__(self, ttl_seconds: float | None = None) -> None:
+        self.ttl_seconds = (
+            ttl_seconds if ttl_seconds is not None else getSettings().reference_cache_ttl_seconds
+        )
+        self._lock = threading.Lock()
+        self._version = 0
+        self._entries: "weakref.WeakKeyDictionary[object, _Entry]" = weakref.WeakKeyDictionary()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def _isFresh(self, entry: _Entry | None) -> bool:
+        return (
+            entry is not None
+            and entry.snapshot.version == self._version
+            and time.monotonic() - entry.loaded_at < self.ttl_seconds
+        )
+
+    @staticmethod
+    def _key(session: Session | AsyncSession) -> object:
+        # У AsyncSession get_bind возвращает синхронный Engine, лежащий под AsyncEngine
+        bind = session.get_bind()
+        return getattr(bind, "engine", bind)
+
+    def get(self, session: Session) -> ReferenceSnapshot:
+        key = self._key(session)
+        entry = self._entries.get(key)
+        if self._isFresh(entry):
+            return entry.snapshot
+        with self._lock:
+            entry = self._entries.get(key)
+            if self._isFresh(entry):
+                return entry.snapshot
+            # Версию фиксируем до чтения: если справочник изменится во время загрузки,
+            # снимок сразу окажется устаревшим
+            version = self._version
+            snapshot = loadSnapshot(session, version)
+            self._entries[key] = _Entry(snapshot=snapshot, loaded_at=time.monotonic())
+            return snapshot
+
+    async def getAsync(self, session: AsyncSession) -> ReferenceSnapshot:
+        """
+        Вариант get для AsyncSession. Блокировку на время загрузки не держим (поток
+        цикла событий общий), поэтому при промахе снимок могут прочитать несколько корутин.
+        """
+        key = self._key(session)
+        entry = self._entries.get(key)
+        if self._isFresh(entry):
+            return entry.snapshot
+        version = self._version
+        snapshot = await session.run_sync(loadSnapshot, version)
+        with self._lock:
+            self._entries[key] = _Entry(snapshot=snapshot, loaded_at=time.monotonic())
+        return snapshot
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._version += 1
+
+
+referenceCache = ReferenceCache()
+
+
+def getReferenceSnapshot(session: Session) -> ReferenceSnapshot:
+    return referenceCache.get(session)
+
+
+async def getReferenceSnapshotAsync(session: AsyncSession) -> ReferenceSnapshot:
+    return await referenceCache.getAsync(session)
+
+
+def invalidateReferenceData(session: Session | AsyncSession) -> None:
+    """Помечает сессию: после успешного commit снимок справочников будет сброшен"""
+    session.info[_DIRTY_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidateAfterCommit(session: Session) -> None:
+    if session.info.pop(_DIRTY_KEY, False):
+        referenceCache.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discardAfterRollback(session: Session) -> None:
+    session.info.pop(_DIRTY_KEY, None)
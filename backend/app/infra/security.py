@@ -1,5 +1,18 @@
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+
 from passlib.context import CryptContext
 
+from app.infra.config import getSettings
+
 
 pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -12,3 +25,108 @@ def verifyPassword(password: str, password_hash: str) -> bool:
     return pwd_ctx.verify(password, password_hash)
 
 
+@dataclass(frozen=True)
+class AdminSession:
+    admin_id: int
+    expires_at: int
+
+
+def checkSessionSecret() -> None:
+    """
+    Проверка при старте воркера. Без ADMIN_SESSION_SECRET каждый процесс подписывает своим
+    случайным ключом, и токен, выданный одним воркером, отвергают остальные; такое
+    допустимо только в режиме разработки (API_DEBUG).
+    """
+    settings = getSettings()
+    if not settings.admin_session_secret and not settings.api_debug:
+        raise RuntimeError("ADMIN_SESSION_SECRET is required when API_DEBUG is off")
+
+
+@lru_cache(maxsize=1)
+def _signingKey() -> bytes:
+    secret = getSettings().admin_session_secret
+    return secret.encode() if secret else secrets.token_bytes(32)
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_signingKey(), payload.encode(), hashlib.sha256).digest())
+
+
+def issueSessionToken(admin_id: int, now: float | None = None) -> tuple[str, AdminSession]:
+    """Подписанный токен «payload.signature»; payload — id админа и время истечения"""
+    now = time.time() if now is None else now
+    session = AdminSession(admin_id=admin_id, expires_at=int(now) + getSettings().admin_session_ttl_seconds)
+    payload = _b64encode(json.dumps({"sub": session.admin_id, "exp": session.expires_at}).encode())
+    return f"{payload}.{_sign(payload)}", session
+
+
+def verifySessionToken(token: str, now: float | None = None) -> AdminSession | None:
+    """Проверка подписи (за постоянное время) и срока действия, без обращения к БД"""
+    payload, _, signature = token.partition(".")
+    if not payload or not hmac.compare_digest(signature.encode(), _sign(payload).encode()):
+        return None
+    try:
+        data = json.loads(_b64decode(payload))
+        session = AdminSession(admin_id=int(data["sub"]), expires_at=int(data["exp"]))
+    except (ValueError, KeyError, TypeError):
+        return None
+    now = time.time() if now is None else now
+    return session if session.expires_at > now else None
+
+
+class VerifiedCredentialCache:
+    """
+    Ограниченный LRU-кеш успешно проверенных пар логин/пароль для HTTP Basic.
+
+    Хранится только HMAC от пары, не сам пароль. Смена пароля начинает действовать
+    для закешированной пары не позже чем через ttl_seconds.
+    """
+
+    def __init__(self, maxsize: int | None = None, ttl_seconds: float | None = None) -> None:
+        settings = getSettings()
+        self.maxsize = maxsize if maxsize is not None else settings.admin_basic_cache_size
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.admin_basic_cache_ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[bytes, tuple[int, float]]" = OrderedDict()
+
+    @staticmethod
+    def _key(login: str, password: str) -> bytes:
+        return hmac.new(_signingKey(), f"{login}\0{password}".encode(), hashlib.sha256).digest()
+
+    def get(self, login: str, password: str) -> int | None:
+        key = self._key(login, password)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            admin_id, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return admin_id
+
+    def put(self, login: str, password: str, admin_id: int) -> None:
+        if self.maxsize <= 0:
+            return
+        key = self._key(login, password)
+        with self._lock:
+            self._entries[key] = (admin_id, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+basicCredentialCache = VerifiedCredentialCache()
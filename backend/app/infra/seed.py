@@ -1,16 +1,64 @@
 import json
 import os
-from sqlalchemy import select
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
 from sqlalchemy.orm import Session
 
-from app.infra.db import Base, engine
-from app.repositories.models import City, FixedRoute, Tariff, Admin, CityDistance
+from app.infra.db import Base
+from app.infra.distance.distance_index import recordDistance
+from app.infra.reference_cache import invalidateReferenceData
+from app.repositories.models import City, FixedRoute, Tariff, Admin, CityDistance, SeedVersion
 from app.infra.security import hashPassword
 
 
+# Увеличить при изменении начальных данных ниже — bootstrap выполнится заново
+SEED_NAME = "bootstrap"
+SEED_VERSION = 1
+# Ключ advisory-блокировки PostgreSQL, под которой заполняет данные один воркер
+_BOOTSTRAP_LOCK_KEY = 0x5EED0001
+
+
 def runBootstrap(session: Session) -> None:
+    """
+    Идемпотентное заполнение начальных данных. Если версия в seed_versions актуальна,
+    стоит одного запроса по первичному ключу. Иначе воркер берет advisory-блокировку
+    до конца транзакции, перепроверяет версию и заполняет данные; остальные воркеры
+    ждут блокировку и видят уже записанную версию.
+
+    Ожидает новую сессию (при первом запуске она откатывается); commit делает вызывающий код.
+    """
+    if _seedIsCurrent(session):
+        return
+
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _BOOTSTRAP_LOCK_KEY})
+
     # Create tables in dev bootstrap (Alembic is recommended for production)
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=session.connection())
+    if _seedIsCurrent(session):
+        return
+
+    _seedReferenceData(session)
+    marker = session.get(SeedVersion, SEED_NAME)
+    if marker is None:
+        session.add(SeedVersion(name=SEED_NAME, version=SEED_VERSION))
+    else:
+        marker.version = SEED_VERSION
+
+
+def _seedIsCurrent(session: Session) -> bool:
+    try:
+        version = session.execute(
+            select(SeedVersion.version).where(SeedVersion.name == SEED_NAME)
+        ).scalar()
+    except (OperationalError, ProgrammingError):
+        # Первый запуск: таблицы еще нет
+        session.rollback()
+        return False
+    return version is not None and version >= SEED_VERSION
+
+
+def _seedReferenceData(session: Session) -> None:
 
     # Cities with coordinates
     city_coords = {
@@ -35,16 +83,17 @@ def runBootstrap(session: Session) -> None:
     session.flush()  # Чтобы получить ID городов
 
     # Fixed routes
-    existing_fr = {(fr.from_city, fr.to_city) for fr in session.execute(select(FixedRoute)).scalars().all()}
+    city_ids = {c.name: c.id for c in session.execute(select(City)).scalars().all()}
+    existing_fr = set(session.execute(select(FixedRoute.from_city_id, FixedRoute.to_city_id)).all())
     for fr in [
         ("Москва", "Сочи", 200_000),
         ("Сочи", "Москва", 200_000),
         ("Москва", "Бишкек", 350_000),
         ("Бишкек", "Москва", 350_000),
     ]:
-        key = (fr[0], fr[1])
+        key = (city_ids[fr[0]], city_ids[fr[1]])
         if key not in existing_fr:
-            session.add(FixedRoute(from_city=fr[0], to_city=fr[1], fixed_price=fr[2]))
+            session.add(FixedRoute(from_city_id=key[0], to_city_id=key[1], fixed_price=fr[2]))
 
     # Tariffs for months (defaults: 150 and 100)
     months = {t.month for t in session.execute(select(Tariff)).scalars().all()}
@@ -60,6 +109,8 @@ def runBootstrap(session: Session) -> None:
     # Migrate offline_matrix.json to city_distances table
     _migrateOfflineMatrix(session)
 
+    invalidateReferenceData(session)
+
 
 def _migrateOfflineMatrix(session: Session) -> None:
     """Мигрирует данные из offline_matrix.json в таблицу city_distances"""
@@ -107,6 +158,7 @@ def _migrateOfflineMatrix(session: Session) -> None:
                 distance_km=int(distance_km),
                 is_manual=True  # Помечаем как ручное, т.к. из исходного файла
             ))
+            recordDistance(session, from_city.id, to_city.id, int(distance_km))
             
             # Добавить в existing, чтобы не создавать обратное направление дважды
             existing_distances.add(pair)
@@ -1,9 +1,12 @@
 from fastapi import FastAPI, Request, HTTPException
 import logging
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from sqlalchemy.orm import Session
 
+from app.api.middleware import RequestMetricsMiddleware
+from app.infra.metrics import registry
+
 
 def createApp() -> FastAPI:
     app = FastAPI(title="Shipment API", version="1.0.0")
@@ -16,6 +19,7 @@ def createApp() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    app.add_middleware(RequestMetricsMiddleware)
 
     # Routers are included in app/api/v1/__init__.py to keep main minimal
     try:
@@ -26,6 +30,12 @@ def createApp() -> FastAPI:
     except Exception as e:
         logger.exception("Failed to include API v1 router: %s", e)
 
+    @app.on_event("startup")
+    def _checkAdminSessionSecret() -> None:
+        from app.infra.security import checkSessionSecret
+
+        checkSessionSecret()
+
     # Dev bootstrap seed
     try:
         from app.infra.db import SessionLocal  # type: ignore
@@ -33,6 +43,10 @@ def createApp() -> FastAPI:
 
         @app.on_event("startup")
         def _seed() -> None:
+            from app.infra.config import getSettings
+
+            if not getSettings().bootstrap_on_startup:
+                return
             session: Session = SessionLocal()
             try:
                 runBootstrap(session)
@@ -42,6 +56,17 @@ def createApp() -> FastAPI:
     except Exception as e:
         logger.exception("Startup seed failed: %s", e)
 
+    @app.on_event("shutdown")
+    async def _closeOsrmClients() -> None:
+        from app.infra.distance.osrm_client import closeClients
+
+        await closeClients()
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics() -> PlainTextResponse:
+        # Текстовый формат Prometheus; доступ к эндпоинту ограничивается на уровне прокси
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
     @app.exception_handler(HTTPException)
     def http_exception_handler(_: Request, exc: HTTPException):
         # Normalize error to {"error": message}
@@ -1,26 +1,84 @@
-from typing import Optional
+from typing import Iterable, Optional
 
-from sqlalchemy import or_
+from sqlalchemy import Insert, Select, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.repositories.models import CityDistance
+from app.repositories.models import CityDistance, canonicalPair
 
 
 class CityDistanceRepository:
-    def __init__(self, session: Session) -> None:
+    """
+    Запросы строятся один раз и исполняются синхронно (Session) или в методах *Async
+    (AsyncSession) — репозиторий работает с той сессией, с которой создан.
+    """
+
+    def __init__(self, session: Session | AsyncSession) -> None:
         self.session = session
 
     def listAll(self) -> list[CityDistance]:
         return list(self.session.query(CityDistance).all())
 
+    @staticmethod
+    def _findStmt(from_city_id: int, to_city_id: int) -> Select:
+        # Одна проба уникального индекса по каноническому ключу
+        low, high = canonicalPair(from_city_id, to_city_id)
+        return select(CityDistance).where(CityDistance.from_city_id == low, CityDistance.to_city_id == high)
+
     def find(self, from_city_id: int, to_city_id: int) -> Optional[CityDistance]:
         """Ищет расстояние между городами (в обе стороны)"""
-        return self.session.query(CityDistance).filter(
-            or_(
-                (CityDistance.from_city_id == from_city_id) & (CityDistance.to_city_id == to_city_id),
-                (CityDistance.from_city_id == to_city_id) & (CityDistance.to_city_id == from_city_id)
-            )
-        ).first()
+        return self.session.execute(self._findStmt(from_city_id, to_city_id)).scalars().first()
+
+    async def findAsync(self, from_city_id: int, to_city_id: int) -> Optional[CityDistance]:
+        result = await self.session.execute(self._findStmt(from_city_id, to_city_id))
+        return result.scalars().first()
+
+    @staticmethod
+    def _findManyStmt(pairs: Iterable[tuple[int, int]]) -> Optional[Select]:
+        keys = {canonicalPair(from_city_id, to_city_id) for from_city_id, to_city_id in pairs}
+        if not keys:
+            return None
+        return (
+            select(CityDistance.from_city_id, CityDistance.to_city_id, CityDistance.distance_km)
+            .where(tuple_(CityDistance.from_city_id, CityDistance.to_city_id).in_(sorted(keys)))
+        )
+
+    def findMany(self, pairs: Iterable[tuple[int, int]]) -> dict[tuple[int, int], int]:
+        """
+        Загружает расстояния для набора пар городов одним запросом.
+        Результат содержит обе ориентации каждой найденной пары.
+        """
+        stmt = self._findManyStmt(pairs)
+        if stmt is None:
+            return {}
+        return self._toMap(self.session.execute(stmt).all())
+
+    async def findManyAsync(self, pairs: Iterable[tuple[int, int]]) -> dict[tuple[int, int], int]:
+        stmt = self._findManyStmt(pairs)
+        if stmt is None:
+            return {}
+        return self._toMap((await self.session.execute(stmt)).all())
+
+    @staticmethod
+    def _loadMapStmt() -> Select:
+        return select(CityDistance.from_city_id, CityDistance.to_city_id, CityDistance.distance_km)
+
+    def loadMap(self) -> dict[tuple[int, int], int]:
+        """Все расстояния в виде словаря (обе ориентации каждой пары)"""
+        return self._toMap(self.session.execute(self._loadMapStmt()).all())
+
+    async def loadMapAsync(self) -> dict[tuple[int, int], int]:
+        return self._toMap((await self.session.execute(self._loadMapStmt())).all())
+
+    @staticmethod
+    def _toMap(rows) -> dict[tuple[int, int], int]:
+        # Пара хранится одной строкой; в словарь кладутся обе ориентации
+        result: dict[tuple[int, int], int] = {}
+        for from_city_id, to_city_id, distance_km in rows:
+            result[(from_city_id, to_city_id)] = distance_km
+            result[(to_city_id, from_city_id)] = distance_km
+        return result
 
     def create(self, from_city_id: int, to_city_id: int, distance_km: int, is_manual: bool = True) -> CityDistance:
         obj = CityDistance(
@@ -33,9 +91,35 @@ class CityDistanceRepository:
         self.session.flush()
         return obj
 
-    def delete(self, distance_id: int) -> None:
+    def _bulkCreateStmt(self, rows: list[dict]) -> Insert:
+        # INSERT ... ON CONFLICT DO NOTHING: пару, которую параллельно записал другой
+        # запрос или воркер, пропускаем вместо ошибки уникального индекса
+        dialect = self.session.bind.dialect.name
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        values = {}
+        for row in rows:
+            key = canonicalPair(row["from_city_id"], row["to_city_id"])
+            values.setdefault(key, dict(row, from_city_id=key[0], to_city_id=key[1]))
+        return insert(CityDistance).values(list(values.values())).on_conflict_do_nothing(
+            index_elements=[CityDistance.from_city_id, CityDistance.to_city_id]
+        )
+
+    def bulkCreate(self, rows: list[dict]) -> int:
+        """Вставка пачки расстояний одним запросом; уже известные пары пропускаются. Возвращает число вставленных"""
+        if not rows:
+            return 0
+        return self.session.execute(self._bulkCreateStmt(rows)).rowcount
+
+    async def bulkCreateAsync(self, rows: list[dict]) -> int:
+        if not rows:
+            return 0
+        return (await self.session.execute(self._bulkCreateStmt(rows))).rowcount
+
+    def delete(self, distance_id: int) -> Optional[CityDistance]:
+        """Удаляет расстояние; возвращает удаленную запись или None"""
         obj = self.session.get(CityDistance, distance_id)
         if obj:
             self.session.delete(obj)
             self.session.flush()
+        return obj
 
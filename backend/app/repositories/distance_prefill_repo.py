@@ -0,0 +1,45 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Update, update
+from sqlalchemy.orm import Session
+
+from app.repositories.models import DistancePrefillRun
+
+
+class DistancePrefillRepository:
+    """Состояние предзаполнения расстояний: одна запись на город, последний запуск"""
+
+    def __init__(self, session: Session) -> None:
+        self.session = session
+
+    def get(self, city_id: int) -> Optional[DistancePrefillRun]:
+        return self.session.get(DistancePrefillRun, city_id)
+
+    def start(self, city_id: int) -> DistancePrefillRun:
+        """Создает запись запуска или сбрасывает счетчики предыдущего"""
+        run = self.get(city_id)
+        if run is None:
+            run = DistancePrefillRun(city_id=city_id)
+            self.session.add(run)
+        run.total_pairs = 0
+        run.processed_pairs = 0
+        run.inserted = 0
+        run.failed = 0
+        run.finished = False
+        run.error = None
+        run.updated_at = datetime.utcnow()
+        self.session.flush()
+        return run
+
+    @staticmethod
+    def _updateStmt(city_id: int, values: dict) -> Update:
+        return (
+            update(DistancePrefillRun)
+            .where(DistancePrefillRun.city_id == city_id)
+            .values(**values, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+
+    def update(self, city_id: int, **values) -> None:
+        self.session.execute(self._updateStmt(city_id, values))
@@ -1,18 +1,32 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import Row, select
+from sqlalchemy.orm import Session, aliased
 
 from app.repositories.base import SqlAlchemyRepository
-from app.repositories.models import FixedRoute
+from app.repositories.models import City, FixedRoute
 
 
 class FixedRouteRepository(SqlAlchemyRepository[FixedRoute]):
     def __init__(self, session: Session) -> None:
         super().__init__(session, FixedRoute)
 
-    def find(self, from_city: str, to_city: str) -> FixedRoute | None:
-        return (
-            self.session.query(FixedRoute)
-            .filter(FixedRoute.from_city == from_city, FixedRoute.to_city == to_city)
-            .first()
-        )
-
+    def find(self, from_city_id: int, to_city_id: int) -> FixedRoute | None:
+        """Проба уникального индекса ux_fixed_routes_from_to"""
+        return self.session.execute(
+            select(FixedRoute).where(FixedRoute.from_city_id == from_city_id, FixedRoute.to_city_id == to_city_id)
+        ).scalars().first()
 
+    def listDtoRows(self) -> list[Row]:
+        """Маршруты с названиями городов одним запросом"""
+        city_from, city_to = aliased(City), aliased(City)
+        return self.session.execute(
+            select(
+                FixedRoute.from_city_id,
+                FixedRoute.to_city_id,
+                city_from.name.label("from_city"),
+                city_to.name.label("to_city"),
+                FixedRoute.fixed_price,
+            )
+            .join(city_from, city_from.id == FixedRoute.from_city_id)
+            .join(city_to, city_to.id == FixedRoute.to_city_id)
+            .order_by(FixedRoute.id.asc())
+        ).all()
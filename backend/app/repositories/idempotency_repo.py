@@ -0,0 +1,65 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Delete, Insert, Select, Update, delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.repositories.models import IdempotencyKey
+
+
+class IdempotencyRepository:
+    """Хранилище ключ → ответ для запросов с заголовком Idempotency-Key"""
+
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    def _claimStmt(self, key: str, request_hash: str, expires_at: datetime) -> Insert:
+        # INSERT ... ON CONFLICT DO NOTHING: в PostgreSQL вставка того же ключа ждет,
+        # пока транзакция первого запроса не завершится
+        dialect = self.session.bind.dialect.name
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        now = datetime.utcnow()
+        return insert(IdempotencyKey).values(
+            key=key,
+            request_hash=request_hash,
+            expires_at=expires_at,
+            created_at=now,
+            updated_at=now,
+        ).on_conflict_do_nothing(index_elements=[IdempotencyKey.key])
+
+    async def claimAsync(self, key: str, request_hash: str, expires_at: datetime) -> bool:
+        """Занимает ключ в текущей транзакции; False — ключ уже есть"""
+        result = await self.session.execute(self._claimStmt(key, request_hash, expires_at))
+        return result.rowcount > 0
+
+    @staticmethod
+    def _getStmt(key: str) -> Select:
+        return select(IdempotencyKey).where(IdempotencyKey.key == key)
+
+    async def getAsync(self, key: str) -> Optional[IdempotencyKey]:
+        return (await self.session.execute(self._getStmt(key))).scalars().first()
+
+    @staticmethod
+    def _saveStmt(key: str, status_code: int, response_body: str) -> Update:
+        return (
+            update(IdempotencyKey)
+            .where(IdempotencyKey.key == key)
+            .values(status_code=status_code, response_body=response_body, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+
+    async def saveResponseAsync(self, key: str, status_code: int, response_body: str) -> None:
+        await self.session.execute(self._saveStmt(key, status_code, response_body))
+
+    @staticmethod
+    def _deleteExpiredStmt(now: datetime, key: Optional[str] = None) -> Delete:
+        stmt = delete(IdempotencyKey).where(IdempotencyKey.expires_at <= now)
+        if key is not None:
+            stmt = stmt.where(IdempotencyKey.key == key)
+        return stmt.execution_options(synchronize_session=False)
+
+    async def deleteExpiredAsync(self, now: datetime, key: Optional[str] = None) -> int:
+        """Удаляет просроченные ключи (по индексу expires_at); с key — только этот ключ"""
+        result = await self.session.execute(self._deleteExpiredStmt(now, key))
+        return result.rowcount
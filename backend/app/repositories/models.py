@@ -3,14 +3,19 @@ from enum import Enum
 from typing import Optional
 
 from sqlalchemy import (
+    CheckConstraint,
     String,
     Integer,
+    BigInteger,
     Boolean,
     ForeignKey,
     Date,
     Index,
     Enum as SAEnum,
     Float,
+    Text,
+    DateTime,
+    event,
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -56,13 +61,33 @@ class FixedRoute(Base):
     __tablename__ = "fixed_routes"
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    from_city: Mapped[str] = mapped_column(String(120))
-    to_city: Mapped[str] = mapped_column(String(120))
+    from_city_id: Mapped[int] = mapped_column(ForeignKey("cities.id"))
+    to_city_id: Mapped[int] = mapped_column(ForeignKey("cities.id"))
     fixed_price: Mapped[int] = mapped_column(Integer)
 
+    from_city: Mapped["City"] = relationship(foreign_keys=[from_city_id])
+    to_city: Mapped["City"] = relationship(foreign_keys=[to_city_id])
+
+
+# Направление важно: Москва→Сочи и Сочи→Москва — разные маршруты
+Index("ux_fixed_routes_from_to", FixedRoute.from_city_id, FixedRoute.to_city_id, unique=True)
+
+
+def canonicalPair(city_a_id: int, city_b_id: int) -> tuple[int, int]:
+    """Ключ пары городов без направления: (меньший id, больший id)"""
+    return (city_a_id, city_b_id) if city_a_id <= city_b_id else (city_b_id, city_a_id)
+
 
 class CityDistance(Base):
+    """
+    Расстояние не зависит от направления, поэтому пара хранится одной строкой
+    в каноническом порядке: from_city_id <= to_city_id.
+    """
+
     __tablename__ = "city_distances"
+    __table_args__ = (
+        CheckConstraint("from_city_id <= to_city_id", name="ck_city_distances_canonical"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     from_city_id: Mapped[int] = mapped_column(ForeignKey("cities.id"))
@@ -74,6 +99,16 @@ class CityDistance(Base):
     to_city: Mapped["City"] = relationship(foreign_keys=[to_city_id])
 
 
+Index("ux_city_distances_pair", CityDistance.from_city_id, CityDistance.to_city_id, unique=True)
+
+
+@event.listens_for(CityDistance, "before_insert")
+@event.listens_for(CityDistance, "before_update")
+def _canonicalOrder(mapper, connection, target: CityDistance) -> None:
+    # Объекты, созданные в любом направлении, сохраняются под каноническим ключом
+    target.from_city_id, target.to_city_id = canonicalPair(target.from_city_id, target.to_city_id)
+
+
 class Order(Base):
     __tablename__ = "orders"
 
@@ -101,7 +136,9 @@ class Order(Base):
 
 
 Index("ix_orders_user_id", Order.user_id)
-Index("ix_orders_start_date", Order.start_date)
+# Составные индексы под сортировки списка заказов: (ключ, id) для пагинации по курсору
+Index("ix_orders_start_date_id", Order.start_date, Order.id)
+Index("ix_orders_transport_price_id", Order.transport_price, Order.id)
 Index("ix_orders_payment_status", Order.payment_status)
 Index("ix_orders_from_to", Order.from_city_id, Order.to_city_id)
 
@@ -114,3 +151,67 @@ class Admin(Base):
     password_hash: Mapped[str] = mapped_column(String(256))
 
 
+
+
+class SeedVersion(Base):
+    """Версия примененных начальных данных: bootstrap проверяет ее одним запросом по ключу"""
+
+    __tablename__ = "seed_versions"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer)
+
+
+class IdempotencyKey(Base):
+    """
+    Ответ на запрос с заголовком Idempotency-Key. Пока запрос выполняется, status_code
+    пустой; повтор с тем же ключом возвращает сохраненный ответ.
+    """
+
+    __tablename__ = "idempotency_keys"
+
+    key: Mapped[str] = mapped_column(String(128), primary_key=True)
+    # Отпечаток запроса: тот же ключ с другим телом — ошибка клиента
+    request_hash: Mapped[str] = mapped_column(String(64))
+    status_code: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    response_body: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime)
+
+
+Index("ix_idempotency_keys_expires_at", IdempotencyKey.expires_at)
+
+
+class OrderDailyStat(Base):
+    """
+    Агрегаты заказов по дню начала перевозки, маршруту и статусу оплаты. Обновляются
+    в той же транзакции, что и заказы; аналитика читает их вместо таблицы orders.
+    """
+
+    __tablename__ = "order_daily_stats"
+
+    # orders.start_date; в API — start_day / start_month
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    from_city_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    to_city_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    payment_status: Mapped[PaymentStatus] = mapped_column(SAEnum(PaymentStatus), primary_key=True)
+    orders_count: Mapped[int] = mapped_column(Integer, default=0)
+    transport_price_sum: Mapped[int] = mapped_column(BigInteger, default=0)
+    insurance_price_sum: Mapped[int] = mapped_column(BigInteger, default=0)
+    distance_km_sum: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+class DistancePrefillRun(Base):
+    """
+    Последний запуск предзаполнения расстояний для города. Счетчики обновляются в той же
+    транзакции, что и вставка очередной пачки, поэтому прогресс виден любому воркеру.
+    """
+
+    __tablename__ = "distance_prefill_runs"
+
+    city_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    total_pairs: Mapped[int] = mapped_column(Integer, default=0)
+    processed_pairs: Mapped[int] = mapped_column(Integer, default=0)
+    inserted: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    finished: Mapped[bool] = mapped_column(Boolean, default=False)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
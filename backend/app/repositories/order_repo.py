@@ -1,24 +1,96 @@
+import base64
+import json
 from datetime import date
-from typing import Optional
+from typing import Iterator, Optional, Sequence
 import math
 
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import Delete, Insert, Integer, Row, Select, Update, cast, delete, extract, func, insert, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
 from app.repositories.base import SqlAlchemyRepository
 from app.repositories.models import Order, PaymentStatus, User
+from app.repositories.order_stats_repo import ORDER_STATS_COLUMNS, OrderStatsRepository
+
+
+# Способы подсчета общего числа строк для списка заказов
+TOTALS_EXACT = "exact"
+TOTALS_ESTIMATED = "estimated"
+TOTALS_NONE = "none"
+
+
+# Колонки OrderDto: заказ плюс имя и телефон пользователя
+ORDER_DTO_COLUMNS = (
+    Order.id,
+    Order.created_at,
+    Order.updated_at,
+    Order.user_id,
+    User.full_name.label("user_full_name"),
+    User.phone.label("user_phone"),
+    Order.car_brand_model,
+    Order.from_city_id,
+    Order.to_city_id,
+    Order.start_date,
+    Order.distance_km,
+    Order.applied_price_per_km,
+    Order.is_fixed_route,
+    Order.transport_price,
+    Order.insurance_price,
+    Order.duration_hours,
+    Order.duration_days,
+    Order.duration_hours_remainder,
+    Order.eta_date,
+    Order.payment_status,
+)
 
 
 class OrderQueryResult:
-    def __init__(self, items: list[Order], total: int):
+    def __init__(
+        self,
+        items: list[Row],
+        total: Optional[int],
+        next_cursor: Optional[str] = None,
+        prev_cursor: Optional[str] = None,
+        has_more: bool = False,
+        total_estimated: bool = False,
+    ):
         self.items = items
         self.total = total
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.has_more = has_more
+        self.total_estimated = total_estimated
+
+
+def encodeCursor(sort: str, key: date | int, order_id: int, direction: str) -> str:
+    """Непрозрачный курсор: позиция (ключ сортировки, id) и направление листания"""
+    value = key.isoformat() if isinstance(key, date) else key
+    raw = json.dumps({"s": sort, "k": value, "id": order_id, "d": direction}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decodeCursor(cursor: str, sort: str) -> tuple[date | int, int, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if data["s"] != sort or data["d"] not in ("next", "prev"):
+            raise ValueError
+        key = date.fromisoformat(data["k"]) if sort == "date" else int(data["k"])
+        return key, int(data["id"]), data["d"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
 
 
 class OrderRepository(SqlAlchemyRepository[Order]):
-    def __init__(self, session: Session) -> None:
+    """
+    Запросы строятся общими методами _*Stmt; синхронные методы исполняют их в Session,
+    методы *Async — в AsyncSession.
+    """
+
+    def __init__(self, session: Session | AsyncSession) -> None:
         super().__init__(session, Order)
 
-    def query(
+    def _criteria(
         self,
         user_id: Optional[int] = None,
         start_from: Optional[date] = None,
@@ -26,38 +98,358 @@ class OrderRepository(SqlAlchemyRepository[Order]):
         from_city_id: Optional[int] = None,
         to_city_id: Optional[int] = None,
         payment_status: Optional[PaymentStatus] = None,
-        order_by_cost: bool = False,
-        page: int = 1,
-        limit: int = 20,
-    ) -> OrderQueryResult:
-        q = self.session.query(Order).options(joinedload(Order.user))
-        
+    ) -> list:
+        criteria = []
         if user_id is not None:
-            q = q.filter(Order.user_id == user_id)
+            criteria.append(Order.user_id == user_id)
         if start_from is not None:
-            q = q.filter(Order.start_date >= start_from)
+            criteria.append(Order.start_date >= start_from)
         if start_to is not None:
-            q = q.filter(Order.start_date <= start_to)
+            criteria.append(Order.start_date <= start_to)
         if from_city_id is not None:
-            q = q.filter(Order.from_city_id == from_city_id)
+            criteria.append(Order.from_city_id == from_city_id)
         if to_city_id is not None:
-            q = q.filter(Order.to_city_id == to_city_id)
+            criteria.append(Order.to_city_id == to_city_id)
         if payment_status is not None:
-            q = q.filter(Order.payment_status == payment_status)
-        
-        # Получаем общее количество
-        total = q.count()
-        
-        # Сортировка
+            criteria.append(Order.payment_status == payment_status)
+        return criteria
+
+    @staticmethod
+    def _rows(criteria: list) -> Select:
+        """Выборка колонок OrderDto (с данными пользователя) без загрузки ORM-объектов"""
+        return select(*ORDER_DTO_COLUMNS).join(User, User.id == Order.user_id).where(*criteria)
+
+    @staticmethod
+    def _ordered(stmt: Select, order_by_cost: bool) -> Select:
+        # id — для однозначного порядка при равных ключах
         if order_by_cost:
-            q = q.order_by(Order.transport_price.desc())
-        else:
-            q = q.order_by(Order.start_date.desc())
-        
-        # Пагинация
+            return stmt.order_by(Order.transport_price.desc(), Order.id.desc())
+        return stmt.order_by(Order.start_date.desc(), Order.id.desc())
+
+    def iterDtoRows(
+        self,
+        user_id: Optional[int] = None,
+        start_from: Optional[date] = None,
+        start_to: Optional[date] = None,
+        from_city_id: Optional[int] = None,
+        to_city_id: Optional[int] = None,
+        payment_status: Optional[PaymentStatus] = None,
+        order_by_cost: bool = False,
+        batch_size: int = 1000,
+    ) -> Iterator[Row]:
+        """
+        Потоковое чтение всех строк выборки: yield_per включает серверный курсор,
+        в памяти одновременно держится не больше batch_size строк.
+        """
+        criteria = self._criteria(user_id, start_from, start_to, from_city_id, to_city_id, payment_status)
+        stmt = self._ordered(self._rows(criteria), order_by_cost)
+        return iter(self.session.execute(stmt.execution_options(yield_per=batch_size)))
+
+    def iterPricingGroups(
+        self,
+        start_from: Optional[date] = None,
+        start_to: Optional[date] = None,
+        batch_size: int = 50_000,
+    ) -> Iterator[Sequence[Row]]:
+        """
+        Заказы, сгруппированные по всему, от чего зависит цена: месяц тарифа (1..12),
+        маршрут и расстояние, плюс orders_count. Группировка выполняется в БД, группы
+        отдаются пачками по batch_size через серверный курсор, без ORM-обработки строк.
+        """
+        criteria = self._criteria(start_from=start_from, start_to=start_to)
+        # cast: EXTRACT в PostgreSQL возвращает numeric
+        keys = (
+            cast(extract("month", Order.start_date), Integer).label("month"),
+            Order.from_city_id,
+            Order.to_city_id,
+            Order.distance_km,
+        )
+        stmt = select(*keys, func.count().label("orders_count")).where(*criteria).group_by(*keys)
+        connection = self.session.connection()
+        return connection.execution_options(yield_per=batch_size).execute(stmt).partitions()
+
+    @staticmethod
+    def _insertManyStmt() -> Insert:
+        # sort_by_parameter_order: id возвращаются в порядке переданных строк
+        return insert(Order).returning(Order.id, sort_by_parameter_order=True)
+
+    def insertMany(self, rows: list[dict]) -> list[int]:
+        """
+        Вставка пачки заказов многострочными INSERT ... RETURNING (insertmanyvalues);
+        возвращает id в порядке rows.
+        """
+        if not rows:
+            return []
+        return list(self.session.execute(self._insertManyStmt(), rows).scalars())
+
+    async def insertManyAsync(self, rows: list[dict]) -> list[int]:
+        if not rows:
+            return []
+        return list((await self.session.execute(self._insertManyStmt(), rows)).scalars())
+
+    def getDtoRows(self, order_ids: list[int]) -> dict[int, Row]:
+        """Строки OrderDto для набора заказов одним запросом"""
+        if not order_ids:
+            return {}
+        return {row.id: row for row in self.session.execute(self._rows([Order.id.in_(order_ids)]))}
+
+    async def getDtoRowsAsync(self, order_ids: list[int]) -> dict[int, Row]:
+        if not order_ids:
+            return {}
+        return {row.id: row for row in await self.session.execute(self._rows([Order.id.in_(order_ids)]))}
+
+    def getDtoRow(self, order_id: int) -> Optional[Row]:
+        return self.session.execute(self._rows([Order.id == order_id])).first()
+
+    async def getDtoRowAsync(self, order_id: int) -> Optional[Row]:
+        return (await self.session.execute(self._rows([Order.id == order_id]))).first()
+
+    @staticmethod
+    def _statsRowStmt(order_id: int) -> Select:
+        # FOR UPDATE: параллельная смена статуса того же заказа ждет, иначе обе
+        # транзакции вычли бы из агрегатов один и тот же старый статус
+        return select(*ORDER_STATS_COLUMNS).where(Order.id == order_id).with_for_update()
+
+    @staticmethod
+    def _paymentStatusStmt(order_id: int, payment_status: PaymentStatus) -> Update:
+        return (
+            update(Order)
+            .where(Order.id == order_id)
+            .values(payment_status=payment_status)
+            .execution_options(synchronize_session=False)
+        )
+
+    def setPaymentStatus(self, order_id: int, payment_status: PaymentStatus) -> bool:
+        """Обновляет статус и агрегаты order_daily_stats; False, если заказа нет"""
+        row = self.session.execute(self._statsRowStmt(order_id)).first()
+        if row is None:
+            return False
+        self.session.execute(self._paymentStatusStmt(order_id, payment_status))
+        OrderStatsRepository(self.session).move(row._mapping, payment_status)
+        return True
+
+    async def setPaymentStatusAsync(self, order_id: int, payment_status: PaymentStatus) -> bool:
+        row = (await self.session.execute(self._statsRowStmt(order_id))).first()
+        if row is None:
+            return False
+        await self.session.execute(self._paymentStatusStmt(order_id, payment_status))
+        await OrderStatsRepository(self.session).moveAsync(row._mapping, payment_status)
+        return True
+
+    @staticmethod
+    def _deleteStmt(order_id: int) -> Delete:
+        return delete(Order).where(Order.id == order_id).returning(*ORDER_STATS_COLUMNS)
+
+    def delete(self, order_id: int) -> bool:
+        """Удаляет заказ и вычитает его из агрегатов; False, если заказа нет"""
+        row = self.session.execute(self._deleteStmt(order_id)).first()
+        if row is not None:
+            OrderStatsRepository(self.session).apply([row._mapping], -1)
+        return row is not None
+
+    async def deleteAsync(self, order_id: int) -> bool:
+        row = (await self.session.execute(self._deleteStmt(order_id))).first()
+        if row is not None:
+            await OrderStatsRepository(self.session).applyAsync([row._mapping], -1)
+        return row is not None
+
+    @staticmethod
+    def _countStmt(criteria: list) -> Select:
+        return select(func.count(Order.id)).where(*criteria)
+
+    def _total(self, criteria: list, totals: str) -> tuple[Optional[int], bool]:
+        """Общее число строк выборки и признак того, что это оценка"""
+        if totals == TOTALS_NONE:
+            return None, False
+        if totals == TOTALS_ESTIMATED:
+            sql = self._estimateSql(criteria)
+            if sql is not None:
+                plan = self.session.connection().exec_driver_sql(sql).scalar()
+                return self._planRows(plan), True
+        return self.session.execute(self._countStmt(criteria)).scalar(), False
+
+    async def _totalAsync(self, criteria: list, totals: str) -> tuple[Optional[int], bool]:
+        if totals == TOTALS_NONE:
+            return None, False
+        if totals == TOTALS_ESTIMATED:
+            sql = self._estimateSql(criteria)
+            if sql is not None:
+                connection = await self.session.connection()
+                plan = (await connection.exec_driver_sql(sql)).scalar()
+                return self._planRows(plan), True
+        return (await self.session.execute(self._countStmt(criteria))).scalar(), False
+
+    def _estimateSql(self, criteria: list) -> Optional[str]:
+        """
+        Запрос оценки числа строк по статистике планировщика PostgreSQL (EXPLAIN без выполнения).
+        Для других СУБД возвращает None.
+        """
+        bind = self.session.get_bind()
+        if bind.dialect.name != "postgresql":
+            return None
+        stmt = select(Order.id).where(*criteria)
+        # Значения фильтров уже провалидированы (даты, числа, enum), их можно подставить литералами
+        sql = str(stmt.compile(dialect=bind.dialect, compile_kwargs={"literal_binds": True}))
+        return "EXPLAIN (FORMAT JSON) " + sql
+
+    @staticmethod
+    def _planRows(plan: str | list) -> int:
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+    def query(
+        self,
+        user_id: Optional[int] = None,
+        start_from: Optional[date] = None,
+        start_to: Optional[date] = None,
+        from_city_id: Optional[int] = None,
+        to_city_id: Optional[int] = None,
+        payment_status: Optional[PaymentStatus] = None,
+        order_by_cost: bool = False,
+        page: int = 1,
+        limit: int = 20,
+        totals: str = TOTALS_EXACT,
+    ) -> OrderQueryResult:
+        criteria = self._criteria(user_id, start_from, start_to, from_city_id, to_city_id, payment_status)
+        # Получаем общее количество
+        total, total_estimated = self._total(criteria, totals)
+        items = self.session.execute(self._pageStmt(criteria, order_by_cost, page, limit)).all()
+        return self._pageResult(items, limit, total, total_estimated)
+
+    async def queryAsync(
+        self,
+        user_id: Optional[int] = None,
+        start_from: Optional[date] = None,
+        start_to: Optional[date] = None,
+        from_city_id: Optional[int] = None,
+        to_city_id: Optional[int] = None,
+        payment_status: Optional[PaymentStatus] = None,
+        order_by_cost: bool = False,
+        page: int = 1,
+        limit: int = 20,
+        totals: str = TOTALS_EXACT,
+    ) -> OrderQueryResult:
+        criteria = self._criteria(user_id, start_from, start_to, from_city_id, to_city_id, payment_status)
+        total, total_estimated = await self._totalAsync(criteria, totals)
+        items = (await self.session.execute(self._pageStmt(criteria, order_by_cost, page, limit))).all()
+        return self._pageResult(items, limit, total, total_estimated)
+
+    def _pageStmt(self, criteria: list, order_by_cost: bool, page: int, limit: int) -> Select:
+        # Пагинация; лишняя строка показывает, есть ли следующая страница
         offset = (page - 1) * limit
-        items = q.offset(offset).limit(limit).all()
-        
-        return OrderQueryResult(items=items, total=total)
+        return self._ordered(self._rows(criteria), order_by_cost).offset(offset).limit(limit + 1)
+
+    @staticmethod
+    def _pageResult(
+        items: list[Row], limit: int, total: Optional[int], total_estimated: bool
+    ) -> OrderQueryResult:
+        return OrderQueryResult(
+            items=list(items[:limit]),
+            total=total,
+            has_more=len(items) > limit,
+            total_estimated=total_estimated,
+        )
+
+    def queryKeyset(
+        self,
+        user_id: Optional[int] = None,
+        start_from: Optional[date] = None,
+        start_to: Optional[date] = None,
+        from_city_id: Optional[int] = None,
+        to_city_id: Optional[int] = None,
+        payment_status: Optional[PaymentStatus] = None,
+        order_by_cost: bool = False,
+        cursor: Optional[str] = None,
+        limit: int = 20,
+        totals: str = TOTALS_NONE,
+    ) -> OrderQueryResult:
+        """
+        Постраничная выборка по курсору: вместо OFFSET используется условие
+        (ключ, id) < (ключ, id) последней строки, которое обслуживается составным индексом.
+        Общее число строк по умолчанию не считается (totals=none): иначе каждая страница
+        стоила бы COUNT(*) по всей выборке.
+        """
+        criteria = self._criteria(user_id, start_from, start_to, from_city_id, to_city_id, payment_status)
+        stmt, direction = self._keysetStmt(criteria, order_by_cost, cursor, limit)
+        total, total_estimated = self._total(criteria, totals)
+        items = self.session.execute(stmt).all()
+        return self._keysetResult(items, order_by_cost, cursor, direction, limit, total, total_estimated)
+
+    async def queryKeysetAsync(
+        self,
+        user_id: Optional[int] = None,
+        start_from: Optional[date] = None,
+        start_to: Optional[date] = None,
+        from_city_id: Optional[int] = None,
+        to_city_id: Optional[int] = None,
+        payment_status: Optional[PaymentStatus] = None,
+        order_by_cost: bool = False,
+        cursor: Optional[str] = None,
+        limit: int = 20,
+        totals: str = TOTALS_NONE,
+    ) -> OrderQueryResult:
+        criteria = self._criteria(user_id, start_from, start_to, from_city_id, to_city_id, payment_status)
+        stmt, direction = self._keysetStmt(criteria, order_by_cost, cursor, limit)
+        total, total_estimated = await self._totalAsync(criteria, totals)
+        items = (await self.session.execute(stmt)).all()
+        return self._keysetResult(items, order_by_cost, cursor, direction, limit, total, total_estimated)
+
+    def _keysetStmt(
+        self, criteria: list, order_by_cost: bool, cursor: Optional[str], limit: int
+    ) -> tuple[Select, str]:
+        stmt = self._rows(criteria)
+        sort = "cost" if order_by_cost else "date"
+        sort_col = Order.transport_price if order_by_cost else Order.start_date
+        direction = "next"
+        if cursor:
+            key, order_id, direction = decodeCursor(cursor, sort)
+            position = tuple_(sort_col, Order.id)
+            if direction == "next":
+                stmt = stmt.where(position < tuple_(key, order_id))
+            else:
+                stmt = stmt.where(position > tuple_(key, order_id))
+
+        if direction == "next":
+            stmt = stmt.order_by(sort_col.desc(), Order.id.desc())
+        else:
+            stmt = stmt.order_by(sort_col.asc(), Order.id.asc())
+        return stmt.limit(limit + 1), direction
+
+    @staticmethod
+    def _keysetResult(
+        items: list[Row],
+        order_by_cost: bool,
+        cursor: Optional[str],
+        direction: str,
+        limit: int,
+        total: Optional[int],
+        total_estimated: bool,
+    ) -> OrderQueryResult:
+        sort = "cost" if order_by_cost else "date"
+        has_more = len(items) > limit
+        items = list(items[:limit])
+        if direction == "prev":
+            items.reverse()
+
+        def keyOf(row: Row) -> date | int:
+            return row.transport_price if order_by_cost else row.start_date
+
+        # Пришли по курсору — значит, в обратную сторону страница тоже есть
+        has_next = has_more if direction == "next" else bool(cursor)
+        has_prev = has_more if direction == "prev" else bool(cursor)
 
+        next_cursor = prev_cursor = None
+        if items and has_next:
+            next_cursor = encodeCursor(sort, keyOf(items[-1]), items[-1].id, "next")
+        if items and has_prev:
+            prev_cursor = encodeCursor(sort, keyOf(items[0]), items[0].id, "prev")
 
+        return OrderQueryResult(
+            items=items,
+            total=total,
+            next_cursor=next_cursor,
+            prev_cursor=prev_cursor,
+            has_more=has_next,
+            total_estimated=total_estimated,
+        )
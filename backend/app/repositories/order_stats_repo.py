@@ -0,0 +1,156 @@
+from datetime import date, datetime
+from typing import Iterable, Mapping, Optional, Sequence
+
+from sqlalchemy import Insert, Row, Select, delete, extract, func, insert, literal, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.repositories.models import Order, OrderDailyStat, PaymentStatus
+
+
+# Колонки заказа, из которых складываются агрегаты
+ORDER_STATS_COLUMNS = (
+    Order.start_date,
+    Order.from_city_id,
+    Order.to_city_id,
+    Order.payment_status,
+    Order.transport_price,
+    Order.insurance_price,
+    Order.distance_km,
+)
+
+_KEY = ("day", "from_city_id", "to_city_id", "payment_status")
+_SUMS = ("orders_count", "transport_price_sum", "insurance_price_sum", "distance_km_sum")
+
+# Допустимые группировки: имя → выражения по таблице агрегатов. День в агрегатах — день
+# начала перевозки (orders.start_date), а не день создания заказа
+GROUP_BY_FIELDS = {
+    "start_day": (OrderDailyStat.day.label("start_day"),),
+    "start_month": (
+        extract("year", OrderDailyStat.day).label("start_year"),
+        extract("month", OrderDailyStat.day).label("start_month"),
+    ),
+    "from_city_id": (OrderDailyStat.from_city_id,),
+    "to_city_id": (OrderDailyStat.to_city_id,),
+    "payment_status": (OrderDailyStat.payment_status,),
+}
+
+
+def statsDeltas(orders: Iterable[Mapping], sign: int = 1) -> list[dict]:
+    """
+    Приращения агрегатов для набора заказов (sign=-1 — вычесть), сложенные по ключу:
+    одна строка на ключ, как требует INSERT ... ON CONFLICT DO UPDATE.
+    """
+    acc: dict[tuple, list[int]] = {}
+    for o in orders:
+        key = (o["start_date"], o["from_city_id"], o["to_city_id"], o["payment_status"])
+        sums = acc.setdefault(key, [0, 0, 0, 0])
+        sums[0] += sign
+        sums[1] += sign * o["transport_price"]
+        sums[2] += sign * o["insurance_price"]
+        sums[3] += sign * o["distance_km"]
+    return [dict(zip(_KEY + _SUMS, key + tuple(sums))) for key, sums in acc.items()]
+
+
+class OrderStatsRepository:
+    """
+    Таблица order_daily_stats. Приращения пишутся upsert'ом в транзакции изменения
+    заказа, поэтому агрегаты всегда согласованы с orders.
+    """
+
+    def __init__(self, session: Session | AsyncSession) -> None:
+        self.session = session
+
+    def _applyStmt(self, deltas: list[dict]) -> Insert:
+        dialect = self.session.bind.dialect.name
+        insert_ = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        now = datetime.utcnow()
+        stmt = insert_(OrderDailyStat).values([dict(d, created_at=now, updated_at=now) for d in deltas])
+        table = OrderDailyStat.__table__
+        # Сложение в UPDATE атомарно: параллельные транзакции не теряют приращения друг друга
+        set_ = {name: table.c[name] + stmt.excluded[name] for name in _SUMS}
+        set_["updated_at"] = stmt.excluded.updated_at
+        return stmt.on_conflict_do_update(index_elements=[table.c[name] for name in _KEY], set_=set_)
+
+    def apply(self, orders: Iterable[Mapping], sign: int = 1) -> None:
+        """Добавляет заказы в агрегаты (sign=-1 — убирает)"""
+        deltas = statsDeltas(orders, sign)
+        if deltas:
+            self.session.execute(self._applyStmt(deltas))
+
+    async def applyAsync(self, orders: Iterable[Mapping], sign: int = 1) -> None:
+        deltas = statsDeltas(orders, sign)
+        if deltas:
+            await self.session.execute(self._applyStmt(deltas))
+
+    @staticmethod
+    def _moveDeltas(order: Mapping, payment_status: PaymentStatus) -> list[dict]:
+        return statsDeltas([order], -1) + statsDeltas([{**order, "payment_status": payment_status}])
+
+    def move(self, order: Mapping, payment_status: PaymentStatus) -> None:
+        """Переносит заказ под другой статус оплаты одним upsert"""
+        if order["payment_status"] != payment_status:
+            self.session.execute(self._applyStmt(self._moveDeltas(order, payment_status)))
+
+    async def moveAsync(self, order: Mapping, payment_status: PaymentStatus) -> None:
+        if order["payment_status"] != payment_status:
+            await self.session.execute(self._applyStmt(self._moveDeltas(order, payment_status)))
+
+    @staticmethod
+    def _queryStmt(
+        group_by: Sequence[str],
+        start_from: Optional[date] = None,
+        start_to: Optional[date] = None,
+        from_city_id: Optional[int] = None,
+        to_city_id: Optional[int] = None,
+        payment_status: Optional[PaymentStatus] = None,
+    ) -> Select:
+        criteria = []
+        if start_from is not None:
+            criteria.append(OrderDailyStat.day >= start_from)
+        if start_to is not None:
+            criteria.append(OrderDailyStat.day <= start_to)
+        if from_city_id is not None:
+            criteria.append(OrderDailyStat.from_city_id == from_city_id)
+        if to_city_id is not None:
+            criteria.append(OrderDailyStat.to_city_id == to_city_id)
+        if payment_status is not None:
+            criteria.append(OrderDailyStat.payment_status == payment_status)
+
+        groups = [col for name in group_by for col in GROUP_BY_FIELDS[name]]
+        sums = [func.coalesce(func.sum(getattr(OrderDailyStat, name)), 0).label(name) for name in _SUMS]
+        stmt = select(*groups, *sums).where(*criteria)
+        if groups:
+            stmt = stmt.group_by(*groups).order_by(*groups).having(func.sum(OrderDailyStat.orders_count) > 0)
+        return stmt
+
+    def query(self, group_by: Sequence[str] = (), **filters) -> list[Row]:
+        """Суммы по группам (GROUP_BY_FIELDS) за диапазон дат начала перевозки с фильтрами по маршруту и статусу"""
+        return self.session.execute(self._queryStmt(group_by, **filters)).all()
+
+    async def queryAsync(self, group_by: Sequence[str] = (), **filters) -> list[Row]:
+        return (await self.session.execute(self._queryStmt(group_by, **filters))).all()
+
+    def rebuild(self) -> int:
+        """Пересчитывает все агрегаты по таблице orders; возвращает число строк агрегатов"""
+        if self.session.bind.dialect.name == "postgresql":
+            # Приращения параллельных транзакций ждут конца пересчета и ложатся поверх него
+            self.session.execute(text("LOCK TABLE order_daily_stats IN EXCLUSIVE MODE"))
+        self.session.execute(delete(OrderDailyStat))
+        now = datetime.utcnow()
+        source = select(
+            Order.start_date,
+            Order.from_city_id,
+            Order.to_city_id,
+            Order.payment_status,
+            func.count(),
+            func.sum(Order.transport_price),
+            func.sum(Order.insurance_price),
+            func.sum(Order.distance_km),
+            literal(now),
+            literal(now),
+        ).group_by(Order.start_date, Order.from_city_id, Order.to_city_id, Order.payment_status)
+        columns = [*_KEY, *_SUMS, "created_at", "updated_at"]
+        self.session.execute(insert(OrderDailyStat).from_select(columns, source))
+        return self.session.execute(select(func.count()).select_from(OrderDailyStat)).scalar()
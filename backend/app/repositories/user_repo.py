@@ -1,3 +1,7 @@
+from typing import Iterable
+
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.repositories.base import SqlAlchemyRepository
@@ -5,7 +9,16 @@ from app.repositories.models import User
 
 
 class UserRepository(SqlAlchemyRepository[User]):
-    def __init__(self, session: Session) -> None:
+    def __init__(self, session: Session | AsyncSession) -> None:
         super().__init__(session, User)
 
+    @staticmethod
+    def _existingIdsStmt(user_ids: Iterable[int]) -> Select:
+        return select(User.id).where(User.id.in_(sorted(set(user_ids))))
+
+    def existingIds(self, user_ids: Iterable[int]) -> set[int]:
+        """Какие из переданных id пользователей есть в БД — одним запросом"""
+        return set(self.session.execute(self._existingIdsStmt(user_ids)).scalars())
 
+    async def existingIdsAsync(self, user_ids: Iterable[int]) -> set[int]:
+        return set((await self.session.execute(self._existingIdsStmt(user_ids))).scalars())
@@ -9,4 +9,5 @@ class AdminLoginRequest(BaseModel):
 class AdminLoginResponse(BaseModel):
     token: str
     admin_id: int
+    expires_at: int  # unix time истечения токена
 
@@ -1,6 +1,7 @@
+from datetime import datetime
 from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 from app.schemas.base import TimestampedDto
 
@@ -26,3 +27,17 @@ class CityDto(TimestampedDto):
     longitude: Optional[float]
 
 
+
+
+class DistancePrefillStatusDto(BaseModel):
+    city_id: int
+    total_pairs: int
+    processed_pairs: int
+    inserted: int
+    failed: int
+    finished: bool
+    error: str | None = None
+    # Время последнего обновления прогресса
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
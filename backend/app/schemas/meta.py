@@ -1,9 +1,39 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class FixedRouteDto(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    from_city_id: int
+    to_city_id: int
     from_city: str
     to_city: str
     fixed_price: int
 
 
+
+
+class HistogramBucketDto(BaseModel):
+    le: float | None  # None — корзина +Inf
+    count: int
+
+
+class HistogramDto(BaseModel):
+    buckets: list[HistogramBucketDto]
+    count: int
+    sum: float
+
+
+class PoolMetricsDto(BaseModel):
+    name: str
+    size: int | None
+    checked_out: int | None
+    idle: int | None
+    overflow: int | None
+    connects: int
+    checkouts: int
+    checkins: int
+    checkout_timeouts: int
+    invalidations: int
+    pre_ping_failures: int
+    checkout_wait_ms: HistogramDto
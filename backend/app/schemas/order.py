@@ -1,6 +1,6 @@
 from datetime import date
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from app.repositories.models import PaymentStatus
 from app.schemas.base import TimestampedDto
@@ -26,6 +26,28 @@ class OrderPreviewResponse(BaseModel):
     duration_days: int
     duration_hours_remainder: int
     eta_date: date
+    # true — расстояние оценено по координатам, точное значение будет получено позже
+    is_distance_estimated: bool = False
+
+
+class OrderPreviewBatchItem(BaseModel):
+    from_city: str
+    to_city: str
+    start_date: date
+
+
+class OrderPreviewBatchRequest(BaseModel):
+    items: list[OrderPreviewBatchItem] = Field(min_length=1, max_length=500)
+
+
+class OrderPreviewBatchResult(BaseModel):
+    index: int
+    result: OrderPreviewResponse | None = None
+    error: str | None = None
+
+
+class OrderPreviewBatchResponse(BaseModel):
+    items: list[OrderPreviewBatchResult]
 
 
 class OrderCreate(BaseModel):
@@ -38,6 +60,10 @@ class OrderCreate(BaseModel):
     start_date: date
 
 
+class OrderBulkCreateRequest(BaseModel):
+    items: list[OrderCreate] = Field(min_length=1, max_length=1000)
+
+
 class OrderDto(TimestampedDto):
     user_id: int
     user_full_name: str
@@ -60,9 +86,48 @@ class OrderDto(TimestampedDto):
 
 class PaginatedOrdersResponse(BaseModel):
     items: list[OrderDto]
-    total: int
+    # None при totals=none; при totals=estimated — оценка (total_estimated=true)
+    total: int | None
     page: int
     limit: int
-    pages: int
+    pages: int | None
+    has_more: bool = False
+    total_estimated: bool = False
+    # Заполняются в режиме pagination=cursor
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
+
+
+
+
+class OrderBulkCreateResult(BaseModel):
+    index: int
+    order: OrderDto | None = None
+    error: str | None = None
+
+
+class OrderBulkCreateResponse(BaseModel):
+    created: int
+    failed: int
+    items: list[OrderBulkCreateResult]
+
+
+class OrderStatsItem(BaseModel):
+    # Заполнены только поля из group_by. Измерение времени — дата начала перевозки
+    # (start_date), не дата создания заказа; start_month — строка YYYY-MM
+    start_day: date | None = None
+    start_month: str | None = None
+    from_city_id: int | None = None
+    to_city_id: int | None = None
+    payment_status: PaymentStatus | None = None
+    orders_count: int
+    transport_price_sum: int
+    insurance_price_sum: int
+    distance_km_sum: int
 
 
+class OrderStatsResponse(BaseModel):
+    group_by: list[str]
+    items: list[OrderStatsItem]
+    # Итог по всей выборке, без группировки
+    total: OrderStatsItem
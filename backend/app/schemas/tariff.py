@@ -1,3 +1,5 @@
+from datetime import date
+
 from pydantic import BaseModel, Field
 
 from app.schemas.base import TimestampedDto
@@ -21,3 +23,52 @@ class TariffDto(TimestampedDto):
     price_per_km_gt_1000: int
 
 
+
+
+class TariffProposalRates(BaseModel):
+    month: int = Field(ge=1, le=12)
+    price_per_km_le_1000: int = Field(ge=0)
+    price_per_km_gt_1000: int = Field(ge=0)
+
+
+class FixedRouteProposal(BaseModel):
+    from_city_id: int
+    to_city_id: int
+    # Не указана или None — снять фиксированную цену: маршрут считается по тарифу
+    fixed_price: int | None = Field(default=None, ge=0)
+
+
+class TariffSimulationRequest(BaseModel):
+    tariffs: list[TariffProposalRates] = []
+    fixed_routes: list[FixedRouteProposal] = []
+    date_from: date | None = None
+    date_to: date | None = None
+    # Верхние границы диапазонов расстояния включительно: [500, 1000] → 0–500, 501–1000, 1001+
+    distance_bands: list[int] = Field(default=[500, 1000, 2000, 3000], max_length=50)
+    # Сколько маршрутов с наибольшим изменением выручки вернуть
+    route_limit: int = Field(default=50, ge=0, le=1000)
+
+
+class TariffSimulationItem(BaseModel):
+    # Заполнены только поля своей группировки; month — месяц тарифа 1..12
+    month: int | None = None
+    from_city_id: int | None = None
+    to_city_id: int | None = None
+    distance_from_km: int | None = None
+    distance_to_km: int | None = None
+    orders_count: int
+    current_transport_sum: int
+    proposed_transport_sum: int
+    transport_delta: int
+    current_insurance_sum: int
+    proposed_insurance_sum: int
+    insurance_delta: int
+
+
+class TariffSimulationResponse(BaseModel):
+    total: TariffSimulationItem
+    by_month: list[TariffSimulationItem]
+    by_route: list[TariffSimulationItem]
+    by_distance_band: list[TariffSimulationItem]
+    routes_count: int
+    unpriced_orders: int
@@ -0,0 +1,159 @@
+import logging
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Callable
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.infra.config import getSettings
+from app.infra.db import SessionLocal
+from app.infra.distance.distance_index import recordDistance
+from app.infra.distance.provider import OSRMProvider
+from app.repositories.city_distance_repo import CityDistanceRepository
+from app.repositories.distance_prefill_repo import DistancePrefillRepository
+from app.repositories.models import City, DistancePrefillRun
+from app.repositories.uow import UnitOfWork
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PrefillProgress:
+    city_id: int
+    total_pairs: int = 0
+    processed_pairs: int = 0
+    inserted: int = 0
+    failed: int = 0
+    finished: bool = False
+    error: str | None = None
+
+
+# Незавершенный запуск без обновлений дольше этого считается прерванным (воркер упал)
+_STALE_AFTER = timedelta(minutes=10)
+
+
+def getPrefillProgress(session: Session, city_id: int) -> DistancePrefillRun | None:
+    """Последний запуск для города; хранится в БД и виден всем воркерам"""
+    return DistancePrefillRepository(session).get(city_id)
+
+
+def startPrefill(session: Session, city_id: int) -> tuple[DistancePrefillRun, bool]:
+    """
+    Регистрирует запуск в транзакции вызывающего. Если запуск уже идет, возвращает
+    его запись и False — повторная задача не ставится.
+    """
+    repo = DistancePrefillRepository(session)
+    run = repo.get(city_id)
+    if run is not None and not run.finished and datetime.utcnow() - run.updated_at < _STALE_AFTER:
+        return run, False
+    return repo.start(city_id), True
+
+
+class DistancePrefillJob:
+    """
+    Предзаполнение city_distances для нового города через сервис OSRM table.
+
+    Назначения (активные города с координатами, для которых расстояние еще неизвестно)
+    отправляются пачками по chunk_size; каждая пачка вставляется и коммитится отдельно
+    вместе с прогрессом (distance_prefill_runs), так что прогресс сразу виден любому
+    воркеру, а сбой одной пачки не отменяет остальные.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        osrm: OSRMProvider | None = None,
+        chunk_size: int | None = None,
+    ) -> None:
+        self.session_factory = session_factory
+        self.osrm = osrm or OSRMProvider()
+        self.chunk_size = chunk_size or getSettings().osrm_table_chunk_size
+
+    @staticmethod
+    def _save(repo: DistancePrefillRepository, progress: PrefillProgress) -> None:
+        values = asdict(progress)
+        del values["city_id"]
+        repo.update(progress.city_id, **values)
+
+    def run(self, city_id: int) -> PrefillProgress:
+        progress = PrefillProgress(city_id=city_id)
+
+        with UnitOfWork(self.session_factory) as uow:
+            repo = DistancePrefillRepository(uow.session)
+            if repo.get(city_id) is None:
+                repo.start(city_id)
+            source = uow.session.get(City, city_id)
+            if source is None or source.latitude is None or source.longitude is None:
+                progress.error = "City not found or has no coordinates"
+                progress.finished = True
+                self._save(repo, progress)
+                return progress
+            source_coords = (source.latitude, source.longitude)
+
+            targets = uow.session.execute(
+                select(City.id, City.latitude, City.longitude)
+                .where(
+                    City.is_active.is_(True),
+                    City.id != city_id,
+                    City.latitude.is_not(None),
+                    City.longitude.is_not(None),
+                )
+                .order_by(City.id.asc())
+            ).all()
+            known = CityDistanceRepository(uow.session).findMany((city_id, t.id) for t in targets)
+            targets = [t for t in targets if (city_id, t.id) not in known]
+            progress.total_pairs = len(targets)
+            self._save(repo, progress)
+
+        for start in range(0, len(targets), self.chunk_size):
+            chunk = targets[start:start + self.chunk_size]
+            try:
+                distances = self.osrm.getTableDistancesKm(
+                    source_coords, [(t.latitude, t.longitude) for t in chunk]
+                )
+            except ValueError as e:
+                logger.warning("Distance prefill chunk failed for city %s: %s", city_id, e)
+                progress.failed += len(chunk)
+                progress.error = str(e)
+                progress.processed_pairs += len(chunk)
+                with UnitOfWork(self.session_factory) as uow:
+                    self._save(DistancePrefillRepository(uow.session), progress)
+                continue
+
+            rows = [
+                {"from_city_id": city_id, "to_city_id": t.id, "distance_km": km, "is_manual": False}
+                for t, km in zip(chunk, distances)
+                if km is not None
+            ]
+            progress.failed += len(chunk) - len(rows)
+            progress.processed_pairs += len(chunk)
+            # Пачка и счетчики — в одной транзакции: прогресс не опережает данные.
+            # Пары, которые успел записать кто-то другой (уточнение из OSRM), не считаются
+            with UnitOfWork(self.session_factory) as uow:
+                progress.inserted += CityDistanceRepository(uow.session).bulkCreate(rows)
+                for row in rows:
+                    recordDistance(uow.session, row["from_city_id"], row["to_city_id"], row["distance_km"])
+                self._save(DistancePrefillRepository(uow.session), progress)
+            logger.info(
+                "Distance prefill for city %s: %d/%d pairs",
+                city_id,
+                progress.processed_pairs,
+                progress.total_pairs,
+            )
+
+        progress.finished = True
+        with UnitOfWork(self.session_factory) as uow:
+            self._save(DistancePrefillRepository(uow.session), progress)
+        return progress
+
+
+def runDistancePrefill(city_id: int) -> None:
+    """Точка входа для фоновой задачи FastAPI; запуск регистрируется заранее через startPrefill"""
+    try:
+        DistancePrefillJob(SessionLocal).run(city_id)
+    except Exception as e:
+        logger.exception("Distance prefill failed for city %s", city_id)
+        with UnitOfWork(SessionLocal) as uow:
+            DistancePrefillRepository(uow.session).update(city_id, finished=True, error=str(e))
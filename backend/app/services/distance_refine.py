@@ -0,0 +1,56 @@
+import logging
+import threading
+
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+from app.infra.distance.provider import HybridDistanceProvider
+
+
+logger = logging.getLogger(__name__)
+
+# Пары, которые уже уточняются: повторная оценка той же пары не порождает второй запрос в OSRM
+_inflight: set[tuple[object, frozenset[str]]] = set()
+_inflight_lock = threading.Lock()
+
+
+def _claim(owner: object, pairs: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    claimed = []
+    with _inflight_lock:
+        for pair in pairs:
+            key = (owner, frozenset(pair))
+            if key not in _inflight:
+                _inflight.add(key)
+                claimed.append(pair)
+    return claimed
+
+
+def _release(owner: object, pairs: list[tuple[str, str]]) -> None:
+    with _inflight_lock:
+        for pair in pairs:
+            _inflight.discard((owner, frozenset(pair)))
+
+
+def _logFailures(results: dict[tuple[str, str], int | ValueError]) -> None:
+    for (from_city, to_city), distance_km in results.items():
+        if isinstance(distance_km, ValueError):
+            logger.warning("Distance refine failed for %s -> %s: %s", from_city, to_city, distance_km)
+
+
+async def refineDistancesAsync(bind: AsyncEngine, pairs: list[tuple[str, str]]) -> None:
+    """
+    Фоновая задача FastAPI: точные расстояния из OSRM для пар, посчитанных по оценке.
+    Сохраняются как обычные результаты OSRM — в БД и (после commit) в индексе расстояний.
+    """
+    claimed = _claim(bind, pairs)
+    if not claimed:
+        return
+    try:
+        async with async_sessionmaker(bind, autoflush=False, expire_on_commit=False)() as session:
+            results = await HybridDistanceProvider(session).getDistancesKmAsync(claimed)
+            await session.commit()
+        _logFailures(results)
+    except Exception:
+        logger.exception("Distance refine failed for %d pairs", len(claimed))
+    finally:
+        _release(bind, claimed)
+
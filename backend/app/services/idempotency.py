@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import itertools
+import json
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.infra.config import getSettings
+from app.repositories.idempotency_repo import IdempotencyRepository
+
+
+MAX_KEY_LENGTH = 128
+# Раз в столько новых ключей процесс удаляет просроченные
+_SWEEP_EVERY = 500
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    status_code: int
+    body: dict
+    replayed: bool
+
+
+class IdempotencyConflict(Exception):
+    """Ключ занят другим запросом: другое тело или первый запрос еще выполняется"""
+
+    def __init__(self, status_code: int, message: str) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# Дубликаты в одном процессе ждут первый запрос на замке, не занимая соединение с БД;
+# между воркерами их упорядочивает уникальный ключ в БД
+_locks: dict[str, tuple[asyncio.Lock, int]] = {}
+_claims = itertools.count(1)
+
+
+class _KeyLock:
+    def __init__(self, key: str) -> None:
+        self.key = key
+
+    async def __aenter__(self) -> None:
+        lock, waiters = _locks.get(self.key, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        _locks[self.key] = (lock, waiters + 1)
+        try:
+            await lock.acquire()
+        except BaseException:
+            # Запрос отменен в ожидании (клиент отключился): __aexit__ не будет вызван
+            self._leave()
+            raise
+
+    async def __aexit__(self, *exc) -> None:
+        _locks[self.key][0].release()
+        self._leave()
+
+    def _leave(self) -> None:
+        lock, waiters = _locks[self.key]
+        if waiters == 1:
+            del _locks[self.key]
+        else:
+            _locks[self.key] = (lock, waiters - 1)
+
+
+def requestHash(payload: dict) -> str:
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+async def runIdempotent(
+    session: AsyncSession,
+    key: str,
+    payload: dict,
+    handler: Callable[[], Awaitable[tuple[int, dict]]],
+) -> StoredResponse:
+    """
+    Выполняет handler один раз на ключ. Ключ занимается в транзакции запроса, ответ
+    сохраняется в ней же и фиксируется до возврата клиенту: заказ и ответ либо
+    записаны вместе, либо (при ошибке) ключ освобождается вместе с откатом.
+    """
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"Idempotency-Key must be 1..{MAX_KEY_LENGTH} characters")
+
+    fingerprint = requestHash(payload)
+    repo = IdempotencyRepository(session)
+    async with _KeyLock(key):
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=getSettings().idempotency_ttl_seconds)
+        claimed = await repo.claimAsync(key, fingerprint, expires_at)
+        if not claimed and await repo.deleteExpiredAsync(now, key):
+            claimed = await repo.claimAsync(key, fingerprint, expires_at)
+
+        if not claimed:
+            stored = await repo.getAsync(key)
+            if stored is not None and stored.request_hash != fingerprint:
+                raise IdempotencyConflict(422, "Idempotency-Key was used with a different request")
+            # PostgreSQL дожидается первого запроса сам; сюда попадаем, только если СУБД не ждет
+            if stored is None or stored.status_code is None:
+                raise IdempotencyConflict(409, "A request with this Idempotency-Key is in progress")
+            return StoredResponse(stored.status_code, json.loads(stored.response_body), replayed=True)
+
+        status_code, body = await handler()
+        await repo.saveResponseAsync(key, status_code, json.dumps(body))
+        await session.commit()
+
+    if next(_claims) % _SWEEP_EVERY == 0:
+        await repo.deleteExpiredAsync(now)
+        await session.commit()
+    return StoredResponse(status_code, body, replayed=False)
@@ -0,0 +1,66 @@
+import csv
+import io
+import json
+from enum import Enum
+from typing import Callable, Iterator
+
+from sqlalchemy.orm import Session
+
+from app.repositories.order_repo import ORDER_DTO_COLUMNS, OrderRepository
+
+
+EXPORT_FIELDS = [c.key for c in ORDER_DTO_COLUMNS]
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _plain(value):
+    if isinstance(value, Enum):
+        return value.value
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def iterOrderExport(
+    session_factory: Callable[[], Session],
+    fmt: str,
+    batch_size: int = 1000,
+    **filters,
+) -> Iterator[str]:
+    """
+    Генератор выгрузки заказов в CSV или NDJSON. Открывает собственную сессию на время
+    потока и отдает данные кусками по batch_size строк; заголовок CSV уходит сразу.
+    """
+    session = session_factory()
+    try:
+        rows = OrderRepository(session).iterDtoRows(batch_size=batch_size, **filters)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == "csv" else None
+        if writer is not None:
+            writer.writerow(EXPORT_FIELDS)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+        pending = 0
+        for row in rows:
+            values = [_plain(v) for v in row]
+            if writer is not None:
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(EXPORT_FIELDS, values)), ensure_ascii=False))
+                buffer.write("\n")
+            pending += 1
+            if pending >= batch_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        if pending:
+            yield buffer.getvalue()
+    finally:
+        session.close()
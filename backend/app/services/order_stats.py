@@ -0,0 +1,29 @@
+import logging
+import sys
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+from app.infra.db import SessionLocal
+from app.repositories.order_stats_repo import OrderStatsRepository
+from app.repositories.uow import UnitOfWork
+
+
+logger = logging.getLogger(__name__)
+
+
+def rebuildOrderStats(session_factory: Callable[[], Session] = SessionLocal) -> int:
+    """
+    Пересчет order_daily_stats по всей таблице orders одной транзакцией: заполнение
+    агрегатов для старых заказов и починка после ручных правок в БД.
+    """
+    with UnitOfWork(session_factory) as uow:
+        rows = OrderStatsRepository(uow.session).rebuild()
+    logger.info("order_daily_stats rebuilt: %s rows", rows)
+    return rows
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 1:
+        sys.exit("usage: python -m app.services.order_stats")
+    print(f"order_daily_stats: {rebuildOrderStats()} rows")
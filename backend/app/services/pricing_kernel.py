@@ -0,0 +1,117 @@
+"""
+Тарифная математика без сессии и I/O: ставка по порогу 1000 км, страховка 10%,
+24 часа на 1000 км. Расстояния, фиксированные цены и тарифы передаются готовыми,
+поэтому один вызов считает целый массив строк (preview, пакетные эндпоинты,
+матрица цен, офлайн-пересчеты).
+
+Массивы — stdlib array: numpy в зависимостях нет. Ради совпадения до бита
+с priceOne округление делается теми же float-выражениями, а не целочисленно.
+"""
+from array import array
+from dataclasses import dataclass
+from typing import Mapping, Sequence
+
+from app.infra.reference_cache import TariffRates
+
+
+# Значение ячейки, для которой расстояние, фиксированная цена, ставка или цена неизвестны
+MISSING = -1
+
+LONG_DISTANCE_KM = 1000
+INSURANCE_RATE = 0.10
+HOURS_PER_1000_KM = 24
+
+
+@dataclass(frozen=True)
+class PricedArrays:
+    """Результат priceArrays: позиция k соответствует k-й входной строке"""
+
+    rate: array  # 'i': применённая ставка за км; MISSING для фиксированных маршрутов
+    transport: array  # 'q': MISSING — цену не посчитать (нет расстояния или тарифа на месяц)
+    insurance: array  # 'q'
+    duration_hours: array  # 'i': MISSING — нет расстояния
+
+    def __len__(self) -> int:
+        return len(self.transport)
+
+
+def durationHours(distance_km: int) -> int:
+    return int(round(distance_km * HOURS_PER_1000_KM / 1000))
+
+
+def insurancePrice(transport_price: int) -> int:
+    return int(round(transport_price * INSURANCE_RATE))
+
+
+def priceOne(
+    distance_km: int, month: int, fixed_price: int, tariffs: Mapping[int, TariffRates]
+) -> tuple[int, int, int, int]:
+    """Скалярный расчет одной строки: (rate, transport, insurance, duration_hours) с MISSING"""
+    if distance_km == MISSING:
+        return MISSING, MISSING, MISSING, MISSING
+    duration_hours = durationHours(distance_km)
+    if fixed_price != MISSING:
+        return MISSING, int(fixed_price), insurancePrice(int(fixed_price)), duration_hours
+    tariff = tariffs.get(month)
+    if tariff is None:
+        return MISSING, MISSING, MISSING, duration_hours
+    if distance_km <= LONG_DISTANCE_KM:
+        rate = int(tariff.price_per_km_le_1000)
+    else:
+        rate = int(tariff.price_per_km_gt_1000)
+    transport_price = int(rate * distance_km)
+    return rate, transport_price, insurancePrice(transport_price), duration_hours
+
+
+def durationArray(distance: Sequence[int]) -> array:
+    # Длительность зависит только от расстояния: округление один раз на различное значение
+    hours = {d: durationHours(d) for d in set(distance)}
+    hours[MISSING] = MISSING
+    return array("i", map(hours.__getitem__, distance))
+
+
+def priceArrays(
+    distance: Sequence[int],
+    month: Sequence[int],
+    fixed: Sequence[int],
+    tariffs: Mapping[int, TariffRates],
+) -> PricedArrays:
+    """
+    Цены для массива строк (distance_km, month, fixed_price или MISSING) за один проход.
+    Тарифы — month → TariffRates; строка без фиксированной цены и без тарифа на свой
+    месяц получает transport = MISSING.
+    """
+    if not len(distance) == len(month) == len(fixed):
+        raise ValueError("distance, month and fixed must have the same length")
+
+    # Ставки по месяцам плоскими таблицами: индекс вместо поиска тарифа на строку
+    le_1000 = [MISSING] * 13
+    gt_1000 = [MISSING] * 13
+    for m, tariff in tariffs.items():
+        le_1000[m] = int(tariff.price_per_km_le_1000)
+        gt_1000[m] = int(tariff.price_per_km_gt_1000)
+
+    rate = array(
+        "i",
+        [
+            MISSING
+            if d == MISSING or f != MISSING
+            else (le_1000[m] if d <= LONG_DISTANCE_KM else gt_1000[m])
+            for d, m, f in zip(distance, month, fixed)
+        ],
+    )
+    transport = array(
+        "q",
+        [
+            MISSING if d == MISSING else int(f) if f != MISSING else MISSING if r == MISSING else r * d
+            for d, f, r in zip(distance, fixed, rate)
+        ],
+    )
+    insurance_by_price = {t: insurancePrice(t) for t in set(transport)}
+    insurance_by_price[MISSING] = MISSING
+    return PricedArrays(
+        rate=rate,
+        transport=transport,
+        insurance=array("q", map(insurance_by_price.__getitem__, transport)),
+        duration_hours=durationArray(distance),
+    )
@@ -1,13 +1,21 @@
 from dataclasses import dataclass
 from datetime import date, timedelta
+from typing import TYPE_CHECKING, Container, Sequence
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.infra.distance.provider import DistanceProvider
-from app.repositories.fixed_route_repo import FixedRouteRepository
+from app.infra.metrics import timeStage
+from app.infra.reference_cache import ReferenceSnapshot, getReferenceSnapshot, getReferenceSnapshotAsync
 from app.repositories.models import Order, PaymentStatus
 from app.repositories.order_repo import OrderRepository
-from app.repositories.tariff_repo import TariffRepository
+from app.repositories.order_stats_repo import OrderStatsRepository
+from app.repositories.user_repo import UserRepository
+from app.services.pricing_kernel import MISSING, PricedArrays, priceArrays
+
+if TYPE_CHECKING:
+    from app.services.quote_matrix import QuoteMatrix
 
 
 @dataclass
@@ -21,54 +29,194 @@ class PricingResult:
     duration_days: int
     duration_hours_remainder: int
     eta_date: date
+    # Расстояние оценено по координатам и будет уточнено через OSRM
+    is_distance_estimated: bool = False
+
+
+@dataclass(frozen=True)
+class OrderDraft:
+    """Данные одного заказа для пакетного создания — аргументы createOrder"""
+
+    user_id: int
+    car_brand_model: str
+    start_date: date
+    from_city_id: int
+    to_city_id: int
+    from_city_name: str
+    to_city_name: str
 
 
 class PricingService:
-    def __init__(self, session: Session, distance_provider: DistanceProvider) -> None:
+    """
+    Расчет стоимости и создание заказов. С AsyncSession используются методы *Async,
+    синхронные методы остаются для скриптов и тестов.
+    """
+
+    def __init__(
+        self,
+        session: Session | AsyncSession,
+        distance_provider: DistanceProvider,
+        quote_matrix: "QuoteMatrix | None" = None,
+    ) -> None:
         self.session = session
         self.distance_provider = distance_provider
-        self.fixed_repo = FixedRouteRepository(session)
-        self.tariff_repo = TariffRepository(session)
+        # Матрица предрасчитанных цен; пары вне матрицы считаются обычным путем
+        self.quote_matrix = quote_matrix
         self.order_repo = OrderRepository(session)
+        # Агрегаты для аналитики обновляются в транзакции создания заказа
+        self.stats_repo = OrderStatsRepository(session)
 
     def preview(self, start_date: date, from_city: str, to_city: str) -> PricingResult:
-        distance_km = self.distance_provider.getDistanceKm(from_city, to_city)
-
-        fixed = self.fixed_repo.find(from_city, to_city)
-        if fixed is not None:
-            transport_price = int(fixed.fixed_price)
-            is_fixed_route = True
-            applied_price_per_km = None
-        else:
-            tariff = self.tariff_repo.getForDate(start_date)
-            if tariff is None:
-                raise ValueError("Tariff for the selected month not found")
-            is_fixed_route = False
-            if distance_km <= 1000:
-                applied_price_per_km = int(tariff.price_per_km_le_1000)
+        quoted = self._quote(start_date, from_city, to_city)
+        if quoted is not None:
+            return quoted
+
+        with timeStage("preview", "distance"):
+            distance_km = self.distance_provider.getDistanceKm(from_city, to_city)
+        # Фиксированные маршруты и тарифы читаются из снимка справочников, без запросов в БД
+        with timeStage("preview", "reference_data"):
+            snapshot = getReferenceSnapshot(self.session)
+        with timeStage("preview", "compute"):
+            return self._price(
+                snapshot, start_date, from_city, to_city, distance_km,
+                is_distance_estimated=self.distance_provider.isEstimated(from_city, to_city),
+            )
+
+    async def previewAsync(self, start_date: date, from_city: str, to_city: str) -> PricingResult:
+        """Вариант preview для async-эндпоинтов: ожидание OSRM не занимает поток"""
+        quoted = self._quote(start_date, from_city, to_city)
+        if quoted is not None:
+            return quoted
+
+        with timeStage("preview", "distance"):
+            distance_km = await self.distance_provider.getDistanceKmAsync(from_city, to_city)
+        with timeStage("preview", "reference_data"):
+            snapshot = await getReferenceSnapshotAsync(self.session)
+        with timeStage("preview", "compute"):
+            return self._price(
+                snapshot, start_date, from_city, to_city, distance_km,
+                is_distance_estimated=self.distance_provider.isEstimated(from_city, to_city),
+            )
+
+    def _quote(self, start_date: date, from_city: str, to_city: str) -> PricingResult | None:
+        if self.quote_matrix is None:
+            return None
+        with timeStage("preview", "quote_matrix"):
+            return self.quote_matrix.lookup(start_date, from_city, to_city)
+
+    def previewBatch(
+        self, items: Sequence[tuple[date, str, str]]
+    ) -> list[PricingResult | ValueError]:
+        """
+        Расчет для набора (start_date, from_city, to_city). Расстояния разрешаются
+        одним пакетом; ошибка по элементу возвращается на его позиции.
+        """
+        quoted = self._quoteBatch(items)
+        distances = self.distance_provider.getDistancesKm(
+            (f, t) for (_, f, t), q in zip(items, quoted) if q is None
+        )
+        snapshot = getReferenceSnapshot(self.session)
+        return self._priceBatch(snapshot, items, quoted, distances, self._estimatedPairs(distances))
+
+    async def previewBatchAsync(
+        self, items: Sequence[tuple[date, str, str]]
+    ) -> list[PricingResult | ValueError]:
+        quoted = self._quoteBatch(items)
+        distances = await self.distance_provider.getDistancesKmAsync(
+            (f, t) for (_, f, t), q in zip(items, quoted) if q is None
+        )
+        snapshot = await getReferenceSnapshotAsync(self.session)
+        return self._priceBatch(snapshot, items, quoted, distances, self._estimatedPairs(distances))
+
+    def _estimatedPairs(self, distances: dict[tuple[str, str], int | ValueError]) -> set[tuple[str, str]]:
+        return {pair for pair in distances if self.distance_provider.isEstimated(*pair)}
+
+    def _quoteBatch(self, items: Sequence[tuple[date, str, str]]) -> list[PricingResult | None]:
+        if self.quote_matrix is None:
+            return [None] * len(items)
+        return [self.quote_matrix.lookup(*item) for item in items]
+
+    @classmethod
+    def _priceBatch(
+        cls,
+        snapshot: ReferenceSnapshot,
+        items: Sequence[tuple[date, str, str]],
+        quoted: list[PricingResult | None],
+        distances: dict[tuple[str, str], int | ValueError],
+        estimated: Container[tuple[str, str]] = (),
+    ) -> list[PricingResult | ValueError]:
+        results: list[PricingResult | ValueError | None] = list(quoted)
+        pending: list[tuple[int, date, str, str, int]] = []
+        for k, ((start_date, from_city, to_city), q) in enumerate(zip(items, quoted)):
+            if q is not None:
+                continue
+            distance_km = distances[(from_city, to_city)]
+            if isinstance(distance_km, ValueError):
+                results[k] = distance_km
             else:
-                applied_price_per_km = int(tariff.price_per_km_gt_1000)
-            transport_price = int(applied_price_per_km * distance_km)
+                pending.append((k, start_date, from_city, to_city, distance_km))
+
+        # Все непосчитанные по матрице строки — одним вызовом ядра
+        priced = cls._pricePending(snapshot, pending)
+        for j, (k, start_date, from_city, to_city, distance_km) in enumerate(pending):
+            is_estimated = (from_city, to_city) in estimated
+            results[k] = cls._result(priced, j, start_date, distance_km, is_estimated)
+        return results
 
-        insurance_price = int(round(transport_price * 0.10))
-        duration_hours_float = distance_km * 24 / 1000
-        duration_hours = int(round(duration_hours_float))
-        duration_days = duration_hours // 24
-        duration_hours_remainder = duration_hours % 24
-        eta_date = start_date + timedelta(hours=duration_hours)
+    @staticmethod
+    def _pricePending(
+        snapshot: ReferenceSnapshot, pending: Sequence[tuple[int, date, str, str, int]]
+    ) -> PricedArrays:
+        fixed = [snapshot.getFixedPrice(from_city, to_city) for _, _, from_city, to_city, _ in pending]
+        return priceArrays(
+            distance=[p[4] for p in pending],
+            month=[p[1].month for p in pending],
+            fixed=[MISSING if f is None else f for f in fixed],
+            tariffs=snapshot.tariffs_by_month,
+        )
 
+    @staticmethod
+    def _result(
+        priced: PricedArrays,
+        k: int,
+        start_date: date,
+        distance_km: int,
+        is_distance_estimated: bool = False,
+    ) -> PricingResult | ValueError:
+        transport_price = priced.transport[k]
+        if transport_price == MISSING:
+            return ValueError("Tariff for the selected month not found")
+        rate = priced.rate[k]
+        duration_hours = priced.duration_hours[k]
         return PricingResult(
             distance_km=distance_km,
-            is_fixed_route=is_fixed_route,
-            applied_price_per_km=applied_price_per_km,
+            is_fixed_route=rate == MISSING,
+            applied_price_per_km=None if rate == MISSING else rate,
             transport_price=transport_price,
-            insurance_price=insurance_price,
+            insurance_price=priced.insurance[k],
             duration_hours=duration_hours,
-            duration_days=duration_days,
-            duration_hours_remainder=duration_hours_remainder,
-            eta_date=eta_date,
+            duration_days=duration_hours // 24,
+            duration_hours_remainder=duration_hours % 24,
+            eta_date=start_date + timedelta(hours=duration_hours),
+            is_distance_estimated=is_distance_estimated,
         )
 
+    @classmethod
+    def _price(
+        cls,
+        snapshot: ReferenceSnapshot,
+        start_date: date,
+        from_city: str,
+        to_city: str,
+        distance_km: int,
+        is_distance_estimated: bool = False,
+    ) -> PricingResult:
+        priced = cls._pricePending(snapshot, [(0, start_date, from_city, to_city, distance_km)])
+        result = cls._result(priced, 0, start_date, distance_km, is_distance_estimated)
+        if isinstance(result, ValueError):
+            raise result
+        return result
+
     def createOrder(
         self,
         user_id: int,
@@ -79,9 +227,118 @@ class PricingService:
         from_city_name: str,
         to_city_name: str,
     ) -> Order:
-        pr = self.preview(start_date, from_city_name, to_city_name)
+        with timeStage("create_order", "preview"):
+            pr = self.preview(start_date, from_city_name, to_city_name)
+        with timeStage("create_order", "persist"):
+            values = self._orderValues(pr, user_id, car_brand_model, start_date, from_city_id, to_city_id)
+            order = self.order_repo.add(Order(**values))
+            self.session.flush()
+            self.stats_repo.apply([values])
+        return order
+
+    async def createOrderAsync(
+        self,
+        user_id: int,
+        car_brand_model: str,
+        start_date: date,
+        from_city_id: int,
+        to_city_id: int,
+        from_city_name: str,
+        to_city_name: str,
+    ) -> Order:
+        with timeStage("create_order", "preview"):
+            pr = await self.previewAsync(start_date, from_city_name, to_city_name)
+        with timeStage("create_order", "persist"):
+            values = self._orderValues(pr, user_id, car_brand_model, start_date, from_city_id, to_city_id)
+            order = self.order_repo.add(Order(**values))
+            await self.session.flush()
+            await self.stats_repo.applyAsync([values])
+        return order
+
+    def createOrders(self, drafts: Sequence[OrderDraft]) -> list[int | ValueError]:
+        """
+        Пакетное создание заказов: пользователи проверяются одним запросом, города — по
+        снимку справочников, цены считаются одним пакетом (previewBatch), заказы
+        вставляются многострочным INSERT ... RETURNING. Для каждой строки — id заказа
+        или ошибка; строки с ошибками не вставляются.
+        """
+        with timeStage("create_orders", "validate"):
+            snapshot = getReferenceSnapshot(self.session)
+            user_ids = UserRepository(self.session).existingIds(d.user_id for d in drafts)
+            results = [self._validateDraft(snapshot, d, user_ids) for d in drafts]
+        with timeStage("create_orders", "preview"):
+            valid = [k for k, r in enumerate(results) if r is None]
+            priced = self.previewBatch([self._draftItem(drafts[k]) for k in valid])
+        with timeStage("create_orders", "persist"):
+            rows = self._draftRows(drafts, results, valid, priced)
+            ids = self.order_repo.insertMany([row for _, row in rows])
+            self.stats_repo.apply(row for _, row in rows)
+        return self._draftIds(results, rows, ids)
+
+    async def createOrdersAsync(self, drafts: Sequence[OrderDraft]) -> list[int | ValueError]:
+        with timeStage("create_orders", "validate"):
+            snapshot = await getReferenceSnapshotAsync(self.session)
+            user_ids = await UserRepository(self.session).existingIdsAsync(d.user_id for d in drafts)
+            results = [self._validateDraft(snapshot, d, user_ids) for d in drafts]
+        with timeStage("create_orders", "preview"):
+            valid = [k for k, r in enumerate(results) if r is None]
+            priced = await self.previewBatchAsync([self._draftItem(drafts[k]) for k in valid])
+        with timeStage("create_orders", "persist"):
+            rows = self._draftRows(drafts, results, valid, priced)
+            ids = await self.order_repo.insertManyAsync([row for _, row in rows])
+            await self.stats_repo.applyAsync(row for _, row in rows)
+        return self._draftIds(results, rows, ids)
 
-        order = Order(
+    @staticmethod
+    def _validateDraft(snapshot: ReferenceSnapshot, draft: OrderDraft, user_ids: set[int]) -> ValueError | None:
+        if draft.user_id not in user_ids:
+            return ValueError("User not found")
+        for city_id, name in ((draft.from_city_id, draft.from_city_name), (draft.to_city_id, draft.to_city_name)):
+            city = snapshot.cities_by_id.get(city_id)
+            if city is None:
+                return ValueError(f"City not found: {city_id}")
+            if city.name != name:
+                return ValueError(f"City {city_id} is {city.name}, not {name}")
+        return None
+
+    @staticmethod
+    def _draftItem(draft: OrderDraft) -> tuple[date, str, str]:
+        return draft.start_date, draft.from_city_name, draft.to_city_name
+
+    @classmethod
+    def _draftRows(
+        cls,
+        drafts: Sequence[OrderDraft],
+        results: list,
+        valid: list[int],
+        priced: list[PricingResult | ValueError],
+    ) -> list[tuple[int, dict]]:
+        """Строки для вставки с позициями; ошибки расчета записываются в results"""
+        rows = []
+        for k, pr in zip(valid, priced):
+            if isinstance(pr, ValueError):
+                results[k] = pr
+                continue
+            d = drafts[k]
+            rows.append((k, cls._orderValues(pr, d.user_id, d.car_brand_model, d.start_date, d.from_city_id, d.to_city_id)))
+        return rows
+
+    @staticmethod
+    def _draftIds(results: list, rows: list[tuple[int, dict]], ids: list[int]) -> list[int | ValueError]:
+        for (k, _), order_id in zip(rows, ids):
+            results[k] = order_id
+        return results
+
+    @staticmethod
+    def _orderValues(
+        pr: PricingResult,
+        user_id: int,
+        car_brand_model: str,
+        start_date: date,
+        from_city_id: int,
+        to_city_id: int,
+    ) -> dict:
+        return dict(
             user_id=user_id,
             car_brand_model=car_brand_model,
             from_city_id=from_city_id,
@@ -98,7 +355,3 @@ class PricingService:
             eta_date=pr.eta_date,
             payment_status=PaymentStatus.PENDING,
         )
-        self.order_repo.add(order)
-        return order
-
-
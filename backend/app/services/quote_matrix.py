@@ -0,0 +1,319 @@
+import logging
+import threading
+import weakref
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from datetime import date, timedelta
+from typing import Iterable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.infra.config import getSettings
+from app.infra.reference_cache import (
+    ReferenceSnapshot,
+    TariffRates,
+    getReferenceSnapshot,
+    getReferenceSnapshotAsync,
+)
+from app.infra.distance.distance_index import DistanceIndex, getDistanceIndex, getDistanceIndexAsync
+from app.services.pricing_kernel import MISSING, durationArray, durationHours, priceArrays, priceOne
+from app.services.pricing_service import PricingResult
+
+
+logger = logging.getLogger(__name__)
+
+MONTHS = range(1, 13)
+
+
+@dataclass(frozen=True)
+class _MonthSlice:
+    rate: array  # 'i': применённая ставка за км, MISSING для фиксированных маршрутов
+    transport: array  # 'q': стоимость перевозки, MISSING если цену не посчитать
+    insurance: array  # 'q'
+
+
+def _priceMonth(distance: array, fixed: array, month: int, tariff: TariffRates | None) -> _MonthSlice:
+    """Пересчитывает все пары за месяц одним вызовом ядра расчета"""
+    tariffs = {} if tariff is None else {month: tariff}
+    priced = priceArrays(distance, array("b", [month]) * len(distance), fixed, tariffs)
+    return _MonthSlice(rate=priced.rate, transport=priced.transport, insurance=priced.insurance)
+
+
+class QuoteMatrix:
+    """
+    Предрассчитанные цены для активных городов: город × город × месяц.
+
+    Ячейка пары (i, j) лежит по индексу i * size + j, где i и j — позиции городов,
+    упорядоченных по id. Матрица не изменяется после построения: обновление
+    (refresh) возвращает новый экземпляр, переиспользуя незатронутые массивы.
+    """
+
+    def __init__(
+        self,
+        snapshot: ReferenceSnapshot,
+        city_ids: list[int],
+        distance: array,
+        fixed: array,
+        duration: array,
+        months: dict[int, _MonthSlice],
+    ) -> None:
+        self.snapshot = snapshot
+        self.city_ids = city_ids
+        self.size = len(city_ids)
+        self.distance = distance
+        self.fixed = fixed
+        self.duration = duration
+        self.months = months
+        self._pos_by_id = {cid: i for i, cid in enumerate(city_ids)}
+        self._pos_by_name = {snapshot.cities_by_id[cid].name: i for i, cid in enumerate(city_ids)}
+
+    @staticmethod
+    def activeCityIds(snapshot: ReferenceSnapshot) -> list[int]:
+        return sorted(c.id for c in snapshot.cities_by_id.values() if c.is_active)
+
+    @classmethod
+    def build(
+        cls, snapshot: ReferenceSnapshot, distances: Iterable[tuple[tuple[int, int], int]]
+    ) -> "QuoteMatrix":
+        """Полное построение; distances — пары (a, b) → км, как DistanceIndex.items()"""
+        city_ids = cls.activeCityIds(snapshot)
+        size = len(city_ids)
+        pos = {cid: i for i, cid in enumerate(city_ids)}
+        # Заполняем только известные ячейки, а не ищем каждую из size² пар в словаре
+        distance = array("i", [MISSING]) * (size * size)
+        for (a, b), km in distances:
+            i, j = pos.get(a), pos.get(b)
+            if i is not None and j is not None:
+                distance[i * size + j] = km
+                distance[j * size + i] = km
+        fixed = array("q", [MISSING]) * (size * size)
+        for (a, b), price in snapshot.fixed_routes.items():
+            i, j = pos.get(a), pos.get(b)
+            if i is not None and j is not None:
+                fixed[i * size + j] = price
+        duration = durationArray(distance)
+        months = {m: _priceMonth(distance, fixed, m, snapshot.getTariff(m)) for m in MONTHS}
+        return cls(snapshot, city_ids, distance, fixed, duration, months)
+
+    def sameReferenceData(self, snapshot: ReferenceSnapshot) -> bool:
+        """Снимок отличается от исходного только объектом (перечитан по TTL без изменений)"""
+        return snapshot is self.snapshot or (
+            snapshot.tariffs_by_month == self.snapshot.tariffs_by_month
+            and snapshot.fixed_routes == self.snapshot.fixed_routes
+            and snapshot.cities_by_id == self.snapshot.cities_by_id
+        )
+
+    def _changedCells(
+        self, snapshot: ReferenceSnapshot, changed_pairs: Iterable[tuple[int, int]]
+    ) -> list[int]:
+        pos, size = self._pos_by_id, self.size
+        cells: set[int] = set()
+        for a, b in changed_pairs:
+            i, j = pos.get(a), pos.get(b)
+            if i is not None and j is not None:
+                cells.add(i * size + j)
+                cells.add(j * size + i)
+        old_routes, new_routes = self.snapshot.fixed_routes, snapshot.fixed_routes
+        if old_routes != new_routes:
+            for a, b in old_routes.keys() | new_routes.keys():
+                i, j = pos.get(a), pos.get(b)
+                if i is not None and j is not None and old_routes.get((a, b)) != new_routes.get((a, b)):
+                    cells.add(i * size + j)
+        return sorted(cells)
+
+    def refresh(
+        self, snapshot: ReferenceSnapshot, index: DistanceIndex, changed_pairs: Iterable[tuple[int, int]]
+    ) -> "QuoteMatrix | None":
+        """
+        Применяет изменения к новому снимку: changed_pairs — пары, расстояние которых
+        изменилось в index (DistanceIndex.changesSince). Пересчитываются только месяцы
+        с изменённым тарифом и ячейки изменённых пар и фикс. цен. None — изменился
+        набор активных городов, нужна полная перестройка.
+        """
+        city_ids = self.activeCityIds(snapshot)
+        if city_ids != self.city_ids:
+            return None
+
+        distance, fixed, duration = self.distance, self.fixed, self.duration
+        cells = self._changedCells(snapshot, changed_pairs)
+        if cells:
+            distance, fixed, duration = distance[:], fixed[:], duration[:]
+            for k in cells:
+                a, b = city_ids[k // self.size], city_ids[k % self.size]
+                km = index.get(a, b)
+                distance[k] = MISSING if km is None else km
+                fixed[k] = snapshot.fixed_routes.get((a, b), MISSING)
+                duration[k] = MISSING if km is None else durationHours(km)
+
+        months: dict[int, _MonthSlice] = {}
+        for m in MONTHS:
+            tariff = snapshot.getTariff(m)
+            if tariff != self.snapshot.getTariff(m):
+                months[m] = _priceMonth(distance, fixed, m, tariff)
+            elif cells:
+                old = self.months[m]
+                part = _MonthSlice(old.rate[:], old.transport[:], old.insurance[:])
+                tariffs = {} if tariff is None else {m: tariff}
+                for k in cells:
+                    part.rate[k], part.transport[k], part.insurance[k], _ = priceOne(
+                        distance[k], m, fixed[k], tariffs
+                    )
+                months[m] = part
+            else:
+                months[m] = self.months[m]
+
+        return QuoteMatrix(snapshot, city_ids, distance, fixed, duration, months)
+
+    def lookup(self, start_date: date, from_city: str, to_city: str) -> PricingResult | None:
+        """O(1) расчет по матрице; None, если пару нужно считать обычным путем"""
+        i = self._pos_by_name.get(from_city)
+        j = self._pos_by_name.get(to_city)
+        if i is None or j is None:
+            return None
+        k = i * self.size + j
+        part = self.months[start_date.month]
+        transport_price = part.transport[k]
+        if transport_price == MISSING:
+            return None
+
+        rate = part.rate[k]
+        duration_hours = self.duration[k]
+        return PricingResult(
+            distance_km=self.distance[k],
+            is_fixed_route=self.fixed[k] != MISSING,
+            applied_price_per_km=None if rate == MISSING else rate,
+            transport_price=transport_price,
+            insurance_price=part.insurance[k],
+            duration_hours=duration_hours,
+            duration_days=duration_hours // 24,
+            duration_hours_remainder=duration_hours % 24,
+            eta_date=start_date + timedelta(hours=duration_hours),
+        )
+
+
+@dataclass(frozen=True)
+class _Entry:
+    # None — городов больше порога, матрица не строится
+    matrix: QuoteMatrix | None
+    snapshot: ReferenceSnapshot
+    index: DistanceIndex
+    index_version: int
+
+
+class QuoteMatrixCache:
+    """
+    Матрица на каждый engine; обновляется вместе со снимком справочников и при
+    изменении общего индекса расстояний (расстояния берутся из него, без запроса к БД).
+
+    Запрос матрицу не строит и не ждет: если она устарела, обновление ставится
+    в фоновый поток (одно на engine), а запрос считается обычным путем. Готовая
+    матрица подменяется целиком. При изменении отдельных расстояний, фикс. цен или
+    тарифов пересчитываются только затронутые ячейки и месяцы; при изменении
+    набора городов — вся матрица. Если активных городов больше max_cities,
+    матрица не строится (size² ячеек на 12 месяцев не помещаются в память воркера).
+    """
+
+    def __init__(self, max_cities: int | None = None) -> None:
+        self.max_cities = max_cities if max_cities is not None else getSettings().quote_matrix_max_cities
+        self._lock = threading.Lock()
+        self._entries: "weakref.WeakKeyDictionary[object, _Entry]" = weakref.WeakKeyDictionary()
+        self._pending: "weakref.WeakKeyDictionary[object, Future]" = weakref.WeakKeyDictionary()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="quote-matrix")
+
+    @staticmethod
+    def _key(session: Session | AsyncSession) -> object:
+        bind = session.get_bind()
+        return getattr(bind, "engine", bind)
+
+    def _store(self, key: object, entry: _Entry, replaces: _Entry | None = None) -> None:
+        # Записи подменяются целиком под блокировкой; с replaces — только если запись
+        # не успел заменить фоновый поток
+        with self._lock:
+            if replaces is None or self._entries.get(key) is replaces:
+                self._entries[key] = entry
+
+    def _isCurrent(
+        self, key: object, entry: _Entry | None, snapshot: ReferenceSnapshot, index: DistanceIndex
+    ) -> bool:
+        if entry is None:
+            return False
+        if entry.snapshot is not snapshot:
+            matrix = entry.matrix
+            if matrix is None or not matrix.sameReferenceData(snapshot):
+                return False
+            # Снимок перечитан без изменений: дальше сравниваем по identity
+            self._store(key, replace(entry, snapshot=snapshot), replaces=entry)
+        return entry.matrix is None or (entry.index is index and entry.index_version == index.version)
+
+    def _update(self, key: object, snapshot: ReferenceSnapshot, index: DistanceIndex) -> None:
+        entry = self._entries.get(key)
+        if self._isCurrent(key, entry, snapshot, index):
+            return
+        city_count = sum(1 for c in snapshot.cities_by_id.values() if c.is_active)
+        if city_count > self.max_cities:
+            self._store(key, _Entry(None, snapshot, index, index.version))
+            return
+
+        matrix = None
+        if entry is not None and entry.matrix is not None and entry.index is index:
+            version, changed_pairs = index.changesSince(entry.index_version)
+            if changed_pairs is not None:
+                matrix = entry.matrix.refresh(snapshot, index, changed_pairs)
+        if matrix is None:
+            version, distances = index.versionedItems()
+            matrix = QuoteMatrix.build(snapshot, distances)
+        self._store(key, _Entry(matrix, snapshot, index, version))
+
+    def _run(self, key: object, snapshot: ReferenceSnapshot, index: DistanceIndex) -> None:
+        try:
+            self._update(key, snapshot, index)
+        except Exception:
+            logger.exception("Quote matrix update failed")
+
+    def _schedule(self, key: object, snapshot: ReferenceSnapshot, index: DistanceIndex) -> Future:
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None or future.done():
+                future = self._executor.submit(self._run, key, snapshot, index)
+                self._pending[key] = future
+            return future
+
+    def _resolve(
+        self, key: object, snapshot: ReferenceSnapshot, index: DistanceIndex, wait: bool
+    ) -> QuoteMatrix | None:
+        entry = self._entries.get(key)
+        if self._isCurrent(key, entry, snapshot, index):
+            return entry.matrix
+        future = self._schedule(key, snapshot, index)
+        if not wait:
+            return None
+        future.result()
+        # Фоновая задача могла быть поставлена для более старого снимка — тогда еще круг
+        entry = self._entries.get(key)
+        if self._isCurrent(key, entry, snapshot, index):
+            return entry.matrix
+        self._schedule(key, snapshot, index).result()
+        entry = self._entries.get(key)
+        return entry.matrix if self._isCurrent(key, entry, snapshot, index) else None
+
+    def get(self, session: Session, wait: bool = False) -> QuoteMatrix | None:
+        """Актуальная матрица или None; wait=True — дождаться фонового обновления (скрипты, тесты)"""
+        return self._resolve(self._key(session), getReferenceSnapshot(session), getDistanceIndex(session), wait)
+
+    async def getAsync(self, session: AsyncSession) -> QuoteMatrix | None:
+        snapshot = await getReferenceSnapshotAsync(session)
+        index = await getDistanceIndexAsync(session)
+        return self._resolve(self._key(session), snapshot, index, wait=False)
+
+
+quoteMatrixCache = QuoteMatrixCache()
+
+
+def getQuoteMatrix(session: Session, wait: bool = False) -> QuoteMatrix | None:
+    return quoteMatrixCache.get(session, wait)
+
+
+async def getQuoteMatrixAsync(session: AsyncSession) -> QuoteMatrix | None:
+    return await quoteMatrixCache.getAsync(session)
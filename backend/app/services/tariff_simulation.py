@@ -0,0 +1,120 @@
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.infra.metrics import timeStage
+from app.infra.reference_cache import TariffRates, getReferenceSnapshot
+from app.repositories.order_repo import OrderRepository
+from app.services.pricing_kernel import MISSING, priceArrays
+
+
+@dataclass(frozen=True)
+class TariffProposal:
+    """Предлагаемые изменения справочников; что не указано — остается как сейчас"""
+
+    # month → новые ставки
+    tariffs: dict[int, TariffRates] = field(default_factory=dict)
+    # (from_city_id, to_city_id) → новая фиксированная цена; None — снять фиксированную цену
+    fixed_routes: dict[tuple[int, int], Optional[int]] = field(default_factory=dict)
+
+
+@dataclass
+class TariffSimulation:
+    """Суммы [orders, current_transport, proposed_transport, current_insurance, proposed_insurance]"""
+
+    total: list[int]
+    by_month: dict[int, list[int]]  # месяц тарифа 1..12 → суммы
+    by_route: dict[tuple[int, int], list[int]]
+    by_band: dict[int, list[int]]  # индекс диапазона расстояний → суммы
+    distance_bands: list[int]
+    # Заказы, которые нельзя переоценить: нет тарифа на месяц сейчас или в предложении
+    unpriced_orders: int = 0
+
+
+def _checkBands(distance_bands: Sequence[int]) -> list[int]:
+    bands = list(distance_bands)
+    if any(b <= 0 for b in bands) or any(a >= b for a, b in zip(bands, bands[1:])):
+        raise ValueError("distance_bands must be positive and strictly increasing")
+    return bands
+
+
+def _accumulate(acc: dict, keys: Sequence, columns: Sequence[Sequence[int]]) -> None:
+    # Горячий цикл: без enumerate и вложенных вызовов на строку
+    for key, orders, cur_t, new_t, cur_i, new_i in zip(keys, *columns):
+        sums = acc.get(key)
+        if sums is None:
+            acc[key] = [orders, cur_t, new_t, cur_i, new_i]
+        else:
+            sums[0] += orders
+            sums[1] += cur_t
+            sums[2] += new_t
+            sums[3] += cur_i
+            sums[4] += new_i
+
+
+def simulateTariffs(
+    session: Session,
+    proposal: TariffProposal,
+    distance_bands: Sequence[int] = (500, 1000, 2000, 3000),
+    start_from: Optional[date] = None,
+    start_to: Optional[date] = None,
+    batch_size: int = 50_000,
+) -> TariffSimulation:
+    """
+    Переоценка исторических заказов по текущим и предлагаемым тарифам. Заказы читаются
+    группами с одинаковой ценой (месяц тарифа, маршрут, расстояние) пачками по batch_size,
+    каждая пачка считается двумя вызовами ядра. Разбивка по месяцам — по месяцу тарифа;
+    конкретный год выбирается фильтром по дате. Ничего не пишет: на PostgreSQL
+    транзакция объявляется READ ONLY.
+    """
+    bands = _checkBands(distance_bands)
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(text("SET TRANSACTION READ ONLY"))
+
+    snapshot = getReferenceSnapshot(session)
+    current_tariffs = dict(snapshot.tariffs_by_month)
+    proposed_tariffs = {**current_tariffs, **proposal.tariffs}
+    current_fixed = dict(snapshot.fixed_routes)
+    proposed_fixed = {**current_fixed, **proposal.fixed_routes}
+    proposed_fixed = {key: price for key, price in proposed_fixed.items() if price is not None}
+
+    result = TariffSimulation(total=[0] * 5, by_month={}, by_route={}, by_band={}, distance_bands=bands)
+    band_of: dict[int, int] = {}
+    repo = OrderRepository(session)
+    for groups in repo.iterPricingGroups(start_from=start_from, start_to=start_to, batch_size=batch_size):
+        # Пачка групп по колонкам: дальше только проходы по массивам
+        months, from_ids, to_ids, distances, counts = zip(*groups)
+        routes = list(zip(from_ids, to_ids))
+        with timeStage("tariff_simulation", "price"):
+            current_fixed_col = [current_fixed.get(r, MISSING) for r in routes]
+            proposed_fixed_col = [proposed_fixed.get(r, MISSING) for r in routes]
+            current = priceArrays(distances, months, current_fixed_col, current_tariffs)
+            proposed = priceArrays(distances, months, proposed_fixed_col, proposed_tariffs)
+
+        with timeStage("tariff_simulation", "aggregate"):
+            unpriced = {
+                k
+                for k, (cur, new) in enumerate(zip(current.transport, proposed.transport))
+                if cur == MISSING or new == MISSING
+            }
+            result.unpriced_orders += sum(counts[k] for k in unpriced)
+            keep = [k for k in range(len(counts)) if k not in unpriced] if unpriced else range(len(counts))
+            columns = (
+                [counts[k] for k in keep],
+                [current.transport[k] * counts[k] for k in keep],
+                [proposed.transport[k] * counts[k] for k in keep],
+                [current.insurance[k] * counts[k] for k in keep],
+                [proposed.insurance[k] * counts[k] for k in keep],
+            )
+            for d in set(distances) - band_of.keys():
+                band_of[d] = bisect_left(bands, d)
+            _accumulate(result.by_month, [months[k] for k in keep], columns)
+            _accumulate(result.by_route, [routes[k] for k in keep], columns)
+            _accumulate(result.by_band, [band_of[distances[k]] for k in keep], columns)
+            for i, column in enumerate(columns):
+                result.total[i] += sum(column)
+    return result
@@ -0,0 +1,81 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPBasicCredentials
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import app.api.deps as deps
+import app.infra.security as security
+from app.infra.config import Settings
+from app.infra.db import Base
+from app.infra.security import VerifiedCredentialCache, hashPassword, issueSessionToken, verifySessionToken
+from app.repositories.models import Admin
+
+
+def test_session_token_roundtrip_tamper_and_expiry():
+    token, session = issueSessionToken(7)
+    assert verifySessionToken(token) == session
+    assert session.admin_id == 7 and session.expires_at > time.time()
+
+    payload, signature = token.split(".")
+    assert verifySessionToken(payload + "." + signature[:-2] + "AA") is None
+    assert verifySessionToken(payload[:-1] + "x." + signature) is None
+    assert verifySessionToken("garbage") is None
+    assert verifySessionToken(token, now=session.expires_at) is None
+
+
+def test_startup_requires_shared_session_secret_outside_debug(monkeypatch):
+    monkeypatch.setattr(security, "getSettings", lambda: Settings(admin_session_secret="", api_debug=False))
+    with pytest.raises(RuntimeError, match="ADMIN_SESSION_SECRET"):
+        security.checkSessionSecret()
+
+    monkeypatch.setattr(security, "getSettings", lambda: Settings(admin_session_secret="", api_debug=True))
+    security.checkSessionSecret()
+    monkeypatch.setattr(security, "getSettings", lambda: Settings(admin_session_secret="k", api_debug=False))
+    security.checkSessionSecret()
+
+
+def test_basic_auth_runs_bcrypt_once_per_credentials(monkeypatch):
+    engine = create_engine("sqlite+pysqlite:///:memory:", future=True)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine, autoflush=False, future=True)
+    with factory() as s:
+        s.add(Admin(login="admin", password_hash=hashPassword("secret")))
+        s.commit()
+
+    calls = []
+    verify = deps.verifyPassword
+    monkeypatch.setattr(deps, "verifyPassword", lambda p, h: calls.append(p) or verify(p, h))
+    monkeypatch.setattr(deps, "basicCredentialCache", VerifiedCredentialCache(maxsize=1, ttl_seconds=60))
+
+    good = HTTPBasicCredentials(username="admin", password="secret")
+    bad = HTTPBasicCredentials(username="admin", password="wrong")
+    for _ in range(3):
+        deps.requireAdmin(authorization=None, credentials=good, session_factory=factory)
+    assert calls == ["secret"]
+
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            deps.requireAdmin(authorization=None, credentials=bad, session_factory=factory)
+    assert calls == ["secret", "wrong", "wrong"]  # неудачные попытки не кешируются
+
+    token, _ = issueSessionToken(1)
+    deps.requireAdmin(authorization=f"Bearer {token}", credentials=None, session_factory=None)
+    assert len(calls) == 3
+
+
+def test_credential_cache_is_bounded_and_expires():
+    cache = VerifiedCredentialCache(maxsize=2, ttl_seconds=60)
+    cache.put("a", "1", 1)
+    cache.put("b", "2", 2)
+    assert cache.get("a", "1") == 1  # "a" становится самым свежим
+    cache.put("c", "3", 3)
+    assert cache.get("b", "2") is None
+    assert cache.get("a", "1") == 1 and cache.get("c", "3") == 3
+    assert cache.get("a", "wrong") is None
+
+    short = VerifiedCredentialCache(maxsize=2, ttl_seconds=0)
+    short.put("a", "1", 1)
+    assert short.get("a", "1") is None
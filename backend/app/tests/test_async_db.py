@@ -0,0 +1,118 @@
+import asyncio
+from datetime import date
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.infra.db import Base
+from app.infra.distance.provider import HybridDistanceProvider
+from app.repositories.models import City, CityDistance, FixedRoute, Tariff
+from app.repositories.order_repo import OrderRepository
+from app.services.pricing_service import PricingService
+from app.tests.test_order_pagination import make_session_with_orders
+
+
+
+class FakeAsyncOsrm:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def getDistanceKm(self, from_city, to_city, from_coords, to_coords):
+        self.calls += 1
+        await asyncio.sleep(0)
+        return 1600
+
+
+def make_db(tmp_path):
+    url = f"sqlite:///{tmp_path / 'db.sqlite'}"
+    engine = create_engine(url, future=True)
+    Base.metadata.create_all(bind=engine)
+    s = sessionmaker(bind=engine, autoflush=False, future=True)()
+    s.add(Tariff(month=1, price_per_km_le_1000=150, price_per_km_gt_1000=100))
+    msk = City(name="Москва", latitude=55.75, longitude=37.61)
+    spb = City(name="Санкт-Петербург", latitude=59.93, longitude=30.33)
+    sochi = City(name="Сочи", latitude=43.60, longitude=39.73)
+    s.add_all([msk, spb, sochi])
+    s.flush()
+    s.add(FixedRoute(from_city_id=msk.id, to_city_id=sochi.id, fixed_price=200_000))
+    s.add(CityDistance(from_city_id=spb.id, to_city_id=msk.id, distance_km=700))
+    s.commit()
+    return s, create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+
+
+def test_async_preview_matches_sync_and_stores_osrm_distance_once(tmp_path):
+    s, async_engine = make_db(tmp_path)
+    osrm = FakeAsyncOsrm()
+    items = [
+        (date(2025, 1, 5), "Санкт-Петербург", "Москва"),
+        (date(2025, 1, 5), "Москва", "Сочи"),
+        (date(2025, 1, 5), "Сочи", "Москва"),
+        (date(2025, 1, 5), "Москва", "Казань"),
+    ]
+
+    async def run():
+        async with async_sessionmaker(async_engine, expire_on_commit=False)() as session:
+            service = PricingService(session, HybridDistanceProvider(session, async_osrm=osrm))
+            single = await service.previewAsync(*items[0])
+            batch = await service.previewBatchAsync(items)
+            await session.commit()
+        await async_engine.dispose()
+        return single, batch
+
+    single, batch = asyncio.run(run())
+
+    expected = PricingService(s, HybridDistanceProvider(s)).preview(*items[0])
+    assert single == expected == batch[0]
+    assert batch[1].is_fixed_route is True and batch[1].distance_km == 1600
+    assert batch[2].distance_km == 1600
+    assert isinstance(batch[3], ValueError)
+    # Москва–Сочи и Сочи–Москва — один запрос в OSRM и одна строка в БД
+    assert osrm.calls == 1
+    assert s.query(CityDistance).count() == 2
+
+
+def test_async_order_queries_match_sync(tmp_path):
+    url = f"sqlite:///{tmp_path / 'orders.sqlite'}"
+    s = make_session_with_orders(url=url)
+    repo = OrderRepository(s)
+    async_engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+
+    async def run():
+        async with async_sessionmaker(async_engine)() as session:
+            async_repo = OrderRepository(session)
+            page = await async_repo.queryAsync(page=2, limit=5)
+            first = await async_repo.queryKeysetAsync(order_by_cost=True, limit=5)
+            second = await async_repo.queryKeysetAsync(order_by_cost=True, cursor=first.next_cursor, limit=5)
+            row = await async_repo.getDtoRowAsync(page.items[0].id)
+        await async_engine.dispose()
+        return page, second, row
+
+    page, second, row = asyncio.run(run())
+
+    sync_page = repo.query(page=2, limit=5)
+    sync_first = repo.queryKeyset(order_by_cost=True, limit=5)
+    sync_second = repo.queryKeyset(order_by_cost=True, cursor=sync_first.next_cursor, limit=5)
+    assert [r.id for r in page.items] == [r.id for r in sync_page.items]
+    assert page.total == sync_page.total == 23
+    assert [r.id for r in second.items] == [r.id for r in sync_second.items]
+    assert row == repo.getDtoRow(page.items[0].id)
+
+
+def test_app_imports_with_a_sync_only_database_url():
+    import os
+    import subprocess
+    import sys
+
+    env = dict(os.environ, DATABASE_URL="sqlite:///:memory:", BOOTSTRAP_ON_STARTUP="false")
+    code = "import app.main, app.infra.db as db; assert db._async_session_factory is None"
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
+
+
+def test_async_url_maps_sync_drivers_only():
+    from app.infra.db import asyncDatabaseUrl
+
+    assert asyncDatabaseUrl("sqlite:///x.db") == "sqlite+aiosqlite:///x.db"
+    assert asyncDatabaseUrl("postgresql://u:p@h/db") == "postgresql+psycopg://u:p@h/db"
+    assert asyncDatabaseUrl("postgresql+psycopg://u:p@h/db") == "postgresql+psycopg://u:p@h/db"
+    assert asyncDatabaseUrl("postgresql+asyncpg://u:p@h/db") == "postgresql+asyncpg://u:p@h/db"
@@ -0,0 +1,88 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.api.v1.tariffs import router
+from app.infra.db import Base, getSession
+from app.repositories.models import Tariff
+
+
+def make_client(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'catalog.sqlite'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine, autoflush=False)
+    with factory() as s:
+        s.add_all([Tariff(month=m, price_per_km_le_1000=150, price_per_km_gt_1000=100) for m in (1, 2)])
+        s.commit()
+
+    def override():
+        with factory() as s:
+            yield s
+            s.commit()
+
+    app = FastAPI()
+    app.include_router(router, prefix="/tariffs")
+    app.dependency_overrides[getSession] = override
+    return TestClient(app), engine, factory
+
+
+def test_if_none_match_returns_304_without_reading_rows(tmp_path):
+    client, engine, factory = make_client(tmp_path)
+    first = client.get("/tariffs")
+    etag = first.headers["etag"]
+    assert first.status_code == 200 and len(first.json()) == 2
+    assert etag.startswith('"tariffs-') and "max-age=" in first.headers["cache-control"]
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    cached = client.get("/tariffs", headers={"If-None-Match": f'W/"other", {etag}'})
+    assert cached.status_code == 304 and cached.content == b""
+    assert cached.headers["etag"] == etag
+    assert len(statements) == 1 and "count(*)" in statements[0]
+
+    with factory() as s:
+        s.get(Tariff, 1).price_per_km_gt_1000 = 90
+        s.commit()
+    changed = client.get("/tariffs", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+
+    with factory() as s:
+        s.delete(s.get(Tariff, 2))
+        s.commit()
+    assert client.get("/tariffs", headers={"If-None-Match": changed.headers["etag"]}).status_code == 200
+
+
+def test_fixed_routes_etag_follows_city_renames(tmp_path):
+    from app.api.v1.meta import router as meta_router
+    from app.repositories.models import City, FixedRoute
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'routes.sqlite'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine, autoflush=False)
+    with factory() as s:
+        a, b = City(name="Москва"), City(name="Сочи")
+        s.add_all([a, b])
+        s.flush()
+        s.add(FixedRoute(from_city_id=a.id, to_city_id=b.id, fixed_price=200_000))
+        s.commit()
+
+    def override():
+        with factory() as s:
+            yield s
+            s.commit()
+
+    app = FastAPI()
+    app.include_router(meta_router, prefix="/meta")
+    app.dependency_overrides[getSession] = override
+    client = TestClient(app)
+
+    first = client.get("/meta/fixed-routes")
+    etag = first.headers["etag"]
+    assert client.get("/meta/fixed-routes", headers={"If-None-Match": etag}).status_code == 304
+
+    with factory() as s:
+        s.query(City).filter_by(name="Сочи").one().name = "Адлер"
+        s.commit()
+    renamed = client.get("/meta/fixed-routes", headers={"If-None-Match": etag})
+    assert renamed.status_code == 200 and renamed.json()[0]["to_city"] == "Адлер"
@@ -0,0 +1,166 @@
+from sqlalchemy import event
+
+from app.infra.distance.distance_index import forgetDistance, getDistanceIndex, recordDistance
+from app.infra.distance.provider import HybridDistanceProvider
+from app.repositories.models import City, CityDistance
+from app.tests.test_pricing import make_session
+
+
+class FakeOsrm:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def getDistanceKm(self, from_city, to_city, from_coords, to_coords):
+        self.calls += 1
+        return 1600
+
+
+def seed_cities(s):
+    msk = City(name="Москва", latitude=55.75, longitude=37.61)
+    spb = City(name="Санкт-Петербург", latitude=59.93, longitude=30.33)
+    sochi = City(name="Сочи", latitude=43.60, longitude=39.73)
+    s.add_all([msk, spb, sochi])
+    s.flush()
+    s.add(CityDistance(from_city_id=spb.id, to_city_id=msk.id, distance_km=700))
+    s.commit()
+    return msk, spb, sochi
+
+
+def test_known_pairs_are_served_without_sql_in_both_directions():
+    s = make_session()
+    seed_cities(s)
+    osrm = FakeOsrm()
+    provider = HybridDistanceProvider(s, osrm_provider=osrm)
+    assert provider.getDistanceKm("Санкт-Петербург", "Москва") == 700  # прогрев
+    assert provider.getDistanceKm("Москва", "Сочи") == 1600  # OSRM
+    s.commit()
+
+    statements = []
+    event.listen(s.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    assert provider.getDistanceKm("Москва", "Санкт-Петербург") == 700
+    assert provider.getDistanceKm("Сочи", "Москва") == 1600
+    batch = provider.getDistancesKm([("Москва", "Сочи"), ("Санкт-Петербург", "Москва")])
+    assert batch == {("Москва", "Сочи"): 1600, ("Санкт-Петербург", "Москва"): 700}
+    assert statements == []
+    assert osrm.calls == 1
+
+
+def test_index_is_updated_only_after_commit():
+    s = make_session()
+    msk, spb, sochi = seed_cities(s)
+    index = getDistanceIndex(s)
+
+    recordDistance(s, msk.id, spb.id, 710)
+    s.rollback()
+    assert index.get(spb.id, msk.id) == 700
+
+    recordDistance(s, msk.id, spb.id, 710)
+    recordDistance(s, sochi.id, msk.id, 1500)
+    s.commit()
+    assert index.get(spb.id, msk.id) == 710
+    assert index.get(msk.id, sochi.id) == 1500
+
+    forgetDistance(s, msk.id, sochi.id)
+    s.commit()
+    assert index.get(msk.id, sochi.id) is None
+
+
+def test_quote_matrix_follows_index_changes_without_reloading_snapshot():
+    from datetime import date
+
+    from app.infra.reference_cache import getReferenceSnapshot
+    from app.repositories.models import Tariff
+    from app.services.quote_matrix import getQuoteMatrix
+
+    s = make_session()
+    s.add(Tariff(month=1, price_per_km_le_1000=150, price_per_km_gt_1000=100))
+    msk, spb, _ = seed_cities(s)
+    snapshot = getReferenceSnapshot(s)
+    assert getQuoteMatrix(s, wait=True).lookup(date(2025, 1, 5), "Москва", "Санкт-Петербург").distance_km == 700
+
+    recordDistance(s, spb.id, msk.id, 650)
+    s.commit()
+    assert getReferenceSnapshot(s) is snapshot
+    assert getQuoteMatrix(s, wait=True).lookup(date(2025, 1, 5), "Москва", "Санкт-Петербург").distance_km == 650
+
+
+def test_pairs_are_stored_once_under_canonical_key():
+    from app.repositories.city_distance_repo import CityDistanceRepository
+
+    s = make_session()
+    msk, spb, sochi = seed_cities(s)
+    stored = s.query(CityDistance).one()
+    assert (stored.from_city_id, stored.to_city_id) == (msk.id, spb.id)
+
+    repo = CityDistanceRepository(s)
+    statements = []
+    event.listen(s.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    assert repo.find(spb.id, msk.id).distance_km == 700
+    assert " OR " not in statements[-1]
+
+    # Параллельный промах OSRM по той же паре (в любом направлении) не создает дубль
+    repo.bulkCreate([
+        {"from_city_id": sochi.id, "to_city_id": msk.id, "distance_km": 1600, "is_manual": False},
+        {"from_city_id": msk.id, "to_city_id": sochi.id, "distance_km": 1601, "is_manual": False},
+        {"from_city_id": spb.id, "to_city_id": msk.id, "distance_km": 999, "is_manual": False},
+    ])
+    assert "ON CONFLICT" in statements[-1]
+    s.commit()
+    assert repo.loadMap() == {
+        (msk.id, spb.id): 700,
+        (spb.id, msk.id): 700,
+        (msk.id, sochi.id): 1600,
+        (sochi.id, msk.id): 1600,
+    }
+
+
+def test_reload_keeps_index_and_version_when_nothing_changed(tmp_path):
+    from app.infra.distance.distance_index import DistanceIndexCache
+
+    s = make_session()
+    msk, spb, sochi = seed_cities(s)
+    cache = DistanceIndexCache(ttl_seconds=0)
+    index = cache.get(s)
+    version = index.version
+    assert cache.get(s) is index and index.version == version
+
+    s.add(CityDistance(from_city_id=msk.id, to_city_id=sochi.id, distance_km=1600))
+    s.commit()
+    assert cache.get(s) is index and index.version == version + 1
+    assert index.get(sochi.id, msk.id) == 1600
+
+
+def test_concurrent_async_reloads_read_the_table_once(tmp_path):
+    import asyncio
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.infra.db import Base
+    from app.infra.distance.distance_index import DistanceIndexCache
+
+    url = f"sqlite:///{tmp_path / 'index.sqlite'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as s:
+        seed_cities(s)
+    async_engine = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+    statements = []
+    event.listen(async_engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    cache = DistanceIndexCache(ttl_seconds=0)
+
+    async def load():
+        async with async_sessionmaker(async_engine)() as session:
+            return await cache.getAsync(session)
+
+    async def main():
+        first = await load()
+        statements.clear()
+        indexes = await asyncio.gather(*(load() for _ in range(10)))
+        await async_engine.dispose()
+        return first, indexes
+
+    first, indexes = asyncio.run(main())
+    assert all(index is first for index in indexes) and first.version == 0
+    assert sum("city_distances" in sql for sql in statements) == 1
@@ -0,0 +1,132 @@
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.infra.db import Base
+from app.infra.distance.provider import OSRMProvider
+from app.repositories.distance_prefill_repo import DistancePrefillRepository
+from app.repositories.models import City, CityDistance
+from app.services.distance_prefill import DistancePrefillJob, getPrefillProgress
+
+
+def make_session_factory():
+    engine = create_engine(
+        "sqlite+pysqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine, autoflush=False, future=True)
+
+
+def test_prefill_inserts_table_distances_in_chunks():
+    factory = make_session_factory()
+    s = factory()
+    new_city = City(name="Новый", latitude=50.0, longitude=40.0)
+    others = [City(name=f"Город {i}", latitude=51.0 + i, longitude=41.0 + i) for i in range(5)]
+    s.add_all([new_city, *others, City(name="Без координат"), City(name="Закрыт", is_active=False, latitude=1.0, longitude=1.0)])
+    s.flush()
+    s.add(CityDistance(from_city_id=others[0].id, to_city_id=new_city.id, distance_km=111))
+    s.commit()
+    new_city_id, raced_city_id = new_city.id, others[1].id
+    s.close()
+
+    requests = []
+
+    def osrm_stand_in(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if len(requests) == 1:
+            # Пока идет запрос, пару из пачки записывает фоновое уточнение расстояния
+            with factory() as other:
+                other.add(CityDistance(from_city_id=new_city_id, to_city_id=raced_city_id, distance_km=999))
+                other.commit()
+        destinations = request.url.params["destinations"].split(";")
+        # последний город в каждой пачке недостижим
+        row = [1000.0 * 100 * int(i) for i in destinations[:-1]] + [None]
+        return httpx.Response(200, json={"code": "Ok", "distances": [row]})
+
+    osrm = OSRMProvider(base_url="http://osrm.local", client=httpx.Client(transport=httpx.MockTransport(osrm_stand_in)))
+    progress = DistancePrefillJob(factory, osrm=osrm, chunk_size=2).run(new_city_id)
+
+    assert len(requests) == 2
+    assert requests[0].url.path.startswith("/table/v1/driving/40.0,50.0;")
+    assert progress.total_pairs == 4
+    assert progress.processed_pairs == 4
+    assert progress.inserted == 1
+    assert progress.failed == 2
+    assert progress.finished is True
+
+    s = factory()
+    run = getPrefillProgress(s, new_city_id)
+    assert (run.total_pairs, run.processed_pairs, run.inserted, run.failed) == (4, 4, 1, 2)
+    assert run.finished is True
+    # Пары хранятся под каноническим ключом: у нового города меньший id, он всегда from_city_id
+    rows = s.query(CityDistance).filter_by(from_city_id=new_city_id).all()
+    assert sorted(r.distance_km for r in rows) == [100, 111, 999]
+    assert all(r.is_manual is False for r in rows)
+
+
+def make_osrm(requests):
+    def osrm_stand_in(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        destinations = request.url.params["destinations"].split(";")
+        return httpx.Response(200, json={"code": "Ok", "distances": [[500_000.0] * len(destinations)]})
+
+    return OSRMProvider(base_url="http://osrm.local", client=httpx.Client(transport=httpx.MockTransport(osrm_stand_in)))
+
+
+def test_prefill_endpoints_report_the_stored_run(monkeypatch, tmp_path):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app.api.deps import requireAdmin
+    from app.api.v1 import cities
+    from app.infra.db import getSession
+
+    # Файловая БД: у каждой сессии свое соединение, незакоммиченное другим не видно
+    engine = create_engine(f"sqlite:///{tmp_path / 'prefill.sqlite'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine, autoflush=False)
+    with factory() as s:
+        s.add(City(name="Старый", latitude=51.0, longitude=41.0))
+        s.commit()
+
+    requests, queued = [], []
+
+    def run_prefill(city_id):
+        queued.append(city_id)
+        DistancePrefillJob(factory, osrm=make_osrm(requests)).run(city_id)
+
+    def override():
+        with factory() as s:
+            try:
+                yield s
+                s.commit()
+            except Exception:
+                s.rollback()
+                raise
+
+    monkeypatch.setattr(cities, "runDistancePrefill", run_prefill)
+    app = FastAPI()
+    app.include_router(cities.router, prefix="/cities")
+    app.dependency_overrides[getSession] = override
+    app.dependency_overrides[requireAdmin] = lambda: None
+    client = TestClient(app)
+
+    # Город создается без commit в эндпоинте; задача видит его после commit сессии запроса
+    created = client.post("/cities", json={"name": "Новый", "latitude": 50.0, "longitude": 40.0})
+    assert created.status_code == 201
+    city_id = created.json()["id"]
+    status = client.get(f"/cities/{city_id}/distance-prefill").json()
+    assert (status["total_pairs"], status["inserted"], status["finished"]) == (1, 1, True)
+    assert len(requests) == 1
+
+    # Идущий запуск не дублируется: ответ — его сохраненное состояние
+    with factory() as s:
+        DistancePrefillRepository(s).update(city_id, finished=False, processed_pairs=0)
+        s.commit()
+    again = client.post(f"/cities/{city_id}/distance-prefill")
+    assert again.status_code == 202
+    assert (again.json()["total_pairs"], again.json()["processed_pairs"]) == (1, 0)
+    assert queued == [city_id]
+
+    assert client.get("/cities/999/distance-prefill").status_code == 404
@@ -0,0 +1,63 @@
+from datetime import date
+
+import pytest
+
+from app.infra.distance.geodesic import DEFAULT_DETOUR_FACTOR, DetourModel, haversineKm
+from app.infra.distance.provider import HybridDistanceProvider
+from app.infra.reference_cache import CityRef
+from app.repositories.models import City, CityDistance, Tariff
+from app.services.pricing_service import PricingService
+from app.tests.test_distance_index import FakeOsrm, seed_cities
+from app.tests.test_pricing import make_session
+
+
+def city(id_, lat, lon):
+    return CityRef(id_, f"c{id_}", True, lat, lon)
+
+
+def test_haversine_moscow_saint_petersburg():
+    (km,) = haversineKm([55.7558], [37.6173], [59.9343], [30.3351])
+    assert km == pytest.approx(634, abs=2)
+
+
+def test_fit_recovers_global_and_region_factors():
+    # Три города на юге (регион (4, 3)) и три на севере (регион (6, 3))
+    south = {1: city(1, 45.0, 38.9), 2: city(2, 47.2, 39.7), 3: city(3, 44.6, 33.5)}
+    north = {4: city(4, 64.5, 39.5), 5: city(5, 61.7, 30.7), 6: city(6, 67.6, 33.1)}
+    cities = {**south, **north}
+
+    def road(group, factor):
+        ids = sorted(group)
+        pairs = [(a, b) for a in ids for b in ids if a < b]
+        geo = haversineKm(*zip(*[(group[a].latitude, group[a].longitude, group[b].latitude, group[b].longitude) for a, b in pairs]))
+        return [((a, b), int(round(g * factor))) for (a, b), g in zip(pairs, geo)]
+
+    model = DetourModel.fit(cities, road(south, 1.2) + road(north, 1.5))
+    assert model.samples == 6
+    assert model.region_factors[(4, 3)] == pytest.approx(1.2, abs=0.01)
+    assert model.region_factors[(6, 3)] == pytest.approx(1.5, abs=0.01)
+    assert 1.2 < model.global_factor < 1.5
+    # Пара между регионами — среднее их коэффициентов
+    assert model.factorFor(south[1], north[4]) == pytest.approx(1.35, abs=0.01)
+    assert DetourModel.fit(cities, []).global_factor == DEFAULT_DETOUR_FACTOR
+
+
+def test_estimate_is_served_without_osrm_and_flagged():
+    s = make_session()
+    s.add(Tariff(month=1, price_per_km_le_1000=150, price_per_km_gt_1000=100))
+    s.add(City(name="Тверь", latitude=56.86, longitude=35.9))
+    seed_cities(s)
+    osrm = FakeOsrm()
+    provider = HybridDistanceProvider(s, osrm_provider=osrm, estimate_missing=True)
+    service = PricingService(s, provider)
+
+    res = service.preview(date(2025, 1, 5), "Тверь", "Москва")
+    batch = service.previewBatch([(date(2025, 1, 5), "Москва", "Тверь"), (date(2025, 1, 5), "Москва", "Санкт-Петербург")])
+
+    assert osrm.calls == 0
+    assert res.is_distance_estimated is True and res.distance_km > 0
+    assert batch[0].is_distance_estimated is True and batch[0].distance_km == res.distance_km
+    assert batch[1].is_distance_estimated is False and batch[1].distance_km == 700
+    # Оценка не сохраняется: ее заменит точное значение
+    s.commit()
+    assert s.query(CityDistance).count() == 1
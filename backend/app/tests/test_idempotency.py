@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.infra.db import Base
+from app.repositories.models import IdempotencyKey
+from app.services.idempotency import IdempotencyConflict, runIdempotent
+
+
+
+def make_async_db(tmp_path):
+    url = f"sqlite:///{tmp_path / 'idem.sqlite'}"
+    Base.metadata.create_all(bind=create_engine(url))
+    return create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://"))
+
+
+def test_concurrent_duplicates_run_handler_once_and_replay(tmp_path):
+    engine = make_async_db(tmp_path)
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    calls = []
+
+    async def request(payload):
+        async def handler():
+            calls.append(payload)
+            await asyncio.sleep(0.01)
+            return 201, {"id": len(calls)}
+
+        async with factory() as session:
+            return await runIdempotent(session, "key-1", payload, handler)
+
+    async def run():
+        responses = await asyncio.gather(*(request({"user_id": 1}) for _ in range(5)))
+        with pytest.raises(IdempotencyConflict) as conflict:
+            await request({"user_id": 2})
+        async with factory() as session:
+            stored = await session.get(IdempotencyKey, "key-1")
+        await engine.dispose()
+        return responses, conflict.value, stored
+
+    responses, conflict, stored = asyncio.run(run())
+    assert len(calls) == 1
+    assert {(r.status_code, r.body["id"]) for r in responses} == {(201, 1)}
+    assert [r.replayed for r in responses].count(False) == 1
+    assert conflict.status_code == 422
+    assert stored.status_code == 201
+
+
+def test_failed_request_releases_key(tmp_path):
+    engine = make_async_db(tmp_path)
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def failing():
+        raise ValueError("City not found")
+
+    async def succeeding():
+        return 201, {"id": 7}
+
+    async def run():
+        async with factory() as session:
+            with pytest.raises(ValueError):
+                await runIdempotent(session, "key-2", {}, failing)
+            await session.rollback()
+        async with factory() as session:
+            response = await runIdempotent(session, "key-2", {}, succeeding)
+        await engine.dispose()
+        return response
+
+    response = asyncio.run(run())
+    assert response.replayed is False and response.body == {"id": 7}
+
+
+def test_cancelled_waiter_does_not_leak_key_lock():
+    from app.services import idempotency
+
+    async def run():
+        release = asyncio.Event()
+
+        async def holder():
+            async with idempotency._KeyLock("k"):
+                await release.wait()
+
+        async def waiter():
+            async with idempotency._KeyLock("k"):
+                pass
+
+        first = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        second = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+        assert idempotency._locks["k"][1] == 2
+        second.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await second
+        release.set()
+        await first
+        return dict(idempotency._locks)
+
+    assert asyncio.run(run()) == {}
@@ -0,0 +1,41 @@
+from argparse import Namespace
+
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.bench_api_load import SCENARIOS, compareBaseline, makeEngines, percentile, runAsgi
+from benchmarks.load_dataset import loadWorkload, seedDataset
+
+
+def test_percentile_uses_nearest_rank():
+    samples = [float(x) for x in range(1, 101)]
+    assert percentile(samples, 50) == 50 and percentile(samples, 95) == 95 and percentile(samples, 99) == 99
+    assert percentile([7.0], 99) == 7.0 and percentile([], 50) == 0.0
+
+
+def test_compare_flags_latency_throughput_sql_and_errors():
+    base = {"k": {"p95_ms": 10.0, "rps": 100.0, "sql_per_request": 2.0, "errors": 0}}
+    assert compareBaseline({"k": dict(base["k"], p95_ms=12.0, rps=80.0), "new": base["k"]}, base, 0.3) == []
+    problems = compareBaseline(
+        {"k": {"p95_ms": 14.0, "rps": 60.0, "sql_per_request": 3.0, "errors": 1}}, base, 0.3
+    )
+    assert len(problems) == 4
+    assert all(word in p for word, p in zip(["p95", "rps", "sql", "errors"], problems))
+
+
+def test_smoke_profile_runs_every_scenario_in_process(tmp_path):
+    url = f"sqlite:///{tmp_path / 'load.sqlite'}"
+    engine, _ = makeEngines(url, 1)
+    with sessionmaker(bind=engine)() as s:
+        assert seedDataset(s, "smoke", seed=1)
+        assert not seedDataset(s, "smoke", seed=1)
+        workload = loadWorkload(s, seed=1)
+    engine.dispose()
+    assert workload.orders_by_status[None] == 2_000 and workload.pairs
+
+    args = Namespace(database_url=url, concurrency=4, requests=12, warmup=2, seed=1)
+    results = runAsgi(args, workload)
+    assert set(results) == {s.name for s in SCENARIOS}
+    assert all(r.errors == 0 and r.rps > 0 for r in results.values())
+    # Условный GET по актуальному ETag: только версия таблицы, без чтения строк
+    assert results["catalog_revalidate"].sql_per_request == 1
+    assert results["list_shallow"].sql_per_request == 2
@@ -0,0 +1,52 @@
+import json
+import os
+
+import pytest
+
+from app.infra.distance.matrix_file import (
+    LAYOUT_DENSE,
+    LAYOUT_TRIANGULAR,
+    DistanceMatrixFile,
+    _lookupJson,
+    convertJsonMatrix,
+    writeMatrixFile,
+)
+from app.infra.distance.provider import OfflineMatrixProvider
+
+
+DISTANCE_DIR = os.path.join(os.path.dirname(__file__), "..", "infra", "distance")
+
+
+@pytest.mark.parametrize(
+    "data, layout",
+    [
+        ({"A": {"B": 10, "C": 30}, "B": {"C": 20}}, LAYOUT_TRIANGULAR),
+        ({"A": {"B": 10}, "B": {"A": 12, "C": 20}}, LAYOUT_DENSE),
+    ],
+)
+def test_binary_matrix_matches_json_lookup(tmp_path, data, layout):
+    path = str(tmp_path / "m.bin")
+    writeMatrixFile(data, path)
+    matrix = DistanceMatrixFile.open(path)
+    assert matrix.layout == layout
+
+    json_path = tmp_path / "m.json"
+    json_path.write_text(json.dumps(data), encoding="utf-8")
+    from_json = OfflineMatrixProvider(str(json_path))
+    for a in ("A", "B", "C", "D"):
+        for b in ("A", "B", "C", "D"):
+            expected = _lookupJson(data, a, b)
+            assert matrix.get(a, b) == expected
+            if expected is None:
+                with pytest.raises(ValueError):
+                    from_json.getDistanceKm(a, b)
+            else:
+                assert from_json.getDistanceKm(a, b) == OfflineMatrixProvider(path).getDistanceKm(a, b) == expected
+    matrix.close()
+
+
+def test_shipped_binary_matrix_is_up_to_date(tmp_path):
+    fresh = tmp_path / "offline_matrix.bin"
+    convertJsonMatrix(os.path.join(DISTANCE_DIR, "offline_matrix.json"), str(fresh))
+    with open(os.path.join(DISTANCE_DIR, "offline_matrix.bin"), "rb") as f:
+        assert f.read() == fresh.read_bytes()
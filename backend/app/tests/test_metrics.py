@@ -0,0 +1,53 @@
+from datetime import date
+
+from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app.api.middleware import RequestMetricsMiddleware
+from app.infra.distance.provider import OfflineMatrixProvider
+from app.infra.metrics import STAGE_METRIC, MetricsRegistry, registry
+from app.services.pricing_service import PricingService
+from app.tests.test_pricing import make_session, seed
+
+
+def test_middleware_records_latency_and_status_by_route_template():
+    metrics = MetricsRegistry()
+    items = APIRouter()
+
+    @items.get("/{item_id}")
+    def getItem(item_id: int) -> dict:
+        if item_id == 0:
+            raise HTTPException(status_code=404)
+        return {"id": item_id}
+
+    api = APIRouter()
+    api.include_router(items, prefix="/items")
+    app = FastAPI()
+    app.include_router(api, prefix="/api")
+    app.add_middleware(RequestMetricsMiddleware, registry=metrics)
+
+    client = TestClient(app)
+    client.get("/api/items/1")
+    client.get("/api/items/2")
+    client.get("/api/items/0")
+    client.get("/missing")
+
+    text = metrics.render()
+    assert 'http_requests_total{method="GET",route="/api/items/{item_id}",status="200"} 2' in text
+    assert 'http_requests_total{method="GET",route="/api/items/{item_id}",status="404"} 1' in text
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"} 1' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/api/items/{item_id}",le="+Inf"} 3' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/items/{item_id}"} 3' in text
+    assert "# TYPE http_request_duration_seconds histogram" in text
+
+
+def test_preview_records_stage_timings():
+    s = make_session()
+    seed(s)
+    labels = (("operation", "preview"), ("stage", "compute"))
+    before = registry.histogram(STAGE_METRIC, labels).snapshot()[1]
+
+    PricingService(s, OfflineMatrixProvider()).preview(date(2025, 1, 5), "Санкт-Петербург", "Москва")
+
+    assert registry.histogram(STAGE_METRIC, labels).snapshot()[1] == before + 1
+    assert registry.histogram(STAGE_METRIC, (("operation", "preview"), ("stage", "distance"))).snapshot()[1] >= 1
@@ -0,0 +1,56 @@
+from datetime import date
+
+from sqlalchemy import event
+
+from app.infra.distance.provider import HybridDistanceProvider
+from app.repositories.models import Order, Tariff, User
+from app.services.pricing_service import OrderDraft, PricingService
+from app.tests.test_distance_index import FakeOsrm, seed_cities
+from app.tests.test_pricing import make_session
+
+
+def test_bulk_create_prices_in_one_pass_and_reports_per_row():
+    s = make_session()
+    s.add(Tariff(month=1, price_per_km_le_1000=150, price_per_km_gt_1000=100))
+    user = User(full_name="Иван", phone="+7")
+    s.add(user)
+    msk, spb, sochi = seed_cities(s)
+
+    def draft(user_id=user.id, from_city=spb, to_city=msk, from_name=None):
+        return OrderDraft(
+            user_id=user_id,
+            car_brand_model="Lada",
+            start_date=date(2025, 1, 5),
+            from_city_id=from_city.id,
+            to_city_id=to_city.id,
+            from_city_name=from_name or from_city.name,
+            to_city_name=to_city.name,
+        )
+
+    drafts = [draft() for _ in range(50)] + [
+        draft(user_id=999),
+        draft(from_name="Казань"),
+        draft(from_city=msk, to_city=sochi),
+    ]
+    service = PricingService(s, HybridDistanceProvider(s, osrm_provider=FakeOsrm()))
+    service.preview(date(2025, 1, 5), "Санкт-Петербург", "Москва")  # прогрев снимка и индекса
+
+    statements = []
+    event.listen(s.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    results = service.createOrders(drafts)
+    s.commit()
+
+    ids = results[:50]
+    assert all(isinstance(i, int) for i in ids) and ids == sorted(ids)
+    assert str(results[50]) == "User not found"
+    assert "is Санкт-Петербург, not Казань" in str(results[51])
+    assert isinstance(results[52], int)  # OSRM-пара в том же пакете
+    assert s.query(Order).count() == 51
+    assert s.get(Order, ids[0]).transport_price == 150 * 700
+    assert s.get(Order, results[52]).distance_km == 1600
+
+    # SQLite не умеет сохранять порядок RETURNING в многострочном INSERT, поэтому
+    # SQLAlchemy шлет строки по одной; в PostgreSQL это один INSERT на пачку
+    inserts = [sql for sql in statements if sql.startswith("INSERT INTO orders")]
+    assert inserts and all("RETURNING" in sql for sql in inserts)
+    assert sum(sql.startswith("SELECT users.id") for sql in statements) == 1
@@ -0,0 +1,96 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.infra.db import Base
+from app.repositories.models import City, Order, User
+from app.repositories.order_repo import OrderRepository
+
+
+def make_session_with_orders(count: int = 23, url: str = "sqlite+pysqlite:///:memory:"):
+    engine = create_engine(url, future=True)
+    Base.metadata.create_all(bind=engine)
+    s = sessionmaker(bind=engine, autoflush=False, future=True)()
+    user = User(full_name="Иван", phone="+7")
+    a, b = City(name="A"), City(name="B")
+    s.add_all([user, a, b])
+    s.flush()
+    for i in range(count):
+        start = date(2025, 1, 1) + timedelta(days=i // 4)  # по 4 заказа на дату
+        s.add(Order(
+            user_id=user.id, car_brand_model="Lada", from_city_id=a.id, to_city_id=b.id,
+            start_date=start, distance_km=100, transport_price=1000 * (i % 3), insurance_price=0,
+            duration_hours=1, duration_days=0, duration_hours_remainder=1, eta_date=start,
+        ))
+    s.commit()
+    return s
+
+
+@pytest.mark.parametrize("order_by_cost", [False, True])
+def test_keyset_pages_cover_all_rows_once_in_both_directions(order_by_cost):
+    s = make_session_with_orders()
+    repo = OrderRepository(s)
+    expected = [o.id for o in repo.query(order_by_cost=order_by_cost, limit=100).items]
+
+    pages, cursor = [], None
+    while True:
+        res = repo.queryKeyset(order_by_cost=order_by_cost, cursor=cursor, limit=5)
+        pages.append([o.id for o in res.items])
+        if res.next_cursor is None:
+            break
+        cursor = res.next_cursor
+    assert [i for p in pages for i in p] == expected
+    assert res.total is None
+    assert repo.queryKeyset(order_by_cost=order_by_cost, limit=5, totals="exact").total == 23
+
+    back = []
+    cursor = res.prev_cursor
+    while cursor:
+        res = repo.queryKeyset(order_by_cost=order_by_cost, cursor=cursor, limit=5)
+        back.insert(0, [o.id for o in res.items])
+        cursor = res.prev_cursor
+    assert back == pages[:-1]
+
+
+def test_cursor_from_other_sort_is_rejected():
+    s = make_session_with_orders()
+    repo = OrderRepository(s)
+    cursor = repo.queryKeyset(limit=5).next_cursor
+    with pytest.raises(ValueError):
+        repo.queryKeyset(order_by_cost=True, cursor=cursor, limit=5)
+
+
+def test_totals_strategies():
+    s = make_session_with_orders()
+    repo = OrderRepository(s)
+
+    res = repo.query(page=4, limit=5, totals="none")
+    assert res.total is None
+    assert res.has_more is True
+    assert repo.query(page=5, limit=5, totals="none").has_more is False
+
+    # Вне PostgreSQL оценки планировщика нет — считается точно
+    res = repo.query(limit=5, totals="estimated")
+    assert (res.total, res.total_estimated) == (23, False)
+
+
+def test_export_streams_all_rows_in_batches():
+    import csv
+    import io
+    import json
+
+    from app.services.order_export import EXPORT_FIELDS, iterOrderExport
+
+    s = make_session_with_orders()
+    factory = lambda: Session(bind=s.get_bind())
+
+    chunks = list(iterOrderExport(factory, "csv", batch_size=10))
+    assert len(chunks) == 1 + 3  # заголовок + 23 строки пачками по 10
+    rows = list(csv.reader(io.StringIO("".join(chunks))))
+    assert rows[0] == EXPORT_FIELDS
+    assert len(rows) == 24
+
+    lines = "".join(iterOrderExport(factory, "ndjson", payment_status=None, start_from=date(2025, 1, 6))).splitlines()
+    assert [json.loads(x)["start_date"] for x in lines] == ["2025-01-06"] * 3
@@ -0,0 +1,49 @@
+from datetime import date
+
+from app.infra.distance.provider import HybridDistanceProvider
+from app.repositories.models import PaymentStatus, Tariff, User
+from app.repositories.order_repo import OrderRepository
+from app.repositories.order_stats_repo import OrderStatsRepository
+from app.services.pricing_service import OrderDraft, PricingService
+from app.tests.test_distance_index import FakeOsrm, seed_cities
+from app.tests.test_pricing import make_session
+
+
+def snapshot(repo):
+    return sorted(tuple(row) for row in repo.query(["start_day", "from_city_id", "to_city_id", "payment_status"]))
+
+
+def test_rollups_follow_order_changes_and_match_rebuild():
+    s = make_session()
+    s.add(Tariff(month=1, price_per_km_le_1000=150, price_per_km_gt_1000=100))
+    user = User(full_name="Иван", phone="+7")
+    s.add(user)
+    msk, spb, sochi = seed_cities(s)
+    service = PricingService(s, HybridDistanceProvider(s, osrm_provider=FakeOsrm()))
+
+    service.createOrder(user.id, "Lada", date(2025, 1, 5), spb.id, msk.id, spb.name, msk.name)
+    ids = service.createOrders([
+        OrderDraft(user.id, "Lada", date(2025, 1, day), frm.id, to.id, frm.name, to.name)
+        for day, frm, to in ((5, spb, msk), (5, spb, msk), (6, msk, sochi))
+    ])
+    orders = OrderRepository(s)
+    assert orders.setPaymentStatus(ids[0], PaymentStatus.PAID)
+    assert orders.setPaymentStatus(ids[0], PaymentStatus.PAID)  # повтор не двигает агрегаты
+    assert orders.delete(ids[1])
+    assert not orders.delete(ids[1])
+    s.commit()
+
+    stats = OrderStatsRepository(s)
+    by_status = {row.payment_status: row for row in stats.query(["payment_status"])}
+    assert by_status[PaymentStatus.PAID].orders_count == 1
+    assert by_status[PaymentStatus.PAID].transport_price_sum == 150 * 700
+    assert by_status[PaymentStatus.PENDING].orders_count == 2
+    assert by_status[PaymentStatus.PENDING].distance_km_sum == 700 + 1600
+
+    january = stats.query(["start_month"], from_city_id=spb.id)
+    assert [(r.start_year, r.start_month, r.orders_count) for r in january] == [(2025, 1, 2)]
+    assert stats.query([], start_from=date(2025, 1, 6))[0].orders_count == 1
+
+    incremental = snapshot(stats)
+    assert stats.rebuild() == 3
+    assert snapshot(stats) == incremental
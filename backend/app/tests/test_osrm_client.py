@@ -0,0 +1,92 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.infra.distance.osrm_client import AsyncOSRMClient
+
+
+def test_concurrent_lookups_for_same_pair_share_one_request():
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"code": "Ok", "routes": [{"distance": 1_600_400.0}]})
+
+    client = AsyncOSRMClient(base_url="http://osrm.local", transport=httpx.MockTransport(handler))
+
+    async def run():
+        same = [client.getDistanceKm("Москва", "Сочи", (55.75, 37.61), (43.60, 39.73)) for _ in range(20)]
+        other = client.getDistanceKm("Москва", "Казань", (55.75, 37.61), (55.79, 49.12))
+        results = await asyncio.gather(*same, other)
+        await client.aclose()
+        return results
+
+    results = asyncio.run(run())
+    assert results[:20] == [1600] * 20
+    assert len(calls) == 2
+    assert calls[0] == "/route/v1/driving/37.61,55.75;39.73,43.6"
+
+
+def test_osrm_error_is_reported_as_value_error():
+    client = AsyncOSRMClient(
+        base_url="http://osrm.local",
+        transport=httpx.MockTransport(lambda _: httpx.Response(200, json={"code": "NoRoute"})),
+    )
+
+    async def run():
+        try:
+            await client.getDistanceKm("A", "B", (1.0, 2.0), (3.0, 4.0))
+        finally:
+            await client.aclose()
+
+    with pytest.raises(ValueError, match="OSRM API error"):
+        asyncio.run(run())
+
+
+def test_client_of_a_finished_event_loop_is_closed():
+    closed = []
+
+    class Transport(httpx.MockTransport):
+        async def aclose(self) -> None:
+            closed.append(True)
+
+    transport = Transport(lambda _: httpx.Response(200, json={"code": "Ok", "routes": [{"distance": 700_000.0}]}))
+    client = AsyncOSRMClient(base_url="http://osrm.local", transport=transport)
+
+    async def lookup():
+        return await client.getDistanceKm("A", "B", (1.0, 2.0), (3.0, 4.0))
+
+    assert asyncio.run(lookup()) == 700
+    assert asyncio.run(lookup()) == 700
+    assert closed == [True]
+
+
+def test_concurrent_sync_lookups_for_same_pair_share_one_request():
+    import threading
+    import time
+
+    from app.infra.distance.provider import OSRMProvider
+
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        time.sleep(0.05)
+        return httpx.Response(200, json={"code": "Ok", "routes": [{"distance": 1_600_400.0}]})
+
+    provider = OSRMProvider(base_url="http://osrm.local", client=httpx.Client(transport=httpx.MockTransport(handler)))
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(provider.getDistanceKm("Москва", "Сочи", (55.75, 37.61), (43.60, 39.73)))
+        )
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [1600] * 8
+    assert len(calls) == 1
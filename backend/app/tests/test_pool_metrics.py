@@ -0,0 +1,37 @@
+import pytest
+from sqlalchemy import create_engine, exc, text
+
+from app.infra.pool_metrics import TimedQueuePool, instrumentEngine, listPoolMetrics
+
+
+def test_pool_metrics_track_checkouts_waits_and_timeouts(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.sqlite'}",
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    metrics = instrumentEngine(engine, "test")
+    assert metrics in listPoolMetrics()
+
+    conn = engine.connect()
+    conn.execute(text("select 1"))
+    assert metrics.state() == {"size": 1, "checked_out": 1, "idle": 0, "overflow": 0}
+
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    conn.close()
+
+    assert metrics.state()["idle"] == 1
+    assert metrics.connects == 1
+    assert (metrics.checkouts, metrics.checkins, metrics.checkout_timeouts) == (1, 1, 1)
+    buckets, count, total = metrics.checkout_wait_ms.snapshot()
+    assert count == 2 and total >= 50
+    assert buckets[-1] == (float("inf"), 2)
+
+    # После dispose() engine работает с новым пулом, счетчики продолжают копиться
+    engine.dispose()
+    with engine.connect():
+        pass
+    assert metrics.connects == 2 and metrics.checkout_wait_ms.snapshot()[1] == 3
@@ -5,7 +5,7 @@ from sqlalchemy.orm import sessionmaker
 
 from app.infra.db import Base
 from app.infra.distance.provider import OfflineMatrixProvider
-from app.repositories.models import FixedRoute, Tariff
+from app.repositories.models import City, FixedRoute, Tariff
 from app.services.pricing_service import PricingService
 
 
@@ -18,7 +18,12 @@ def make_session():
 
 def seed(session):
     session.add(Tariff(month=1, price_per_km_le_1000=150, price_per_km_gt_1000=100))
-    session.add(FixedRoute(from_city="Москва", to_city="Сочи", fixed_price=200_000))
+    msk = City(name="Москва", latitude=55.75, longitude=37.61)
+    spb = City(name="Санкт-Петербург", latitude=59.93, longitude=30.33)
+    sochi = City(name="Сочи", latitude=43.60, longitude=39.73)
+    session.add_all([msk, spb, sochi])
+    session.flush()
+    session.add(FixedRoute(from_city_id=msk.id, to_city_id=sochi.id, fixed_price=200_000))
     session.commit()
 
 
@@ -45,3 +50,68 @@ def test_variable_tariff_pricing_and_eta():
     assert res.duration_hours == 17
 
 
+
+
+def test_preview_reads_reference_snapshot_without_queries():
+    from sqlalchemy import event
+
+    from app.infra.reference_cache import invalidateReferenceData
+
+    s = make_session()
+    seed(s)
+    svc = PricingService(s, OfflineMatrixProvider())
+    svc.preview(date(2025, 1, 5), "Санкт-Петербург", "Москва")  # прогрев снимка
+
+    statements = []
+    event.listen(s.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    res = svc.preview(date(2025, 1, 5), "Санкт-Петербург", "Москва")
+    assert statements == []
+    assert res.applied_price_per_km == 150
+
+    # Изменение тарифа видно после commit
+    tariff = s.query(Tariff).filter_by(month=1).one()
+    tariff.price_per_km_le_1000 = 180
+    invalidateReferenceData(s)
+    s.commit()
+    res = svc.preview(date(2025, 1, 5), "Санкт-Петербург", "Москва")
+    assert res.applied_price_per_km == 180
+
+
+def test_preview_batch_resolves_distances_in_bulk_and_reports_item_errors():
+    from sqlalchemy import event
+
+    from app.infra.distance.provider import HybridDistanceProvider
+    from app.repositories.models import City, CityDistance
+
+    class FakeOsrm:
+        calls = 0
+
+        def getDistanceKm(self, from_city, to_city, from_coords, to_coords):
+            FakeOsrm.calls += 1
+            return 1600
+
+    s = make_session()
+    seed(s)
+    msk, spb = (s.query(City).filter_by(name=name).one() for name in ("Москва", "Санкт-Петербург"))
+    s.add(CityDistance(from_city_id=spb.id, to_city_id=msk.id, distance_km=700))
+    s.commit()
+
+    svc = PricingService(s, HybridDistanceProvider(s, osrm_provider=FakeOsrm()))
+    svc.preview(date(2025, 1, 5), "Санкт-Петербург", "Москва")  # прогрев снимка
+
+    statements = []
+    event.listen(s.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    items = [(date(2025, 1, 5), "Москва", "Санкт-Петербург")] * 50 + [
+        (date(2025, 1, 5), "Москва", "Сочи"),
+        (date(2025, 1, 5), "Москва", "Казань"),
+        (date(2025, 2, 5), "Москва", "Санкт-Петербург"),
+    ]
+    results = svc.previewBatch(items)
+
+    assert results[0].transport_price == 150 * 700
+    assert results[50].is_fixed_route is True and results[50].distance_km == 1600
+    assert isinstance(results[51], ValueError)
+    assert isinstance(results[52], ValueError)  # нет тарифа на февраль
+    assert FakeOsrm.calls == 1
+    # один SELECT расстояний и один INSERT нового расстояния из OSRM
+    assert len(statements) == 2
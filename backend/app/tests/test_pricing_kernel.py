@@ -0,0 +1,97 @@
+import random
+from datetime import date, timedelta
+
+from app.infra.distance.provider import OfflineMatrixProvider
+from app.infra.reference_cache import TariffRates
+from app.services.pricing_kernel import MISSING, insurancePrice, priceArrays, priceOne
+from app.services.pricing_service import PricingService
+from app.tests.test_pricing import make_session, seed
+
+
+TARIFFS = {m: TariffRates(150 + m, 100 + m) for m in range(1, 12)}  # на декабрь тарифа нет
+
+
+def legacy_price(distance_km: int, month: int, fixed_price: int | None, tariffs: dict) -> tuple:
+    """Прежний скалярный расчет PricingService._price, дословно"""
+    if fixed_price is not None:
+        transport_price = int(fixed_price)
+        applied_price_per_km = None
+    else:
+        tariff = tariffs.get(month)
+        if tariff is None:
+            return None
+        if distance_km <= 1000:
+            applied_price_per_km = int(tariff.price_per_km_le_1000)
+        else:
+            applied_price_per_km = int(tariff.price_per_km_gt_1000)
+        transport_price = int(applied_price_per_km * distance_km)
+    insurance_price = int(round(transport_price * 0.10))
+    duration_hours = int(round(distance_km * 24 / 1000))
+    return applied_price_per_km, transport_price, insurance_price, duration_hours
+
+
+def rows(n: int, seed: int = 7) -> list[tuple[int, int, int]]:
+    rng = random.Random(seed)
+    edges = [0, 1, 41, 42, 999, 1000, 1001, 1999, 20_833, 62_500]
+    out = []
+    for k in range(n):
+        distance = edges[k % len(edges)] if k < 200 else rng.randint(1, 12_000)
+        fixed = MISSING
+        if rng.random() < 0.2:
+            # Цены, оканчивающиеся на 5: страховка попадает на половину рубля
+            fixed = rng.choice([5, 15, 25, 35, 45, 125, 2_000_005, rng.randint(1, 10**9)])
+        out.append((distance, rng.randint(1, 12), fixed))
+    return out
+
+
+def test_kernel_matches_legacy_scalar_pricing_bit_for_bit():
+    data = rows(50_000)
+    distance, month, fixed = (list(col) for col in zip(*data))
+    priced = priceArrays(distance, month, fixed, TARIFFS)
+    assert len(priced) == len(data)
+    for k, (distance, month, fixed) in enumerate(data):
+        cell = (priced.rate[k], priced.transport[k], priced.insurance[k], priced.duration_hours[k])
+        assert cell == priceOne(distance, month, fixed, TARIFFS)
+        expected = legacy_price(distance, month, None if fixed == MISSING else fixed, TARIFFS)
+        if expected is None:
+            assert cell[1] == MISSING
+        else:
+            assert cell == (MISSING if expected[0] is None else expected[0], *expected[1:])
+
+
+def test_kernel_rounding_and_missing_values():
+    # round() — банковское: 2.5 → 2, 3.5 → 4; страховка считается так же, как раньше
+    assert [insurancePrice(t) for t in (5, 15, 25, 35)] == [0, 2, 2, 4]
+    priced = priceArrays([MISSING, 1000, 1001, 500], [1, 1, 1, 12], [MISSING] * 4, TARIFFS)
+    assert list(priced.rate) == [MISSING, 151, 101, MISSING]
+    assert list(priced.transport) == [MISSING, 151_000, 101_101, MISSING]
+    assert list(priced.insurance) == [MISSING, 15_100, 10_110, MISSING]
+    assert list(priced.duration_hours) == [MISSING, 24, 24, 12]
+
+
+def test_preview_and_batch_share_kernel_results():
+    s = make_session()
+    seed(s)
+    svc = PricingService(s, OfflineMatrixProvider())
+    items = [
+        (date(2025, 1, 5), "Санкт-Петербург", "Москва"),
+        (date(2025, 1, 10), "Москва", "Сочи"),
+        (date(2025, 2, 1), "Санкт-Петербург", "Москва"),  # тарифа на февраль нет
+        (date(2025, 2, 1), "Москва", "Сочи"),  # фиксированный маршрут от тарифа не зависит
+    ]
+    batch = svc.previewBatch(items)
+    for (start, from_city, to_city), result in zip(items, batch):
+        try:
+            single = svc.preview(start, from_city, to_city)
+        except ValueError as e:
+            assert isinstance(result, ValueError) and str(result) == str(e)
+            continue
+        assert result == single
+        fixed = 200_000 if single.is_fixed_route else None
+        rate, transport, insurance, hours = legacy_price(
+            single.distance_km, start.month, fixed, {1: TariffRates(150, 100)}
+        )
+        assert single.applied_price_per_km == rate
+        assert (single.transport_price, single.insurance_price) == (transport, insurance)
+        assert single.eta_date == start + timedelta(hours=hours)
+    assert [isinstance(r, ValueError) for r in batch] == [False, False, True, False]
@@ -0,0 +1,106 @@
+from datetime import date
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.infra.db import Base
+from app.infra.distance.distance_index import DistanceIndex
+from app.infra.distance.provider import HybridDistanceProvider
+from app.infra.reference_cache import invalidateReferenceData, loadSnapshot
+from app.repositories.city_distance_repo import CityDistanceRepository
+from app.repositories.models import City, CityDistance, FixedRoute, Tariff
+from app.services.pricing_service import PricingService
+from app.services.quote_matrix import QuoteMatrix, QuoteMatrixCache, getQuoteMatrix
+
+
+NAMES = ["Москва", "Сочи", "Санкт-Петербург", "Казань", "Бишкек"]
+
+
+def make_seeded_session():
+    engine = create_engine("sqlite+pysqlite:///:memory:", future=True)
+    Base.metadata.create_all(bind=engine)
+    s = sessionmaker(bind=engine, autoflush=False, future=True)()
+    cities = [City(name=n, latitude=50.0 + i, longitude=30.0 + i) for i, n in enumerate(NAMES)]
+    s.add_all(cities)
+    s.flush()
+    for i, a in enumerate(cities):
+        for b in cities[i + 1:]:
+            s.add(CityDistance(from_city_id=a.id, to_city_id=b.id, distance_km=333 * (a.id + b.id)))
+    for m in range(1, 12):  # на декабрь тарифа нет
+        s.add(Tariff(month=m, price_per_km_le_1000=150 + m, price_per_km_gt_1000=100 + m))
+    s.add(FixedRoute(from_city_id=cities[0].id, to_city_id=cities[1].id, fixed_price=200_000))
+    s.commit()
+    return s
+
+
+def test_matrix_lookup_matches_scalar_pricing():
+    s = make_seeded_session()
+    svc = PricingService(s, HybridDistanceProvider(s))
+    matrix = getQuoteMatrix(s, wait=True)
+    for month in range(1, 13):
+        start = date(2025, month, 15)
+        for a in NAMES:
+            for b in NAMES:
+                if a == b:
+                    continue
+                quoted = matrix.lookup(start, a, b)
+                if month == 12 and (a, b) != ("Москва", "Сочи"):
+                    assert quoted is None
+                    continue
+                assert quoted == svc.preview(start, a, b)
+
+
+def test_refresh_recomputes_only_changed_month():
+    s = make_seeded_session()
+    before = getQuoteMatrix(s, wait=True)
+
+    tariff = s.query(Tariff).filter_by(month=3).one()
+    tariff.price_per_km_gt_1000 = 90
+    invalidateReferenceData(s)
+    s.commit()
+
+    after = getQuoteMatrix(s, wait=True)
+    assert after is not before
+    assert after.months[3] is not before.months[3]
+    assert all(after.months[m] is before.months[m] for m in range(1, 13) if m != 3)
+    assert after.lookup(date(2025, 3, 1), "Казань", "Бишкек").applied_price_per_km == 90
+
+
+def test_refresh_recomputes_changed_distance_cells():
+    s = make_seeded_session()
+    snapshot = loadSnapshot(s)
+    index = DistanceIndex.fromMap(CityDistanceRepository(s).loadMap())
+    matrix = QuoteMatrix.build(snapshot, index.items())
+
+    ids = {c.name: c.id for c in snapshot.cities_by_id.values()}
+    version = index.version
+    index.set(ids["Бишкек"], ids["Казань"], 500)
+    _, changed = index.changesSince(version)
+    assert changed == {(ids["Казань"], ids["Бишкек"])}
+    refreshed = matrix.refresh(loadSnapshot(s, version=1), index, changed)
+
+    res = refreshed.lookup(date(2025, 1, 1), "Бишкек", "Казань")
+    assert res.distance_km == 500
+    assert res.applied_price_per_km == 151
+    assert res.transport_price == 151 * 500
+    assert refreshed.lookup(date(2025, 1, 1), "Казань", "Бишкек") == res
+    assert refreshed.lookup(date(2025, 1, 1), "Москва", "Казань") == matrix.lookup(
+        date(2025, 1, 1), "Москва", "Казань"
+    )
+    assert refreshed.months[2].transport != matrix.months[2].transport
+    assert QuoteMatrix.build(loadSnapshot(s), index.items()).months[2] == refreshed.months[2]
+
+
+def test_requests_do_not_wait_for_the_matrix_and_large_catalogs_skip_it():
+    s = make_seeded_session()
+    cache = QuoteMatrixCache()
+    assert cache.get(s) is None  # построение ушло в фон, запрос считается обычным путем
+    matrix = cache.get(s, wait=True)
+    assert matrix is not None and cache.get(s) is matrix
+
+    # Снимок перечитан без изменений — матрица остается прежней без фонового обновления
+    invalidateReferenceData(s)
+    s.commit()
+    assert cache.get(s) is matrix
+
+    assert QuoteMatrixCache(max_cities=len(NAMES) - 1).get(s, wait=True) is None
@@ -0,0 +1,59 @@
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import sessionmaker
+
+import app.infra.seed as seed
+from app.repositories.models import City, SeedVersion, Tariff
+
+
+def test_bootstrap_seeds_once_then_costs_a_single_query(monkeypatch):
+    engine = create_engine("sqlite+pysqlite:///:memory:", future=True)
+    factory = sessionmaker(bind=engine, autoflush=False, future=True)
+
+    with factory() as s:
+        seed.runBootstrap(s)
+        s.commit()
+        assert s.get(SeedVersion, seed.SEED_NAME).version == seed.SEED_VERSION
+        assert s.query(Tariff).count() == 12
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    with factory() as s:
+        seed.runBootstrap(s)
+        s.commit()
+    assert len(statements) == 1 and "seed_versions" in statements[0]
+
+    # Новая версия начальных данных применяется поверх существующих без дублей
+    monkeypatch.setattr(seed, "SEED_VERSION", seed.SEED_VERSION + 1)
+    with factory() as s:
+        seed.runBootstrap(s)
+        s.commit()
+        assert s.get(SeedVersion, seed.SEED_NAME).version == seed.SEED_VERSION
+        assert len(s.execute(select(City)).all()) == 4
+
+
+def test_migrations_upgrade_a_bootstrapped_database(tmp_path, monkeypatch):
+    from pathlib import Path
+
+    from alembic import command
+    from alembic.config import Config
+    from sqlalchemy import text
+
+    from app.repositories.models import FixedRoute
+
+    url = f"sqlite+pysqlite:///{tmp_path / 'app.db'}"
+    engine = create_engine(url, future=True)
+    with sessionmaker(bind=engine, future=True)() as s:
+        seed.runBootstrap(s)
+        s.commit()
+        routes = s.query(FixedRoute).count()
+
+    monkeypatch.setenv("DATABASE_URL", url)
+    config = Config()
+    config.set_main_option("script_location", str(Path(__file__).resolve().parents[2] / "alembic"))
+    config.set_main_option("sqlalchemy.url", url)
+    command.upgrade(config, "head")
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT version_num FROM alembic_version")).scalar() == "0006"
+    with sessionmaker(bind=engine, future=True)() as s:
+        assert s.query(FixedRoute).count() == routes
@@ -0,0 +1,106 @@
+from datetime import date
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.api.deps import requireAdmin
+from app.api.v1.tariffs import router
+from app.infra.db import Base, getSession
+from app.infra.reference_cache import TariffRates
+from app.repositories.models import City, FixedRoute, Order, PaymentStatus, Tariff, User
+from app.services.tariff_simulation import TariffProposal, simulateTariffs
+
+
+def order(user_id, from_id, to_id, start, distance_km):
+    # Цены в заказе не важны: симуляция пересчитывает и текущий, и предлагаемый вариант
+    return Order(
+        user_id=user_id, car_brand_model="Lada", from_city_id=from_id, to_city_id=to_id,
+        start_date=start, distance_km=distance_km, transport_price=0, insurance_price=0,
+        duration_hours=0, duration_days=0, duration_hours_remainder=0, eta_date=start,
+        payment_status=PaymentStatus.PAID,
+    )
+
+
+def make_client(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'whatif.sqlite'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine, autoflush=False)
+    with factory() as s:
+        s.add_all([Tariff(month=m, price_per_km_le_1000=150, price_per_km_gt_1000=100) for m in (1, 2)])
+        user = User(full_name="Иван", phone="+7")
+        a, b, c = City(name="A"), City(name="B"), City(name="C")
+        s.add_all([user, a, b, c])
+        s.flush()
+        s.add(FixedRoute(from_city_id=a.id, to_city_id=c.id, fixed_price=200_000))
+        s.add_all([
+            order(user.id, a.id, b.id, date(2024, 1, 10), 700),
+            order(user.id, a.id, b.id, date(2025, 1, 11), 700),
+            order(user.id, b.id, a.id, date(2025, 2, 1), 700),
+            order(user.id, a.id, c.id, date(2025, 2, 2), 1500),
+            order(user.id, b.id, c.id, date(2025, 3, 3), 2500),  # на март тарифа нет
+        ])
+        s.commit()
+
+    def override():
+        with factory() as s:
+            yield s
+            s.commit()
+
+    app = FastAPI()
+    app.include_router(router, prefix="/tariffs")
+    app.dependency_overrides[getSession] = override
+    app.dependency_overrides[requireAdmin] = lambda: None
+    return TestClient(app), engine, factory
+
+
+def test_simulation_reports_deltas_by_month_route_and_band_without_writes(tmp_path):
+    client, engine, _ = make_client(tmp_path)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    response = client.post("/tariffs/simulate", json={
+        "tariffs": [{"month": 1, "price_per_km_le_1000": 200, "price_per_km_gt_1000": 100}],
+        "fixed_routes": [
+            {"from_city_id": 1, "to_city_id": 3},  # A→C теперь по тарифу
+            {"from_city_id": 2, "to_city_id": 1, "fixed_price": 50_000},
+        ],
+        "distance_bands": [1000, 2000],
+    })
+    assert response.status_code == 200, response.text
+    body = response.json()
+
+    # Январь: 2 × 700 км по 150 → по 200; февраль: B→A 105 000 → 50 000, A→C 200 000 → 150 000
+    assert body["total"]["orders_count"] == 4 and body["unpriced_orders"] == 1
+    assert body["total"]["current_transport_sum"] == 2 * 105_000 + 105_000 + 200_000
+    assert body["total"]["transport_delta"] == 2 * 35_000 - 55_000 - 50_000
+    assert body["total"]["insurance_delta"] == 2 * 3_500 - 5_500 - 5_000
+    assert [(x["month"], x["orders_count"], x["transport_delta"]) for x in body["by_month"]] == [
+        (1, 2, 70_000),
+        (2, 2, -105_000),
+    ]
+    assert [(x["from_city_id"], x["to_city_id"], x["transport_delta"]) for x in body["by_route"]] == [
+        (1, 2, 70_000),
+        (2, 1, -55_000),
+        (1, 3, -50_000),
+    ]
+    bands = [(x["distance_from_km"], x["distance_to_km"], x["orders_count"]) for x in body["by_distance_band"]]
+    assert bands == [(0, 1000, 3), (1001, 2000, 1)]
+    assert body["routes_count"] == 3
+
+    assert all(sql.lstrip().upper().startswith("SELECT") for sql in statements)
+
+
+def test_simulation_is_the_same_for_any_batch_size_and_validates_input(tmp_path):
+    client, _, factory = make_client(tmp_path)
+    proposal = TariffProposal(tariffs={2: TariffRates(160, 90)}, fixed_routes={(1, 3): 180_000})
+    with factory() as s:
+        whole = simulateTariffs(s, proposal)
+        chunked = simulateTariffs(s, proposal, batch_size=1)
+    assert whole == chunked and whole.total[0] == 4
+
+    duplicate = {"month": 1, "price_per_km_le_1000": 1, "price_per_km_gt_1000": 1}
+    assert client.post("/tariffs/simulate", json={"tariffs": [duplicate, duplicate]}).status_code == 400
+    bad_bands = client.post("/tariffs/simulate", json={"distance_bands": [1000, 500]})
+    assert bad_bands.status_code == 400 and "distance_bands" in bad_bands.json()["detail"]["error"]
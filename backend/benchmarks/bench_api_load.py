@@ -0,0 +1,483 @@
+"""
+Нагрузочный бенчмарк API на воспроизводимом наборе данных (benchmarks.load_dataset).
+
+Сценарии гоняются с фиксированной параллельностью в процессе (httpx.ASGITransport)
+и по настоящему HTTP (uvicorn в фоновом потоке того же процесса). Для каждого
+сценария: p50/p95/p99, RPS, доля ошибок и число SQL-запросов на запрос. Результат
+сравнивается с сохраненным baseline; при регрессии код выхода 1.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_api_load [--profile small] [--transport both] [--concurrency 8]
+    python -m benchmarks.bench_api_load --database-url postgresql+psycopg://... --profile full
+    python -m benchmarks.bench_api_load --save-baseline   # перезаписать baseline текущим прогоном
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable
+
+import httpx
+from sqlalchemy import create_engine, event, make_url
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.infra import db
+from app.main import createApp
+from benchmarks.load_dataset import PROFILES, Workload, loadWorkload, seedDataset
+
+
+BASELINE_PATH = Path(__file__).with_name("baseline_api_load.json")
+API = "/api/v1"
+
+
+@dataclass(frozen=True)
+class RequestSpec:
+    method: str
+    url: str
+    params: dict | None = None
+    json: dict | None = None
+    headers: dict | None = None
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    build: Callable[[random.Random, Workload, dict], RequestSpec]
+    ok: tuple[int, ...] = (200,)
+    etags: bool = False  # перед прогоном получить ETag справочников
+
+
+@dataclass
+class ScenarioResult:
+    requests: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    rps: float
+    sql_per_request: float
+
+
+# --- сценарии ---------------------------------------------------------------------------
+
+def _startDate(rng: random.Random) -> str:
+    return (date(2026, 1, 1) + timedelta(days=rng.randrange(365))).isoformat()
+
+
+def _preview(rng: random.Random, w: Workload, _: dict) -> RequestSpec:
+    from_id, to_id, from_name, to_name = rng.choice(w.pairs)
+    body = {
+        "car_brand_model": "Kia Rio",
+        "from_city": from_name,
+        "to_city": to_name,
+        "start_date": _startDate(rng),
+    }
+    return RequestSpec("POST", f"{API}/orders/preview", json=body)
+
+
+def _create(rng: random.Random, w: Workload, _: dict) -> RequestSpec:
+    from_id, to_id, from_name, to_name = rng.choice(w.pairs)
+    body = {
+        "user_id": rng.choice(w.user_ids),
+        "car_brand_model": "Kia Rio",
+        "from_city_id": from_id,
+        "to_city_id": to_id,
+        "from_city": from_name,
+        "to_city": to_name,
+        "start_date": _startDate(rng),
+    }
+    return RequestSpec("POST", f"{API}/orders", json=body)
+
+
+def _listFilters(rng: random.Random, w: Workload) -> dict:
+    kind = rng.randrange(5)
+    if kind == 1:
+        return {"from_city_id": rng.choice(w.pairs)[0]}
+    if kind == 2:
+        return {"payment_status": rng.choice(["PENDING", "PAID"])}
+    if kind == 3:
+        month = date(2024, 1, 1) + timedelta(days=31 * rng.randrange(24))
+        return {"start_from": month.replace(day=1).isoformat(), "start_to": month.replace(day=28).isoformat()}
+    if kind == 4:
+        return {"user_id": rng.choice(w.user_ids)}
+    return {}
+
+
+def _listShallow(rng: random.Random, w: Workload, _: dict) -> RequestSpec:
+    params = {"page": rng.randint(1, 3), "limit": 20, **_listFilters(rng, w)}
+    return RequestSpec("GET", f"{API}/orders", params=params)
+
+
+def _listDeep(rng: random.Random, w: Workload, _: dict) -> RequestSpec:
+    # Страница из середины выборки: без фильтра или по статусу, число строк известно из агрегатов
+    status = rng.choice([None, "PAID"])
+    pages = max(1, w.orders_by_status.get(status, 0) // 20)
+    params = {"page": rng.randint(pages // 2, max(pages // 2, pages - 1)), "limit": 20}
+    if status is not None:
+        params["payment_status"] = status
+    return RequestSpec("GET", f"{API}/orders", params=params)
+
+
+CATALOG_PATHS = (f"{API}/cities", f"{API}/tariffs", f"{API}/meta/fixed-routes", f"{API}/city-distances")
+
+
+def _catalog(rng: random.Random, w: Workload, _: dict) -> RequestSpec:
+    return RequestSpec("GET", rng.choice(CATALOG_PATHS))
+
+
+def _catalogRevalidate(rng: random.Random, w: Workload, etags: dict) -> RequestSpec:
+    # Клиент с кешем: условный GET по ETag, полученному при прогреве
+    path = rng.choice(CATALOG_PATHS)
+    return RequestSpec("GET", path, headers={"If-None-Match": etags[path]})
+
+
+SCENARIOS = (
+    Scenario("preview", _preview),
+    Scenario("list_shallow", _listShallow),
+    Scenario("list_deep", _listDeep),
+    Scenario("catalog", _catalog),
+    Scenario("catalog_revalidate", _catalogRevalidate, ok=(304,), etags=True),
+    # Запись последней: новые заказы не влияют на чтения этого прогона
+    Scenario("create", _create, ok=(201,)),
+)
+
+
+# --- измерение ----------------------------------------------------------------------------
+
+def percentile(samples: list[float], p: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class SqlCounter:
+    """Считает выполненные SQL-запросы на всех engine приложения"""
+
+    def __init__(self, *engines: Engine) -> None:
+        self.count = 0
+        self._lock = threading.Lock()
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._onExecute)
+
+    def _onExecute(self, *_args) -> None:
+        with self._lock:
+            self.count += 1
+
+
+async def _send(client: httpx.AsyncClient, spec: RequestSpec) -> httpx.Response:
+    return await client.request(
+        spec.method, spec.url, params=spec.params, json=spec.json, headers=spec.headers
+    )
+
+
+async def runScenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    workload: Workload,
+    counter: SqlCounter,
+    concurrency: int,
+    requests: int,
+    warmup: int,
+    seed: int,
+) -> ScenarioResult:
+    rng = random.Random(f"{seed}:{scenario.name}")
+    etags: dict[str, str] = {}
+    if scenario.etags:
+        for path in CATALOG_PATHS:
+            etags[path] = (await client.get(path)).headers["etag"]
+    for _ in range(warmup):
+        await _send(client, scenario.build(rng, workload, etags))
+
+    # Запросы строятся заранее: генерация не попадает в замер
+    specs = [scenario.build(rng, workload, etags) for _ in range(requests)]
+    latencies: list[float] = []
+    errors = 0
+    position = 0
+
+    async def worker() -> None:
+        nonlocal errors, position
+        while position < len(specs):
+            spec = specs[position]
+            position += 1
+            started = time.perf_counter()
+            try:
+                response = await _send(client, spec)
+                failed = response.status_code not in scenario.ok
+            except httpx.HTTPError:
+                failed = True
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += failed
+
+    sql_before = counter.count
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return ScenarioResult(
+        requests=requests,
+        errors=errors,
+        p50_ms=round(percentile(latencies, 50), 2),
+        p95_ms=round(percentile(latencies, 95), 2),
+        p99_ms=round(percentile(latencies, 99), 2),
+        rps=round(requests / elapsed, 1),
+        sql_per_request=round((counter.count - sql_before) / requests, 2),
+    )
+
+
+# --- приложение и транспорт --------------------------------------------------------------------
+
+def _sqlitePragmas(engine: Engine) -> None:
+    # WAL и ожидание блокировки: параллельные записи не падают с "database is locked"
+    @event.listens_for(engine, "connect")
+    def _onConnect(dbapi_connection, _record) -> None:
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=30000")
+        cursor.close()
+
+
+def makeEngines(database_url: str, concurrency: int) -> tuple[Engine, AsyncEngine]:
+    is_sqlite = make_url(database_url).get_backend_name() == "sqlite"
+    pool = {} if is_sqlite else {"pool_size": concurrency, "max_overflow": concurrency}
+    sync_engine = create_engine(
+        database_url, connect_args={"check_same_thread": False} if is_sqlite else {}, **pool
+    )
+    async_engine = create_async_engine(db.asyncDatabaseUrl(database_url), **pool)
+    if is_sqlite:
+        _sqlitePragmas(sync_engine)
+        _sqlitePragmas(async_engine.sync_engine)
+    return sync_engine, async_engine
+
+
+def buildApp(sync_engine: Engine, async_engine: AsyncEngine):
+    """Приложение как в продакшене, но с сессиями на engine бенчмарка"""
+    session_factory = sessionmaker(bind=sync_engine, autoflush=False)
+    async_factory = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+    def getSession():
+        session = session_factory()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    async def getAsyncSession():
+        async with async_factory() as session:
+            try:
+                yield session
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+
+    application = createApp()
+    application.dependency_overrides[db.getSession] = getSession
+    application.dependency_overrides[db.getAsyncSession] = getAsyncSession
+    application.dependency_overrides[db.getSessionFactory] = lambda: session_factory
+    return application
+
+
+async def _runAll(client: httpx.AsyncClient, scenarios, workload, counter, args) -> dict[str, ScenarioResult]:
+    results = {}
+    for scenario in scenarios:
+        results[scenario.name] = await runScenario(
+            client, scenario, workload, counter, args.concurrency, args.requests, args.warmup, args.seed
+        )
+    return results
+
+
+def runAsgi(args, workload: Workload, scenarios=SCENARIOS) -> dict[str, ScenarioResult]:
+    sync_engine, async_engine = makeEngines(args.database_url, args.concurrency)
+    counter = SqlCounter(sync_engine, async_engine.sync_engine)
+    application = buildApp(sync_engine, async_engine)
+
+    async def main() -> dict[str, ScenarioResult]:
+        transport = httpx.ASGITransport(app=application)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                return await _runAll(client, scenarios, workload, counter, args)
+        finally:
+            await async_engine.dispose()
+
+    try:
+        return asyncio.run(main())
+    finally:
+        sync_engine.dispose()
+
+
+def _freePort() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def runHttp(args, workload: Workload, scenarios=SCENARIOS) -> dict[str, ScenarioResult]:
+    import uvicorn
+
+    sync_engine, async_engine = makeEngines(args.database_url, args.concurrency)
+    counter = SqlCounter(sync_engine, async_engine.sync_engine)
+    port = _freePort()
+    # lifespan="off": startup-bootstrap приложения смотрит в DATABASE_URL, а не в базу бенчмарка
+    config = uvicorn.Config(
+        buildApp(sync_engine, async_engine),
+        host="127.0.0.1",
+        port=port,
+        log_level="warning",
+        lifespan="off",
+    )
+    server = uvicorn.Server(config)
+
+    def serve() -> None:
+        # Свой цикл событий: async engine закрывается в том же цикле, где открывал соединения
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(server.serve())
+            loop.run_until_complete(async_engine.dispose())
+        finally:
+            loop.close()
+
+    thread = threading.Thread(target=serve, name="bench-uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn failed to start")
+        time.sleep(0.05)
+
+    async def main() -> dict[str, ScenarioResult]:
+        limits = httpx.Limits(
+            max_connections=args.concurrency, max_keepalive_connections=args.concurrency
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            return await _runAll(client, scenarios, workload, counter, args)
+
+    try:
+        return asyncio.run(main())
+    finally:
+        server.should_exit = True
+        thread.join()
+        sync_engine.dispose()
+
+
+TRANSPORTS = {"asgi": runAsgi, "http": runHttp}
+
+
+# --- baseline ---------------------------------------------------------------------------
+
+def resultKey(database_url: str, profile: str, transport: str, scenario: str) -> str:
+    return f"{make_url(database_url).get_backend_name()}/{profile}/{transport}/{scenario}"
+
+
+def compareBaseline(current: dict[str, dict], baseline: dict[str, dict], tolerance: float) -> list[str]:
+    """
+    Регрессии относительно baseline: p95 выше или RPS ниже больше чем на tolerance,
+    больше SQL на запрос (детерминировано, допуск 0.5) или появились ошибки.
+    Ключи без baseline не сравниваются.
+    """
+    problems = []
+    for key, cur in sorted(current.items()):
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if cur["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            problems.append(f"{key}: p95 {cur['p95_ms']} ms > baseline {base['p95_ms']} ms")
+        if cur["rps"] < base["rps"] * (1 - tolerance):
+            problems.append(f"{key}: rps {cur['rps']} < baseline {base['rps']}")
+        if cur["sql_per_request"] > base["sql_per_request"] + 0.5:
+            problems.append(
+                f"{key}: sql/request {cur['sql_per_request']} > baseline {base['sql_per_request']}"
+            )
+        if cur["errors"] > base["errors"]:
+            problems.append(f"{key}: {cur['errors']} errors (baseline {base['errors']})")
+    return problems
+
+
+def _printReport(results: dict[str, dict], baseline: dict[str, dict]) -> None:
+    print(f"{'scenario':<44}{'p50':>9}{'p95':>9}{'p99':>9}{'rps':>9}{'sql/req':>9}{'err':>6}{'Δp95':>8}")
+    for key, r in results.items():
+        base = baseline.get(key)
+        delta = f"{r['p95_ms'] / base['p95_ms'] - 1:+.0%}" if base and base["p95_ms"] else "-"
+        print(
+            f"{key:<44}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+            f"{r['rps']:>9.1f}{r['sql_per_request']:>9.2f}{r['errors']:>6}{delta:>8}"
+        )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database-url", default=None, help="по умолчанию SQLite-файл во временном каталоге")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reuse", action="store_true", help="не пересоздавать SQLite-базу по умолчанию")
+    parser.add_argument("--transport", choices=["asgi", "http", "both"], default="both")
+    parser.add_argument("--scenario", action="append", choices=[s.name for s in SCENARIOS])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="замеряемых запросов на сценарий")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    parser.add_argument("--output", type=Path, help="записать результаты в JSON")
+    args = parser.parse_args(argv)
+
+    if args.database_url is None:
+        # Свежая база на каждый прогон: сценарий create дописывает заказы
+        path = Path(tempfile.gettempdir()) / f"shipment-load-{args.profile}-{args.seed}.sqlite"
+        if not args.reuse:
+            for suffix in ("", "-wal", "-shm"):
+                Path(f"{path}{suffix}").unlink(missing_ok=True)
+        args.database_url = f"sqlite:///{path}"
+
+    sync_engine, _ = makeEngines(args.database_url, 1)
+    with sessionmaker(bind=sync_engine, autoflush=False)() as session:
+        started = time.perf_counter()
+        if seedDataset(session, args.profile, args.seed):
+            print(f"seeded profile {args.profile} in {time.perf_counter() - started:.1f}s")
+        workload = loadWorkload(session, args.seed)
+    sync_engine.dispose()
+
+    scenarios = [s for s in SCENARIOS if not args.scenario or s.name in args.scenario]
+    transports = ["asgi", "http"] if args.transport == "both" else [args.transport]
+    results: dict[str, dict] = {}
+    for transport in transports:
+        for name, result in TRANSPORTS[transport](args, workload, scenarios).items():
+            results[resultKey(args.database_url, args.profile, transport, name)] = asdict(result)
+
+    stored = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    print(
+        f"profile={args.profile} orders={workload.orders_by_status.get(None, 0)} "
+        f"concurrency={args.concurrency} requests={args.requests}"
+    )
+    _printReport(results, stored)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+    if args.save_baseline:
+        merged = {**stored, **results}
+        args.baseline.write_text(json.dumps(merged, indent=2, ensure_ascii=False, sort_keys=True) + "\n")
+        print(f"baseline saved to {args.baseline}")
+        return 0
+
+    problems = compareBaseline(results, stored, args.tolerance)
+    for problem in problems:
+        print(f"REGRESSION {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
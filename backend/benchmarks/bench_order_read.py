@@ -0,0 +1,142 @@
+"""
+Сравнение чтения страницы заказов: ORM-гидратация против проекции колонок.
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_order_read [--orders 20000] [--limit 100] [--iterations 200]
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, joinedload, sessionmaker
+
+from app.infra.db import Base
+from app.repositories.models import City, Order, PaymentStatus, User
+from app.repositories.order_repo import OrderRepository
+from app.schemas.order import OrderDto
+
+
+def seed(session: Session, orders: int) -> None:
+    users = [User(full_name=f"Клиент {i}", phone=f"+7900{i:07d}") for i in range(200)]
+    a, b = City(name="A"), City(name="B")
+    session.add_all([*users, a, b])
+    session.flush()
+    rows = []
+    for i in range(orders):
+        start = date(2024, 1, 1) + timedelta(days=i % 365)
+        rows.append({
+            "user_id": users[i % len(users)].id,
+            "car_brand_model": "Lada Vesta",
+            "from_city_id": a.id,
+            "to_city_id": b.id,
+            "start_date": start,
+            "distance_km": 700 + i % 3000,
+            "applied_price_per_km": 150,
+            "is_fixed_route": False,
+            "transport_price": 150 * (700 + i % 3000),
+            "insurance_price": 15 * (700 + i % 3000),
+            "duration_hours": 17,
+            "duration_days": 0,
+            "duration_hours_remainder": 17,
+            "eta_date": start,
+            "payment_status": PaymentStatus.PENDING,
+        })
+    session.bulk_insert_mappings(Order, rows)
+    session.commit()
+
+
+def ormPage(session: Session, limit: int) -> list[OrderDto]:
+    """Прежний путь: ORM-объекты с identity map, словарь и повторная валидация"""
+    items = (
+        session.query(Order)
+        .options(joinedload(Order.user))
+        .order_by(Order.start_date.desc(), Order.id.desc())
+        .limit(limit)
+        .all()
+    )
+    result = []
+    for order in items:
+        dto_dict = {
+            "id": order.id,
+            "created_at": order.created_at,
+            "updated_at": order.updated_at,
+            "user_id": order.user_id,
+            "user_full_name": order.user.full_name,
+            "user_phone": order.user.phone,
+            "car_brand_model": order.car_brand_model,
+            "from_city_id": order.from_city_id,
+            "to_city_id": order.to_city_id,
+            "start_date": order.start_date,
+            "distance_km": order.distance_km,
+            "applied_price_per_km": order.applied_price_per_km,
+            "is_fixed_route": order.is_fixed_route,
+            "transport_price": order.transport_price,
+            "insurance_price": order.insurance_price,
+            "duration_hours": order.duration_hours,
+            "duration_days": order.duration_days,
+            "duration_hours_remainder": order.duration_hours_remainder,
+            "eta_date": order.eta_date,
+            "payment_status": order.payment_status,
+        }
+        result.append(OrderDto(**dto_dict))
+    return result
+
+
+def projectionPage(session: Session, limit: int) -> list[OrderDto]:
+    rows = OrderRepository(session).query(limit=limit, totals="none").items
+    return [OrderDto.model_validate(row) for row in rows]
+
+
+def measure(session_factory, fn, limit: int, iterations: int) -> dict:
+    # Каждая итерация — как отдельный запрос: своя сессия
+    for _ in range(5):
+        with session_factory() as s:
+            fn(s, limit)
+
+    gc.collect()
+    started = time.process_time()
+    for _ in range(iterations):
+        with session_factory() as s:
+            fn(s, limit)
+    cpu_ms = (time.process_time() - started) * 1000 / iterations
+
+    # Пик памяти, выделенной за один запрос
+    tracemalloc.start()
+    with session_factory() as s:
+        fn(s, limit)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"cpu_ms": cpu_ms, "peak_kb": peak / 1024}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=20_000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite+pysqlite:///:memory:", future=True)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine, autoflush=False, future=True)
+    with factory() as s:
+        seed(s, args.orders)
+
+    results = {
+        "orm": measure(factory, ormPage, args.limit, args.iterations),
+        "projection": measure(factory, projectionPage, args.limit, args.iterations),
+    }
+    print(f"limit={args.limit}, orders={args.orders}, iterations={args.iterations}")
+    print(f"{'path':<12}{'cpu ms/req':>12}{'peak KiB':>12}")
+    for name, r in results.items():
+        print(f"{name:<12}{r['cpu_ms']:>12.2f}{r['peak_kb']:>12.1f}")
+    orm, proj = results["orm"], results["projection"]
+    print(f"cpu saved: {orm['cpu_ms'] - proj['cpu_ms']:.2f} ms/req ({1 - proj['cpu_ms'] / orm['cpu_ms']:.0%})")
+    print(f"peak memory saved: {orm['peak_kb'] - proj['peak_kb']:.1f} KiB/req")
+
+
+if __name__ == "__main__":
+    main()
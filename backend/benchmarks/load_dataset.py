@@ -0,0 +1,218 @@
+"""
+Детерминированный набор данных для нагрузочного бенчмарка API (benchmarks.bench_api_load).
+
+Один и тот же профиль и seed дают одинаковые города, расстояния, клиентов и заказы
+в SQLite и в PostgreSQL. Заказы вставляются пачками через Core, агрегаты
+order_daily_stats пересчитываются в конце одним rebuild().
+"""
+import math
+import random
+import zlib
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session, aliased
+
+from app.infra.seed import runBootstrap
+from app.repositories.models import (
+    City,
+    CityDistance,
+    Order,
+    PaymentStatus,
+    SeedVersion,
+    Tariff,
+    User,
+    canonicalPair,
+)
+from app.repositories.order_stats_repo import OrderStatsRepository
+
+
+# Маркер в seed_versions: повторный запуск на той же базе не дублирует данные
+DATASET_MARKER = "load-bench"
+ORDERS_FROM = date(2024, 1, 1)
+ORDERS_DAYS = 730
+_BATCH = 20_000
+_STATUS_WEIGHTS = ((PaymentStatus.PENDING, 50), (PaymentStatus.PAID, 45), (PaymentStatus.MANUAL, 5))
+_CARS = ("Lada Vesta", "Kia Rio", "Hyundai Solaris", "Toyota Camry", "Skoda Octavia", "VW Polo")
+
+
+@dataclass(frozen=True)
+class DatasetSize:
+    cities: int
+    neighbours: int  # случайных соседей с известным расстоянием на город
+    users: int
+    orders: int
+
+
+PROFILES = {
+    # Для теста самого бенчмарка
+    "smoke": DatasetSize(cities=30, neighbours=5, users=50, orders=2_000),
+    # Быстрый прогон на SQLite, по нему записан baseline
+    "small": DatasetSize(cities=300, neighbours=12, users=2_000, orders=100_000),
+    # Объем продакшена: тысячи городов, миллионы заказов (рассчитан на PostgreSQL)
+    "full": DatasetSize(cities=2_000, neighbours=20, users=50_000, orders=2_000_000),
+}
+
+
+@dataclass
+class Workload:
+    """Что бенчмарк знает о наборе данных, чтобы строить реалистичные запросы"""
+
+    pairs: list[tuple[int, int, str, str]]  # (from_id, to_id, from_name, to_name) с известным расстоянием
+    user_ids: list[int]
+    city_ids: list[int]
+    orders_by_status: dict[str | None, int] = field(default_factory=dict)  # None — всего
+
+
+def datasetVersion(profile: str, seed: int) -> int:
+    return zlib.crc32(f"{profile}:{seed}".encode()) & 0x7FFFFFFF
+
+
+def _haversineKm(a: tuple[float, float], b: tuple[float, float]) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371 * math.asin(math.sqrt(h))
+
+
+def _insertBatches(session: Session, model, rows: list[dict]) -> None:
+    for start in range(0, len(rows), _BATCH):
+        session.execute(insert(model), rows[start : start + _BATCH])
+
+
+def seedDataset(session: Session, profile: str = "small", seed: int = 42) -> bool:
+    """
+    Заполняет базу набором профиля; False — набор уже загружен ранее.
+    Коммитит сам: заказы пишутся несколькими транзакциями.
+    """
+    size = PROFILES[profile]
+    version = datasetVersion(profile, seed)
+    runBootstrap(session)
+    session.commit()
+    marker = session.get(SeedVersion, DATASET_MARKER)
+    if marker is not None:
+        if marker.version != version:
+            raise ValueError(f"Database already holds another load dataset (version {marker.version})")
+        return False
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    cities = [
+        {
+            "name": f"Город {i:05d}",
+            "is_active": True,
+            "latitude": round(rng.uniform(43.0, 62.0), 4),
+            "longitude": round(rng.uniform(28.0, 95.0), 4),
+            "created_at": now,
+            "updated_at": now,
+        }
+        for i in range(size.cities)
+    ]
+    _insertBatches(session, City, cities)
+    generated = select(City.id, City.latitude, City.longitude).where(City.name.like("Город %"))
+    coords = {row.id: (row.latitude, row.longitude) for row in session.execute(generated)}
+    city_ids = sorted(coords)
+
+    # Дорожное расстояние ≈ 1.25 × по прямой; пары хранятся под каноническим ключом
+    known = {(a, b) for a, b in session.execute(select(CityDistance.from_city_id, CityDistance.to_city_id))}
+    distances: dict[tuple[int, int], int] = {}
+    for a in city_ids:
+        for b in rng.sample(city_ids, size.neighbours + 1):
+            key = canonicalPair(a, b)
+            if a != b and key not in known and key not in distances:
+                distances[key] = max(1, int(_haversineKm(coords[a], coords[b]) * 1.25))
+    _insertBatches(
+        session,
+        CityDistance,
+        [
+            {
+                "from_city_id": a,
+                "to_city_id": b,
+                "distance_km": km,
+                "is_manual": False,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for (a, b), km in distances.items()
+        ],
+    )
+
+    _insertBatches(
+        session,
+        User,
+        [
+            {"full_name": f"Клиент {i}", "phone": f"+79{i:09d}", "created_at": now, "updated_at": now}
+            for i in range(size.users)
+        ],
+    )
+    first_user, last_user = session.execute(select(func.min(User.id), func.max(User.id))).one()
+    tariffs = {t.month: t for t in session.execute(select(Tariff)).scalars()}
+    session.commit()
+
+    pairs = list(distances.items())
+    statuses = [s for s, _ in _STATUS_WEIGHTS]
+    weights = [w for _, w in _STATUS_WEIGHTS]
+    for start in range(0, size.orders, _BATCH):
+        rows = []
+        for _ in range(min(_BATCH, size.orders - start)):
+            (a, b), km = pairs[rng.randrange(len(pairs))]
+            if rng.random() < 0.5:
+                a, b = b, a
+            start_date = ORDERS_FROM + timedelta(days=rng.randrange(ORDERS_DAYS))
+            tariff = tariffs[start_date.month]
+            rate = tariff.price_per_km_le_1000 if km <= 1000 else tariff.price_per_km_gt_1000
+            transport = int(rate * km)
+            hours = int(round(km * 24 / 1000))
+            rows.append({
+                "user_id": rng.randint(first_user, last_user),
+                "car_brand_model": rng.choice(_CARS),
+                "from_city_id": a,
+                "to_city_id": b,
+                "start_date": start_date,
+                "distance_km": km,
+                "applied_price_per_km": rate,
+                "is_fixed_route": False,
+                "transport_price": transport,
+                "insurance_price": int(round(transport * 0.10)),
+                "duration_hours": hours,
+                "duration_days": hours // 24,
+                "duration_hours_remainder": hours % 24,
+                "eta_date": start_date + timedelta(hours=hours),
+                "payment_status": rng.choices(statuses, weights)[0],
+                "created_at": now,
+                "updated_at": now,
+            })
+        session.execute(insert(Order), rows)
+        session.commit()
+
+    OrderStatsRepository(session).rebuild()
+    session.add(SeedVersion(name=DATASET_MARKER, version=version))
+    session.commit()
+    return True
+
+
+def loadWorkload(session: Session, seed: int = 42, max_pairs: int = 2_000) -> Workload:
+    """Пары городов, клиенты и объемы заказов для генерации запросов"""
+    src, dst = aliased(City), aliased(City)
+    rows = session.execute(
+        select(CityDistance.from_city_id, CityDistance.to_city_id, src.name, dst.name)
+        .join(src, src.id == CityDistance.from_city_id)
+        .join(dst, dst.id == CityDistance.to_city_id)
+        .where(src.is_active, dst.is_active)
+        .order_by(CityDistance.id)
+    ).all()
+    rng = random.Random(seed)
+    rows = rng.sample(rows, min(len(rows), max_pairs))
+    pairs = [tuple(r) for r in rows] + [(r[1], r[0], r[3], r[2]) for r in rows]
+
+    # Объемы по статусам — из агрегатов, без count(*) по orders
+    by_status = OrderStatsRepository(session).query(["payment_status"])
+    counts: dict = {row.payment_status: row.orders_count for row in by_status}
+    counts[None] = sum(counts.values())
+    return Workload(
+        pairs=pairs,
+        user_ids=list(session.execute(select(User.id).order_by(User.id)).scalars()),
+        city_ids=list(session.execute(select(City.id).order_by(City.id)).scalars()),
+        orders_by_status=counts,
+    )
@@ -31,10 +31,12 @@ type Order = {
 
 type PaginatedResponse = {
   items: Order[]
-  total: number
+  total: number | null
   page: number
   limit: number
-  pages: number
+  pages: number | null
+  has_more: boolean
+  total_estimated: boolean
 }
 
 export default function AdminOrdersPage() {
@@ -69,6 +71,8 @@ export default function AdminOrdersPage() {
     if (sortBy === 'cost') p.set('order_by_cost', 'true')
     p.set('page', page.toString())
     p.set('limit', '20')
+    // Точный COUNT на больших выборках дороже самой страницы — хватает оценки
+    p.set('totals', 'estimated')
     return p
   }, [startFrom, startTo, fromCityId, toCityId, paymentStatus, sortBy, page])
 
@@ -332,10 +336,11 @@ export default function AdminOrdersPage() {
             </div>
 
             {/* Pagination */}
-            {data && data.pages > 1 && (
+            {data && (page > 1 || data.has_more) && (
               <div className="flex items-center justify-between mt-6">
                 <div className="text-white/60 text-sm">
-                  Заказы {(page - 1) * 20 + 1}–{Math.min(page * 20, data.total)} из {data.total}
+                  Заказы {(page - 1) * 20 + 1}–{(page - 1) * 20 + data.items.length}
+                  {data.total !== null && <> из {data.total_estimated ? '≈' : ''}{data.total}</>}
                 </div>
                 
                 <div className="flex items-center gap-2">
@@ -351,12 +356,12 @@ export default function AdminOrdersPage() {
                   </Button>
                   
                   <div className="text-white/80 text-sm">
-                    Страница {page} из {data.pages}
+                    Страница {page}{data.pages !== null && !data.total_estimated && <> из {data.pages}</>}
                   </div>
                   
                   <Button
-                    onClick={() => setPage(p => Math.min(data.pages, p + 1))}
-                    disabled={page === data.pages}
+                    onClick={() => setPage(p => p + 1)}
+                    disabled={!data.has_more}
                     variant="outline"
                     size="sm"
                     className="bg-white/10 border-white/20 text-white hover:bg-white/20"
@@ -1,5 +1,4 @@
 export const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000'
-const ADMIN_AUTH = 'Basic ' + btoa('admin:admin')
 
 const getAuthHeaders = () => {
   const token = localStorage.getItem('admin_token')
@@ -13,7 +12,10 @@ async function request(path: string, options: RequestInit = {}) {
   if (!(mergedHeaders as any)['Content-Type']) {
     ;(mergedHeaders as any)['Content-Type'] = 'application/json'
   }
+  // Справочники кешируются браузером (Cache-Control + ETag); админка всегда
+  // ревалидирует их, чтобы сразу видеть свои изменения
   const res = await fetch(`${API_URL}${path}`, {
+    cache: 'no-cache',
     ...options,
     headers: mergedHeaders,
   })
@@ -37,16 +39,16 @@ export const api = {
     }),
   listCities: () => request('/api/v1/cities'),
   createCity: (body: { name: string; is_active: boolean; latitude: number; longitude: number }) =>
-    request('/api/v1/cities', { method: 'POST', body: JSON.stringify(body), headers: { Authorization: ADMIN_AUTH } }),
+    request('/api/v1/cities', { method: 'POST', body: JSON.stringify(body), headers: getAuthHeaders() }),
   updateCity: (cityId: number, body: { name?: string; is_active?: boolean; latitude?: number; longitude?: number }) =>
-    request(`/api/v1/cities/${cityId}`, { method: 'PUT', body: JSON.stringify(body), headers: { Authorization: ADMIN_AUTH } }),
+    request(`/api/v1/cities/${cityId}`, { method: 'PUT', body: JSON.stringify(body), headers: getAuthHeaders() }),
   deleteCity: (cityId: number) =>
-    request(`/api/v1/cities/${cityId}`, { method: 'DELETE', headers: { Authorization: ADMIN_AUTH } }),
+    request(`/api/v1/cities/${cityId}`, { method: 'DELETE', headers: getAuthHeaders() }),
   listTariffs: () => request('/api/v1/tariffs'),
   createTariff: (body: { month: number; price_per_km_le_1000: number; price_per_km_gt_1000: number }) =>
-    request('/api/v1/tariffs', { method: 'POST', body: JSON.stringify(body), headers: { Authorization: ADMIN_AUTH } }),
+    request('/api/v1/tariffs', { method: 'POST', body: JSON.stringify(body), headers: getAuthHeaders() }),
   updateTariff: (tariffId: number, body: { month?: number; price_per_km_le_1000?: number; price_per_km_gt_1000?: number }) =>
-    request(`/api/v1/tariffs/${tariffId}`, { method: 'PUT', body: JSON.stringify(body), headers: { Authorization: ADMIN_AUTH } }),
+    request(`/api/v1/tariffs/${tariffId}`, { method: 'PUT', body: JSON.stringify(body), headers: getAuthHeaders() }),
   listAllOrders: (params: URLSearchParams) =>
     request(`/api/v1/orders?${params.toString()}`),
   updatePaymentStatus: (orderId: number, status: string) =>
@@ -55,6 +57,6 @@ export const api = {
       headers: getAuthHeaders() 
     }),
   deleteOrder: (orderId: number) =>
-    request(`/api/v1/orders/${orderId}`, { method: 'DELETE', headers: { Authorization: ADMIN_AUTH } }),
+    request(`/api/v1/orders/${orderId}`, { method: 'DELETE', headers: getAuthHeaders() }),
 }
 